@@ -15,7 +15,7 @@ execute_subagent_command() {
     local args="$*"
     
     # Record start time
-    local start_time=$(date +%s)
+    local start_ms=$(log_now_ms)
     
     # Create command-specific log file
     local command_log=$(create_command_log "$command_name")
@@ -58,12 +58,12 @@ execute_subagent_command() {
     exit_code=$?
     
     # Calculate duration
-    local end_time=$(date +%s)
-    local duration=$((end_time - start_time))
+    local latency_ms=$(($(log_now_ms) - start_ms))
+    local duration=$((latency_ms / 1000))
     
     # Log completion
     if [[ $exit_code -eq 0 ]]; then
-        log_command_complete "$command_name" "$duration" "SUCCESS"
+        log_command_complete "$command_name" "$duration" "SUCCESS" "$latency_ms"
         echo -e "${GREEN}[SUCCESS]${NC} Command completed successfully"
     else
         log_error "$command_name" "Command failed with exit code $exit_code"
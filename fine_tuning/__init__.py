@@ -4,8 +4,9 @@ Fine-Tuning Module
 Provides tools for fine-tuning LLMs on project-specific codebases using PEFT/LoRA.
 """
 
-from .engine import FineT uneEngine
+from .engine import FineTuneEngine
 from .dataset_generator import DatasetGenerator
 from .evaluator import ModelEvaluator
+from .sweep import SweepRunner
 
-__all__ = ['FineTuneEngine', 'DatasetGenerator', 'ModelEvaluator']
+__all__ = ['FineTuneEngine', 'DatasetGenerator', 'ModelEvaluator', 'SweepRunner']
@@ -0,0 +1,439 @@
+"""
+Dataset Generator
+
+Extracts instruction/response training examples from a codebase.
+Python files are parsed with the ast module; JavaScript/TypeScript files
+use lightweight brace matching around function and class declarations.
+
+Extraction can fan out over a process pool, and a manifest of file content
+hashes lets reruns reuse cached examples for files that have not changed.
+"""
+
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+from .stages import hash_file
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ['.py', '.js', '.jsx', '.ts', '.tsx']
+DEFAULT_EXCLUDE_DIRS = [
+    '.git', 'node_modules', '__pycache__', '.venv', 'venv',
+    'dist', 'build', '.tox', '.mypy_cache'
+]
+
+_JS_DECLARATION = re.compile(
+    r'^[ \t]*(?:export\s+)?(?:default\s+)?(?:async\s+)?'
+    r'(?:function\s*\*?\s*(?P<func>[A-Za-z_$][\w$]*)|class\s+(?P<cls>[A-Za-z_$][\w$]*))',
+    re.MULTILINE
+)
+
+# Bump when extraction output changes so cached examples are invalidated
+GENERATOR_VERSION = 1
+
+MANIFEST_NAME = 'manifest.json'
+
+LANGUAGE_BY_EXTENSION = {
+    '.py': 'python',
+    '.js': 'javascript',
+    '.jsx': 'javascript',
+    '.ts': 'typescript',
+    '.tsx': 'typescript',
+}
+
+
+def format_prompt(instruction: str, input_text: str = '', output: Optional[str] = None) -> str:
+    """
+    Render an example in the instruction/input/output training format.
+
+    Args:
+        instruction: Task instruction
+        input_text: Optional input context
+        output: Expected output; omit to build a generation prompt
+
+    Returns:
+        str: Formatted text (ending at '### Output:' when output is None)
+    """
+    text = f"### Instruction:\n{instruction}\n\n"
+    if input_text:
+        text += f"### Input:\n{input_text}\n\n"
+    text += "### Output:\n"
+    if output is not None:
+        text += output
+    return text
+
+
+class DatasetGenerator:
+    """
+    Generates fine-tuning examples from source files.
+
+    Examples are produced lazily so callers can stream them to disk
+    without holding the whole dataset in memory.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize dataset generator.
+
+        Args:
+            config: fine_tuning.dataset_generation section of llm_config.yaml
+        """
+        self.config = config
+        self.extensions = set(config.get('file_extensions', DEFAULT_EXTENSIONS))
+        self.exclude_dirs = set(config.get('exclude_dirs', DEFAULT_EXCLUDE_DIRS))
+        self.min_lines = config.get('min_lines', 3)
+        self.max_lines = config.get('max_lines', 200)
+        self.max_file_bytes = config.get('max_file_bytes', 1024 * 1024)
+
+    def iter_source_files(self, codebase_path: str) -> Iterator[Path]:
+        """
+        Walk the codebase and yield eligible source files in stable order.
+
+        Args:
+            codebase_path: Path to codebase root directory
+
+        Yields:
+            Path: Source file paths
+        """
+        for dirpath, dirnames, filenames in os.walk(codebase_path):
+            dirnames[:] = sorted(d for d in dirnames if d not in self.exclude_dirs)
+            for filename in sorted(filenames):
+                path = Path(dirpath) / filename
+                if path.suffix not in self.extensions:
+                    continue
+                try:
+                    if path.stat().st_size > self.max_file_bytes:
+                        continue
+                except OSError:
+                    continue
+                yield path
+
+    def extract_examples(self, file_path: Path, codebase_path: str) -> List[Dict[str, str]]:
+        """
+        Extract training examples from a single source file.
+
+        Args:
+            file_path: Source file to parse
+            codebase_path: Codebase root (used for relative paths in prompts)
+
+        Returns:
+            List[Dict]: Examples with 'instruction', 'input' and 'output' keys
+        """
+        try:
+            source = Path(file_path).read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError) as e:
+            logger.debug(f"Skipping unreadable file {file_path}: {e}")
+            return []
+
+        relative_path = os.path.relpath(file_path, codebase_path)
+        language = LANGUAGE_BY_EXTENSION.get(Path(file_path).suffix, 'text')
+
+        if language == 'python':
+            snippets = self._extract_python(source)
+        else:
+            snippets = self._extract_braced(source)
+
+        examples = []
+        for kind, name, docstring, code in snippets:
+            line_count = code.count('\n') + 1
+            if line_count < self.min_lines or line_count > self.max_lines:
+                continue
+
+            instruction = f"Implement the {language} {kind} `{name}` from `{relative_path}`."
+            if docstring:
+                instruction += f"\n\n{docstring.strip()}"
+
+            examples.append({
+                'instruction': instruction,
+                'input': '',
+                'output': code,
+            })
+
+        return examples
+
+    def iter_from_codebase(
+        self,
+        codebase_path: str,
+        cache_dir: Optional[Path] = None,
+        num_workers: int = 1
+    ) -> Iterator[Dict[str, str]]:
+        """
+        Lazily generate examples for every source file in the codebase.
+
+        Args:
+            codebase_path: Path to codebase root directory
+            cache_dir: Directory holding the file manifest and cached examples.
+                When set, only added or changed files are re-extracted.
+            num_workers: Number of extractor processes (1 = in-process)
+
+        Yields:
+            Dict: Training examples, in stable file order
+
+        Note:
+            Scan statistics are available in self.last_scan_stats once the
+            iterator is exhausted (or closed).
+        """
+        if cache_dir is None:
+            self.last_scan_stats = {'files': 0, 'extracted': 0, 'reused': 0, 'removed': 0}
+            for file_path, examples in self._iter_extracted(
+                self.iter_source_files(codebase_path), codebase_path, num_workers
+            ):
+                self.last_scan_stats['files'] += 1
+                self.last_scan_stats['extracted'] += 1
+                yield from examples
+            return
+
+        yield from self._iter_incremental(codebase_path, Path(cache_dir), num_workers)
+
+    def generate_from_codebase(self, codebase_path: str) -> List[Dict[str, str]]:
+        """
+        Generate all examples for a codebase as a list.
+
+        Args:
+            codebase_path: Path to codebase root directory
+
+        Returns:
+            List[Dict]: Training examples
+
+        Note:
+            Prefer iter_from_codebase() for large codebases.
+        """
+        return list(self.iter_from_codebase(codebase_path))
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the settings that affect extraction output.
+
+        Returns:
+            str: Hex digest used to invalidate cached examples
+        """
+        settings = {
+            'version': GENERATOR_VERSION,
+            'min_lines': self.min_lines,
+            'max_lines': self.max_lines,
+        }
+        return hashlib.sha256(json.dumps(settings, sort_keys=True).encode()).hexdigest()
+
+    def _iter_extracted(
+        self,
+        file_paths: Iterator[Path],
+        codebase_path: str,
+        num_workers: int
+    ) -> Iterator[Tuple[Path, List[Dict[str, str]]]]:
+        """
+        Extract examples for each file, in order, optionally across processes.
+
+        Only a bounded window of files is in flight at once so results do not
+        pile up in memory ahead of the consumer.
+        """
+        if num_workers <= 1:
+            for file_path in file_paths:
+                yield file_path, self.extract_examples(file_path, codebase_path)
+            return
+
+        window = num_workers * 4
+        with ProcessPoolExecutor(
+            max_workers=num_workers,
+            initializer=_init_worker,
+            initargs=(self.config,)
+        ) as pool:
+            pending = deque()
+            for file_path in file_paths:
+                pending.append((file_path, pool.submit(_extract_in_worker, str(file_path), codebase_path)))
+                if len(pending) >= window:
+                    done_path, future = pending.popleft()
+                    yield done_path, future.result()
+
+            while pending:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+
+    def _iter_incremental(
+        self,
+        codebase_path: str,
+        cache_dir: Path,
+        num_workers: int
+    ) -> Iterator[Dict[str, str]]:
+        """Yield examples, re-extracting only files whose content changed."""
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        examples_dir = cache_dir / 'examples'
+        examples_dir.mkdir(exist_ok=True)
+
+        fingerprint = self.fingerprint()
+        previous = _load_manifest(cache_dir)
+        if previous.get('fingerprint') != fingerprint:
+            previous = {'files': {}}
+            _prune_examples(examples_dir, set())
+
+        old_files = previous['files']
+        new_files: Dict[str, Dict[str, Any]] = {}
+        stats = {'files': 0, 'extracted': 0, 'reused': 0, 'removed': 0}
+        self.last_scan_stats = stats
+
+        # Resolve each file to a content hash (stat fast path), in walk order
+        plan = []
+        for file_path in self.iter_source_files(codebase_path):
+            relative_path = os.path.relpath(file_path, codebase_path)
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+
+            entry = old_files.get(relative_path)
+            if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                content_hash = entry['hash']
+            else:
+                # Examples embed the path, so it is part of the hash
+                content_hash = hash_file(file_path, relative_path)
+
+            cached = (examples_dir / f"{content_hash}.json").exists()
+            plan.append((file_path, relative_path, stat, content_hash, cached))
+
+        to_extract = (item[0] for item in plan if not item[4])
+        extracted = self._iter_extracted(to_extract, codebase_path, num_workers)
+
+        completed = False
+        try:
+            for file_path, relative_path, stat, content_hash, cached in plan:
+                cache_path = examples_dir / f"{content_hash}.json"
+                if cached:
+                    with open(cache_path, 'r', encoding='utf-8') as f:
+                        examples = json.load(f)
+                    stats['reused'] += 1
+                else:
+                    _, examples = next(extracted)
+                    tmp_path = cache_path.with_suffix('.tmp')
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(examples, f, ensure_ascii=False)
+                    os.replace(tmp_path, cache_path)
+                    stats['extracted'] += 1
+
+                new_files[relative_path] = {
+                    'hash': content_hash,
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                }
+                stats['files'] += 1
+                yield from examples
+
+            completed = True
+        finally:
+            extracted.close()
+            if completed:
+                stats['removed'] = len(set(old_files) - set(new_files))
+                files = new_files
+            else:
+                # Partial scan (e.g. max_examples reached): keep unseen entries
+                files = {**old_files, **new_files}
+
+            _save_manifest(cache_dir, fingerprint, files)
+            if completed:
+                _prune_examples(examples_dir, {entry['hash'] for entry in files.values()})
+
+            logger.info(
+                f"Scanned {stats['files']} files: {stats['extracted']} extracted, "
+                f"{stats['reused']} reused from cache, {stats['removed']} removed"
+            )
+
+    def _extract_python(self, source: str) -> List[tuple]:
+        """Extract functions and classes from Python source."""
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return []
+
+        snippets = []
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                kind = 'function'
+            elif isinstance(node, ast.ClassDef):
+                kind = 'class'
+            else:
+                continue
+
+            code = ast.get_source_segment(source, node)
+            if code:
+                snippets.append((kind, node.name, ast.get_docstring(node), code))
+
+        return snippets
+
+    def _extract_braced(self, source: str) -> List[tuple]:
+        """Extract function and class declarations from brace-delimited source."""
+        snippets = []
+        for match in _JS_DECLARATION.finditer(source):
+            start = source.find('{', match.end())
+            if start == -1:
+                continue
+
+            depth = 0
+            end = None
+            for index in range(start, len(source)):
+                char = source[index]
+                if char == '{':
+                    depth += 1
+                elif char == '}':
+                    depth -= 1
+                    if depth == 0:
+                        end = index + 1
+                        break
+
+            if end is None:
+                continue
+
+            kind = 'class' if match.group('cls') else 'function'
+            name = match.group('cls') or match.group('func')
+            snippets.append((kind, name, None, source[match.start():end].strip('\n')))
+
+        return snippets
+
+
+_worker_generator: Optional[DatasetGenerator] = None
+
+
+def _init_worker(config: Dict[str, Any]) -> None:
+    """Build one DatasetGenerator per worker process."""
+    global _worker_generator
+    _worker_generator = DatasetGenerator(config)
+
+
+def _extract_in_worker(file_path: str, codebase_path: str) -> List[Dict[str, str]]:
+    """Process-pool entry point for per-file extraction."""
+    return _worker_generator.extract_examples(Path(file_path), codebase_path)
+
+
+def _load_manifest(cache_dir: Path) -> Dict[str, Any]:
+    """Load the file manifest, tolerating a missing or corrupt file."""
+    manifest_path = cache_dir / MANIFEST_NAME
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {'files': {}}
+
+    if not isinstance(manifest.get('files'), dict):
+        return {'files': {}}
+    return manifest
+
+
+def _save_manifest(cache_dir: Path, fingerprint: str, files: Dict[str, Any]) -> None:
+    """Atomically write the file manifest."""
+    manifest_path = cache_dir / MANIFEST_NAME
+    tmp_path = manifest_path.with_suffix('.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'fingerprint': fingerprint, 'files': files}, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def _prune_examples(examples_dir: Path, live_hashes: set) -> None:
+    """Delete cached example files no longer referenced by the manifest."""
+    for cache_file in examples_dir.glob('*.json'):
+        if cache_file.stem not in live_hashes:
+            cache_file.unlink()
@@ -0,0 +1,210 @@
+"""
+Sharded JSONL Dataset Writer
+
+Streams training examples to disk as fixed-size JSONL shards, optionally
+compressed, and assigns each example to train/val deterministically from
+a hash of its content so the split never requires buffering the dataset.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import logging
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SPLITS = ('train', 'val')
+
+COMPRESSION_SUFFIXES = {
+    None: '.jsonl',
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+
+
+def example_key(example: Dict[str, Any]) -> str:
+    """
+    Stable content key for an example.
+
+    Args:
+        example: Training example dictionary
+
+    Returns:
+        str: Hex digest of the canonical JSON encoding
+    """
+    canonical = json.dumps(example, sort_keys=True, ensure_ascii=False)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=16).hexdigest()
+
+
+def assign_split(example: Dict[str, Any], train_split: float, seed: str = '') -> str:
+    """
+    Deterministically assign an example to 'train' or 'val'.
+
+    Args:
+        example: Training example dictionary
+        train_split: Fraction of examples that should land in train
+        seed: Optional salt to produce a different (but stable) split
+
+    Returns:
+        str: 'train' or 'val'
+    """
+    digest = hashlib.blake2b(
+        (seed + example_key(example)).encode('utf-8'),
+        digest_size=8
+    ).digest()
+    bucket = int.from_bytes(digest, 'big') / 2 ** 64
+    return 'train' if bucket < train_split else 'val'
+
+
+def list_shards(dataset_dir: Path, split: str) -> List[str]:
+    """
+    List shard files for a split in write order.
+
+    Args:
+        dataset_dir: Dataset root directory
+        split: 'train' or 'val'
+
+    Returns:
+        List[str]: Shard paths (empty if the split has not been generated)
+    """
+    split_dir = Path(dataset_dir) / split
+    if not split_dir.is_dir():
+        return []
+    return sorted(
+        str(path) for path in split_dir.iterdir()
+        if any(path.name.endswith(suffix) for suffix in COMPRESSION_SUFFIXES.values())
+    )
+
+
+def read_shards(paths: List[str]) -> Iterator[Dict[str, Any]]:
+    """
+    Stream examples back out of JSONL shards, in order.
+
+    Args:
+        paths: Shard paths (plain, .gz or .zst)
+
+    Yields:
+        Dict: Training examples
+    """
+    for path in paths:
+        if path.endswith('.gz'):
+            handle = gzip.open(path, 'rt', encoding='utf-8')
+        elif path.endswith('.zst'):
+            import zstandard
+
+            raw = open(path, 'rb')
+            handle = io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(raw), encoding='utf-8')
+        else:
+            handle = open(path, 'r', encoding='utf-8')
+
+        with handle:
+            for line in handle:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def _open_shard(path: Path, compression: Optional[str]):
+    """Open a shard for text writing with the requested compression."""
+    if compression is None:
+        return open(path, 'w', encoding='utf-8')
+
+    if compression == 'gzip':
+        return gzip.open(path, 'wt', encoding='utf-8', compresslevel=6)
+
+    if compression == 'zstd':
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires the 'zstandard' package: pip install zstandard"
+            ) from e
+        raw = open(path, 'wb')
+        writer = zstandard.ZstdCompressor(level=3).stream_writer(raw, closefd=True)
+        return io.TextIOWrapper(writer, encoding='utf-8')
+
+    raise ValueError(f"Unknown compression '{compression}'. Must be one of gzip, zstd or None")
+
+
+class ShardedJSONLWriter:
+    """
+    Writes examples for one split into rolling JSONL shards.
+
+    Shards are named '<split>-00000.jsonl[.gz|.zst]' under dataset_dir/<split>/.
+    Existing shards for the split are removed when the writer is opened.
+    """
+
+    def __init__(
+        self,
+        dataset_dir: Path,
+        split: str,
+        shard_size: int = 10000,
+        compression: Optional[str] = None
+    ):
+        """
+        Initialize the writer.
+
+        Args:
+            dataset_dir: Dataset root directory
+            split: Split name ('train' or 'val')
+            shard_size: Maximum number of examples per shard
+            compression: None, 'gzip' or 'zstd'
+        """
+        if compression not in COMPRESSION_SUFFIXES:
+            raise ValueError(
+                f"Unknown compression '{compression}'. Must be one of gzip, zstd or None"
+            )
+        if shard_size <= 0:
+            raise ValueError("shard_size must be positive")
+
+        self.split_dir = Path(dataset_dir) / split
+        self.split = split
+        self.shard_size = shard_size
+        self.compression = compression
+
+        self.count = 0
+        self.shards: List[str] = []
+        self._handle = None
+        self._in_shard = 0
+
+    def __enter__(self) -> 'ShardedJSONLWriter':
+        self.split_dir.mkdir(parents=True, exist_ok=True)
+        for stale in list_shards(self.split_dir.parent, self.split):
+            Path(stale).unlink()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def write(self, example: Dict[str, Any]) -> None:
+        """
+        Append an example, rolling over to a new shard when full.
+
+        Args:
+            example: Training example dictionary
+        """
+        if self._handle is None or self._in_shard >= self.shard_size:
+            self._roll()
+
+        self._handle.write(json.dumps(example, ensure_ascii=False))
+        self._handle.write('\n')
+        self._in_shard += 1
+        self.count += 1
+
+    def close(self) -> None:
+        """Flush and close the current shard."""
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _roll(self) -> None:
+        """Close the current shard and open the next one."""
+        self.close()
+        suffix = COMPRESSION_SUFFIXES[self.compression]
+        path = self.split_dir / f"{self.split}-{len(self.shards):05d}{suffix}"
+        self._handle = _open_shard(path, self.compression)
+        self._in_shard = 0
+        self.shards.append(str(path))
+        logger.debug(f"Opened shard {path}")
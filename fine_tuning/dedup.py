@@ -0,0 +1,165 @@
+"""
+Near-Duplicate Removal
+
+MinHash signatures over token shingles with LSH banding, used to drop
+near-identical training examples (boilerplate, vendored copies, generated
+files) while streaming, before the train/val split.
+"""
+
+import hashlib
+import logging
+import re
+from typing import Dict, Any, Iterator, List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+def choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Pick an LSH (bands, rows) layout whose similarity threshold is closest
+    to the requested Jaccard threshold.
+
+    Args:
+        num_perm: Number of MinHash permutations
+        threshold: Target Jaccard similarity
+
+    Returns:
+        tuple: (bands, rows) with bands * rows <= num_perm
+    """
+    best = (1, num_perm)
+    best_error = float('inf')
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        error = abs((1.0 / bands) ** (1.0 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashDeduplicator:
+    """
+    Streaming near-duplicate filter.
+
+    Only LSH band hashes of kept examples are indexed (never the examples or
+    full signatures), so memory grows by a fixed number of integers per
+    kept example and is capped by max_index_size.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize deduplicator.
+
+        Args:
+            config: fine_tuning.dataset_generation.dedup section of llm_config.yaml
+        """
+        self.threshold = config.get('threshold', 0.8)
+        self.num_perm = config.get('num_perm', 128)
+        self.shingle_size = config.get('shingle_size', 5)
+        self.max_index_size = config.get('max_index_size', 2_000_000)
+        self.fields: List[str] = config.get('fields', ['input', 'output'])
+        self.bands, self.rows = choose_bands(self.num_perm, self.threshold)
+
+        rng = np.random.RandomState(config.get('seed', 1))
+        self._a = rng.randint(1, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+        self._b = rng.randint(0, int(_MERSENNE_PRIME), size=self.num_perm, dtype=np.uint64)
+
+        self._index: set = set()
+        self.indexed = 0
+        self.seen = 0
+        self.removed = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        """
+        Compute the MinHash signature of a text's token shingles.
+
+        Args:
+            text: Text to sign
+
+        Returns:
+            np.ndarray: uint64 array of length num_perm
+        """
+        tokens = _TOKEN.findall(text)
+        size = self.shingle_size
+        if len(tokens) <= size:
+            shingles = {' '.join(tokens)}
+        else:
+            shingles = {' '.join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+
+        hashes = np.fromiter(
+            (int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+             for s in shingles),
+            dtype=np.uint64,
+            count=len(shingles)
+        )
+        permuted = np.bitwise_and((np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME, _MAX_HASH)
+        return permuted.min(axis=0)
+
+    def is_duplicate(self, example: Dict[str, Any]) -> bool:
+        """
+        Check an example against the index, indexing it if it is new.
+
+        Args:
+            example: Training example dictionary
+
+        Returns:
+            bool: True if a near-duplicate was already seen
+        """
+        text = '\n'.join(str(example.get(field) or '') for field in self.fields)
+        signature = self.signature(text)
+
+        keys = [
+            hash((band, signature[band * self.rows:(band + 1) * self.rows].tobytes()))
+            for band in range(self.bands)
+        ]
+
+        self.seen += 1
+        if any(key in self._index for key in keys):
+            self.removed += 1
+            return True
+
+        if self.indexed < self.max_index_size:
+            self._index.update(keys)
+            self.indexed += 1
+            if self.indexed == self.max_index_size:
+                logger.warning(
+                    f"Dedup index reached max_index_size={self.max_index_size}; "
+                    "later examples are checked but no longer indexed"
+                )
+
+        return False
+
+    def filter(self, examples: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield only examples that are not near-duplicates of earlier ones.
+
+        Args:
+            examples: Example stream
+
+        Yields:
+            Dict: First occurrence of each near-duplicate cluster
+        """
+        for example in examples:
+            if not self.is_duplicate(example):
+                yield example
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get deduplication statistics.
+
+        Returns:
+            Dict: Counts of seen and removed examples plus the LSH layout
+        """
+        return {
+            'seen': self.seen,
+            'removed': self.removed,
+            'kept': self.seen - self.removed,
+            'threshold': self.threshold,
+            'bands': self.bands,
+            'rows': self.rows,
+        }
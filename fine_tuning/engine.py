@@ -7,13 +7,18 @@ Main orchestrator for the fine-tuning workflow:
 3. Evaluation and deployment
 """
 
+import itertools
 import logging
 import os
 import json
+import sys
+import time
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 import yaml
 
+import structured_logging
+
 logger = logging.getLogger(__name__)
 
 
@@ -56,7 +61,7 @@ class FineTuneEngine:
         self,
         codebase_path: str,
         max_examples: Optional[int] = None
-    ) -> Dict[str, int]:
+    ) -> Dict[str, Any]:
         """
         Generate training dataset from codebase.
 
@@ -68,44 +73,77 @@ class FineTuneEngine:
             Dict: Statistics about generated dataset
 
         Note:
-            Saves dataset to self.dataset_dir/dataset.json
+            Examples are streamed into sharded JSONL files under
+            self.dataset_dir/train/ and self.dataset_dir/val/. Each example
+            is assigned to a split from a hash of its content, so the split
+            is stable across runs and never needs the full dataset in memory.
+
+            Files are extracted across a process pool, and unless
+            dataset_generation.incremental is false, a manifest in
+            self.dataset_dir/cache/ lets reruns re-extract only changed files.
+            Near-duplicates are dropped with MinHash/LSH (dataset_generation.dedup)
+            before the split.
         """
         from .dataset_generator import DatasetGenerator
+        from .dataset_writer import ShardedJSONLWriter, assign_split
+
+        gen_config = self.ft_config.get('dataset_generation', {})
+        generator = DatasetGenerator(gen_config)
+
+        train_split = gen_config.get('train_split', 0.9)
+        split_seed = str(gen_config.get('split_seed', ''))
+        shard_size = gen_config.get('shard_size', 10000)
+        compression = gen_config.get('compression')
+        num_workers = gen_config.get('num_workers') or os.cpu_count() or 1
+        cache_dir = self.dataset_dir / 'cache' if gen_config.get('incremental', True) else None
+
+        logger.info(f"Generating dataset from {codebase_path} with {num_workers} workers")
+        source = generator.iter_from_codebase(
+            codebase_path,
+            cache_dir=cache_dir,
+            num_workers=num_workers
+        )
 
-        generator = DatasetGenerator(self.ft_config.get('dataset_generation', {}))
-
-        logger.info(f"Generating dataset from {codebase_path}")
-        examples = generator.generate_from_codebase(codebase_path)
-
-        if max_examples and len(examples) > max_examples:
-            examples = examples[:max_examples]
-
-        # Split train/val
-        train_split = self.ft_config.get('dataset_generation', {}).get('train_split', 0.9)
-        split_idx = int(len(examples) * train_split)
-
-        train_examples = examples[:split_idx]
-        val_examples = examples[split_idx:]
+        examples = source
+        dedup_config = gen_config.get('dedup', {})
+        deduplicator = None
+        if dedup_config.get('enabled', True):
+            from .dedup import MinHashDeduplicator
 
-        # Save datasets
-        train_path = self.dataset_dir / 'train.json'
-        val_path = self.dataset_dir / 'val.json'
+            # Dedup runs before the split so near-duplicates cannot leak across train/val
+            deduplicator = MinHashDeduplicator(dedup_config)
+            examples = deduplicator.filter(examples)
 
-        with open(train_path, 'w') as f:
-            json.dump(train_examples, f, indent=2)
+        if max_examples:
+            examples = itertools.islice(examples, max_examples)
 
-        with open(val_path, 'w') as f:
-            json.dump(val_examples, f, indent=2)
+        with ShardedJSONLWriter(self.dataset_dir, 'train', shard_size, compression) as train_writer, \
+                ShardedJSONLWriter(self.dataset_dir, 'val', shard_size, compression) as val_writer:
+            writers = {'train': train_writer, 'val': val_writer}
+            for example in examples:
+                writers[assign_split(example, train_split, split_seed)].write(example)
+            # Finalize the scan manifest even when max_examples stopped early
+            source.close()
 
         stats = {
-            'total_examples': len(examples),
-            'train_examples': len(train_examples),
-            'val_examples': len(val_examples),
-            'train_path': str(train_path),
-            'val_path': str(val_path)
+            'success': train_writer.count > 0,
+            'total_examples': train_writer.count + val_writer.count,
+            'train_examples': train_writer.count,
+            'val_examples': val_writer.count,
+            'train_files': train_writer.shards,
+            'val_files': val_writer.shards,
+            'scan': generator.last_scan_stats,
+            'duplicates_removed': deduplicator.removed if deduplicator else 0,
         }
 
-        logger.info(f"Dataset generated: {stats}")
+        logger.info(
+            f"Dataset generated: {stats['total_examples']} examples "
+            f"({stats['train_examples']} train / {stats['val_examples']} val, "
+            f"{stats['duplicates_removed']} near-duplicates removed) "
+            f"in {len(train_writer.shards) + len(val_writer.shards)} shards"
+        )
+        if not stats['success']:
+            stats['error'] = f"No training examples generated from {codebase_path}"
         return stats
 
     def train(self, use_docker: bool = False) -> Dict[str, Any]:
@@ -126,6 +164,159 @@ class FineTuneEngine:
         else:
             return self._train_local()
 
+    def prepare_dataset(self) -> Dict[str, Any]:
+        """
+        Tokenize the generated dataset into the on-disk cache without training.
+
+        Returns:
+            Dict: success, key (tokenized cache key), train_examples, or error
+
+        Note:
+            Lets several training processes that share dataset_dir (e.g. sweep
+            trials) memory-map one cache instead of each tokenizing on a miss.
+        """
+        try:
+            from transformers import AutoTokenizer
+            from .dataset_writer import list_shards
+            from .hardware import resolve_device
+
+            data_files = {
+                'train': list_shards(self.dataset_dir, 'train'),
+                'validation': list_shards(self.dataset_dir, 'val')
+            }
+            tokenizer = AutoTokenizer.from_pretrained(self.base_model)
+            if tokenizer.pad_token is None:
+                tokenizer.pad_token = tokenizer.eos_token
+
+            training_config = self.ft_config.get('training', {})
+            batching, _ = self._resolve_batching(
+                training_config, resolve_device(training_config.get('device', 'auto'))
+            )
+            tokenized_dataset, dataset_key = self._load_tokenized(tokenizer, data_files, training_config, batching)
+            return {'success': True, 'key': dataset_key, 'train_examples': len(tokenized_dataset['train'])}
+
+        except Exception as e:
+            logger.error(f"Dataset preparation failed: {e}", exc_info=True)
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def _resolve_batching(self, training_config: Dict[str, Any], device: str) -> Tuple[str, Optional[str]]:
+        """
+        Batching strategy and attention implementation for a training run.
+
+        Args:
+            training_config: fine_tuning.training section
+            device: Resolved training device
+
+        Returns:
+            Tuple: (batching strategy, attn_implementation or None)
+
+        Raises:
+            ValueError: If the batching strategy is unknown
+
+        Note:
+            Packed blocks separate their examples only by restarting
+            position_ids, which flash_attention_2 honours and the sdpa/eager
+            kernels ignore, so examples would attend to each other. Without
+            flash_attention_2, packing falls back to group_by_length.
+        """
+        from .packing import STRATEGIES
+
+        batching = training_config.get('batching', 'none')
+        if batching not in STRATEGIES:
+            raise ValueError(f"Unknown batching strategy '{batching}'. Must be one of {STRATEGIES}")
+
+        attn_implementation = training_config.get('attn_implementation')
+        if batching == 'packing':
+            if attn_implementation is None and device == 'cuda':
+                from transformers.utils import is_flash_attn_2_available
+
+                if is_flash_attn_2_available():
+                    attn_implementation = 'flash_attention_2'
+            if attn_implementation != 'flash_attention_2':
+                logger.info(
+                    f"Packing requires flash_attention_2 (have {attn_implementation or 'default'} "
+                    f"attention on {device}); using group_by_length batching instead"
+                )
+                batching = 'group_by_length'
+        return batching, attn_implementation
+
+    def _load_tokenized(
+        self,
+        tokenizer,
+        data_files: Dict[str, List[str]],
+        training_config: Dict[str, Any],
+        batching: str
+    ):
+        """
+        Load the tokenized (and, with batching 'packing', packed) dataset.
+
+        Args:
+            tokenizer: Tokenizer of the base model
+            data_files: Split name mapped to JSONL shard paths
+            training_config: fine_tuning.training section
+            batching: Resolved batching strategy (see _resolve_batching)
+
+        Returns:
+            Tuple: (DatasetDict, cache key)
+        """
+        from .dataset_generator import format_prompt
+        from .tokenized_cache import cache_key, load_tokenized_dataset
+        from .packing import pack_examples
+
+        max_length = training_config.get('max_length', 512)
+
+        def tokenize_function(examples):
+            # Format: instruction + input + output
+            inputs = examples.get('input') or [''] * len(examples['instruction'])
+            texts = [
+                format_prompt(instruction, input_text, output)
+                for instruction, input_text, output in zip(
+                    examples['instruction'], inputs, examples['output']
+                )
+            ]
+
+            tokenized = tokenizer(texts, truncation=True, max_length=max_length)
+            tokenized['length'] = [len(ids) for ids in tokenized['input_ids']]
+            return tokenized
+
+        def tokenize_dataset(dataset, num_proc):
+            tokenized = dataset.map(
+                tokenize_function,
+                batched=True,
+                num_proc=num_proc,
+                remove_columns=dataset['train'].column_names
+            )
+            if batching == 'packing':
+                tokenized = tokenized.map(
+                    pack_examples,
+                    batched=True,
+                    batch_size=1000,
+                    num_proc=num_proc,
+                    remove_columns=tokenized['train'].column_names,
+                    fn_kwargs={'max_length': max_length, 'eos_token_id': tokenizer.eos_token_id}
+                )
+            return tokenized
+
+        dataset_key = cache_key(
+            data_files,
+            tokenizer,
+            max_length,
+            revision=self.ft_config.get('base_model_revision'),
+            extra={'packing': batching == 'packing'}
+        )
+        tokenized_dataset = load_tokenized_dataset(
+            data_files,
+            tokenize_dataset,
+            cache_dir=self.dataset_dir / 'tokenized',
+            key=dataset_key,
+            num_proc=training_config.get('tokenize_num_proc') or os.cpu_count(),
+            keep=training_config.get('tokenized_cache_keep', 3)
+        )
+        return tokenized_dataset, dataset_key
+
     def _train_local(self) -> Dict[str, Any]:
         """
         Train model locally (not in Docker).
@@ -141,10 +332,63 @@ class FineTuneEngine:
                 Trainer,
                 DataCollatorForLanguageModeling
             )
-            from peft import LoraConfig, get_peft_model, TaskType
-            from datasets import load_dataset
+            from peft import LoraConfig, PeftModel, get_peft_model, TaskType
+            from .dataset_writer import list_shards, read_shards, example_key
+            from .packing import PackedDataCollator, padding_efficiency
+            from .hardware import resolve_device, cpu_training_settings, apply_cpu_threads
+            from .telemetry import PerformanceCallback, summarize_performance
+            from .incremental import (
+                build_incremental_split, load_trained_keys, save_trained_keys,
+                latest_checkpoint, checkpoint_tokens_seen, start_run, finish_run
+            )
+            from .stages import fingerprint
+
+            training_config = self.ft_config.get('training', {})
+            device = resolve_device(training_config.get('device', 'auto'))
+            cpu_settings = None
+            if device == 'cpu':
+                cpu_settings = cpu_training_settings(training_config)
+                apply_cpu_threads(cpu_settings)
+
+            batching, attn_implementation = self._resolve_batching(training_config, device)
 
-            logger.info("Starting local training...")
+            logger.info(f"Starting local training on {device}...")
+
+            # Select training data (incremental runs only see new + replayed examples)
+            adapter_path = self.output_dir / 'adapter'
+            data_files = {
+                'train': list_shards(self.dataset_dir, 'train'),
+                'validation': list_shards(self.dataset_dir, 'val')
+            }
+            mode = training_config.get('mode', 'full')
+            trained_keys = set()
+            current_keys = None
+            if mode == 'incremental':
+                if not (adapter_path / 'adapter_config.json').exists():
+                    logger.info("No previous adapter found; running full training")
+                    mode = 'full'
+                else:
+                    trained_keys = load_trained_keys(adapter_path)
+                    gen_config = self.ft_config.get('dataset_generation', {})
+                    split = build_incremental_split(
+                        data_files['train'],
+                        trained_keys,
+                        self.dataset_dir / 'incremental',
+                        replay_ratio=training_config.get('replay_ratio', 0.1),
+                        seed=str(gen_config.get('split_seed', '')),
+                        shard_size=gen_config.get('shard_size', 10000),
+                        compression=gen_config.get('compression')
+                    )
+                    if split['new_examples'] == 0:
+                        logger.info("No new examples since the last adapter; skipping training")
+                        return {
+                            'success': True,
+                            'skipped': True,
+                            'adapter_path': str(adapter_path),
+                            'mode': mode
+                        }
+                    data_files['train'] = split['train_files']
+                    current_keys = split['all_keys']
 
             # Load tokenizer
             tokenizer = AutoTokenizer.from_pretrained(self.base_model)
@@ -153,11 +397,27 @@ class FineTuneEngine:
 
             # Load model
             logger.info(f"Loading base model: {self.base_model}")
-            model = AutoModelForCausalLM.from_pretrained(
-                self.base_model,
-                load_in_4bit=True,  # QLoRA
-                device_map="auto"
-            )
+            model_kwargs = {}
+            if attn_implementation:
+                model_kwargs['attn_implementation'] = attn_implementation
+
+            if device == 'cpu':
+                import torch
+
+                # No bitsandbytes on CPU: load full weights in fp32/bf16
+                model = AutoModelForCausalLM.from_pretrained(
+                    self.base_model,
+                    torch_dtype=torch.bfloat16 if cpu_settings['precision'] == 'bf16' else torch.float32,
+                    low_cpu_mem_usage=True,
+                    **model_kwargs
+                )
+            else:
+                model = AutoModelForCausalLM.from_pretrained(
+                    self.base_model,
+                    load_in_4bit=True,  # QLoRA
+                    device_map="auto",
+                    **model_kwargs
+                )
 
             # Configure LoRA
             lora_config_dict = self.ft_config.get('lora_config', {})
@@ -173,47 +433,46 @@ class FineTuneEngine:
                 bias=lora_config_dict.get('bias', 'none')
             )
 
-            model = get_peft_model(model, lora_config)
+            gradient_checkpointing = training_config.get(
+                'gradient_checkpointing',
+                bool(cpu_settings and cpu_settings['gradient_checkpointing'])
+            )
+            if gradient_checkpointing:
+                # Frozen base weights: inputs must require grad for checkpointing
+                model.gradient_checkpointing_enable()
+                model.enable_input_require_grads()
+
+            if mode == 'incremental':
+                logger.info(f"Continuing training from adapter {adapter_path}")
+                model = PeftModel.from_pretrained(model, str(adapter_path), is_trainable=True)
+            else:
+                model = get_peft_model(model, lora_config)
             model.print_trainable_parameters()
 
-            # Load dataset
+            # Load tokenized dataset (cached on disk across runs)
             logger.info("Loading training dataset...")
-            dataset = load_dataset(
-                'json',
-                data_files={
-                    'train': str(self.dataset_dir / 'train.json'),
-                    'validation': str(self.dataset_dir / 'val.json')
-                }
-            )
-
-            # Tokenize dataset
-            def tokenize_function(examples):
-                # Format: instruction + input + output
-                texts = []
-                for i in range(len(examples['instruction'])):
-                    text = f"### Instruction:\n{examples['instruction'][i]}\n\n"
-                    if examples.get('input') and examples['input'][i]:
-                        text += f"### Input:\n{examples['input'][i]}\n\n"
-                    text += f"### Output:\n{examples['output'][i]}"
-                    texts.append(text)
-
-                return tokenizer(texts, truncation=True, max_length=512)
-
-            tokenized_dataset = dataset.map(
-                tokenize_function,
-                batched=True,
-                remove_columns=dataset['train'].column_names
-            )
+            tokenized_dataset, dataset_key = self._load_tokenized(tokenizer, data_files, training_config, batching)
 
             # Training arguments
-            training_config = self.ft_config.get('training', {})
+            if device == 'cpu':
+                precision_args = {
+                    'use_cpu': True,
+                    'fp16': False,
+                    'bf16': cpu_settings['precision'] == 'bf16',
+                    'dataloader_num_workers': cpu_settings['dataloader_workers'],
+                }
+            else:
+                precision_args = {
+                    'fp16': training_config.get('fp16', True),
+                    'dataloader_num_workers': training_config.get('dataloader_num_workers', 0),
+                }
+
             training_args = TrainingArguments(
                 output_dir=str(self.output_dir),
                 num_train_epochs=training_config.get('num_epochs', 3),
                 per_device_train_batch_size=training_config.get('batch_size', 4),
                 gradient_accumulation_steps=training_config.get('gradient_accumulation_steps', 4),
                 learning_rate=training_config.get('learning_rate', 2e-4),
-                fp16=training_config.get('fp16', True),
                 save_steps=training_config.get('save_steps', 100),
                 eval_steps=training_config.get('eval_steps', 100),
                 logging_steps=training_config.get('logging_steps', 10),
@@ -222,38 +481,108 @@ class FineTuneEngine:
                 load_best_model_at_end=True,
                 warmup_steps=training_config.get('warmup_steps', 50),
                 max_grad_norm=training_config.get('max_grad_norm', 1.0),
+                group_by_length=batching == 'group_by_length',
+                gradient_checkpointing=gradient_checkpointing,
+                include_num_input_tokens_seen=True,
+                **precision_args
             )
 
-            # Data collator
-            data_collator = DataCollatorForLanguageModeling(
-                tokenizer=tokenizer,
-                mlm=False
+            efficiency = padding_efficiency(
+                tokenized_dataset['train']['length'],
+                training_args.per_device_train_batch_size,
+                strategy=batching
             )
+            logger.info(f"Batching strategy '{batching}': padding efficiency {efficiency:.1%}")
+
+            # Data collator
+            if batching == 'packing':
+                data_collator = PackedDataCollator(tokenizer.pad_token_id)
+            else:
+                data_collator = DataCollatorForLanguageModeling(
+                    tokenizer=tokenizer,
+                    mlm=False
+                )
 
             # Trainer
+            perf_callback = PerformanceCallback(self.output_dir)
             trainer = Trainer(
                 model=model,
                 args=training_args,
                 train_dataset=tokenized_dataset['train'],
                 eval_dataset=tokenized_dataset['validation'],
                 data_collator=data_collator,
+                callbacks=[perf_callback],
             )
 
             # Train
+            # A checkpoint only resumes a run with the same data, adapter shape and
+            # hyperparameters; otherwise its adapter/optimizer state would not match
+            run_settings = {
+                key: value for key, value in training_config.items()
+                if key not in ('resume', 'resume_from_checkpoint')
+            }
+            run_key = fingerprint(
+                'run',
+                mode,
+                dataset_key,
+                self.base_model,
+                self.ft_config.get('base_model_revision'),
+                lora_config_dict,
+                run_settings
+            )
+            explicit_resume = training_config.get('resume_from_checkpoint')
+            if explicit_resume:
+                # 'latest' continues this output_dir's newest checkpoint (e.g. sweep rungs)
+                resume_from = latest_checkpoint(self.output_dir) if explicit_resume == 'latest' else explicit_resume
+                start_run(self.output_dir, run_key, keep_checkpoints=True)
+            elif training_config.get('resume', True):
+                resume_from = start_run(self.output_dir, run_key)
+            else:
+                resume_from = None
+
             logger.info("Starting training...")
-            train_result = trainer.train()
+            train_result = trainer.train(resume_from_checkpoint=resume_from)
+
+            # train_runtime covers this session only, so count the tokens it processed
+            # (resumed runs restore num_input_tokens_seen from the checkpoint)
+            train_tokens = trainer.state.num_input_tokens_seen - checkpoint_tokens_seen(resume_from)
+            runtime = train_result.metrics.get('train_runtime') or 0
+            tokens_per_second = train_tokens / runtime if runtime else 0.0
+            logger.info(f"Training throughput: {tokens_per_second:.1f} tokens/s on {device}")
+
+            eval_metrics = trainer.evaluate()
+
+            performance = summarize_performance(perf_callback.path)
+            for finding in performance['findings']:
+                logger.warning(f"Performance: {finding}")
 
             # Save model
-            adapter_path = self.output_dir / 'adapter'
             model.save_pretrained(str(adapter_path))
             tokenizer.save_pretrained(str(adapter_path))
 
+            # Record what the adapter has absorbed so incremental runs can diff against it
+            if current_keys is None:
+                current_keys = {
+                    example_key(example)
+                    for example in read_shards(data_files['train'])
+                }
+            save_trained_keys(adapter_path, trained_keys | current_keys, self.base_model)
+            finish_run(self.output_dir)
+
             logger.info(f"Training completed. Adapter saved to {adapter_path}")
 
             return {
                 'success': True,
                 'adapter_path': str(adapter_path),
-                'metrics': train_result.metrics
+                'metrics': train_result.metrics,
+                'eval_metrics': eval_metrics,
+                'batching': batching,
+                'padding_efficiency': efficiency,
+                'device': device,
+                'mode': mode,
+                'resumed_from': resume_from,
+                'tokens_per_second': tokens_per_second,
+                'performance': performance
             }
 
         except Exception as e:
@@ -313,14 +642,47 @@ class FineTuneEngine:
             Dict: Evaluation metrics and sample outputs
         """
         from .evaluator import ModelEvaluator
+        from .dataset_writer import list_shards
 
         evaluator = ModelEvaluator(
             self.output_dir / 'adapter',
-            self.dataset_dir / 'val.json'
+            list_shards(self.dataset_dir, 'val'),
+            self.ft_config.get('evaluation', {})
         )
 
         return evaluator.evaluate()
 
+    def merge_adapter(self) -> Dict[str, Any]:
+        """
+        Merge the trained LoRA adapter into the base model weights.
+
+        Returns:
+            Dict: Merge status and statistics
+
+        Note:
+            Writes safetensors shards to self.output_dir/merged_model,
+            processing one base shard at a time to bound memory.
+        """
+        from .export import merge_lora_streaming
+
+        logger.info("Merging adapter into base model...")
+
+        try:
+            stats = merge_lora_streaming(
+                self.base_model,
+                self.output_dir / 'adapter',
+                self.output_dir / 'merged_model',
+                revision=self.ft_config.get('base_model_revision')
+            )
+            return {'success': True, **stats}
+
+        except (OSError, ValueError) as e:
+            logger.error(f"Merge failed: {e}")
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
     def deploy_to_ollama(self, model_name: str = 'custom-project-model') -> Dict[str, Any]:
         """
         Deploy fine-tuned model to Ollama.
@@ -330,15 +692,35 @@ class FineTuneEngine:
 
         Returns:
             Dict: Deployment status
+
+        Note:
+            Merges the adapter first if merged_model is missing or older than
+            the adapter. With several export.quantizations configured, each is
+            created as '<model_name>-<quant>' and benchmarked, and the fastest
+            variant within export.max_quality_drop of the first (baseline)
+            variant is deployed as model_name.
         """
         import subprocess
+        from .export import create_ollama_model, benchmark_ollama_models, ollama_model_digest, select_variant
 
         logger.info(f"Deploying to Ollama as '{model_name}'...")
 
+        export_config = self.ft_config.get('export', {})
+        merged_dir = self.output_dir / 'merged_model'
+        adapter_weights = self.output_dir / 'adapter' / 'adapter_model.safetensors'
+
+        merged_config = merged_dir / 'config.json'
+        if not merged_config.exists() or (
+            adapter_weights.exists() and adapter_weights.stat().st_mtime > merged_config.stat().st_mtime
+        ):
+            merge_result = self.merge_adapter()
+            if not merge_result['success']:
+                return merge_result
+
         try:
             # Create Modelfile
             modelfile_path = self.output_dir / 'Modelfile'
-            modelfile_content = f"""FROM {str(self.output_dir / 'merged_model')}
+            modelfile_content = f"""FROM {str(merged_dir)}
 
 PARAMETER temperature 0.7
 PARAMETER num_ctx 4096
@@ -354,17 +736,61 @@ SYSTEM "You are a code assistant specialized in this project's patterns and arch
             with open(modelfile_path, 'w') as f:
                 f.write(modelfile_content)
 
-            # Create Ollama model
-            subprocess.run(
-                ['ollama', 'create', model_name, '-f', str(modelfile_path)],
-                check=True
+            quantizations = export_config.get('quantizations', ['q4_K_M'])
+
+            if len(quantizations) == 1:
+                create_ollama_model(model_name, modelfile_path, quantizations[0])
+                logger.info(f"Successfully deployed model '{model_name}' to Ollama")
+                return {
+                    'success': True,
+                    'model_name': model_name,
+                    'quantization': quantizations[0],
+                    'digest': ollama_model_digest(model_name)
+                }
+
+            # Build every variant, benchmark, and promote the winner
+            from llm import LLMFactory
+            from .dataset_writer import list_shards, read_shards
+            from .dataset_generator import format_prompt
+
+            variants = {f"{model_name}-{q.lower()}": q for q in quantizations}
+            for variant, quantization in variants.items():
+                create_ollama_model(variant, modelfile_path, quantization)
+
+            samples = list(itertools.islice(
+                read_shards(list_shards(self.dataset_dir, 'val')),
+                export_config.get('benchmark_samples', 20)
+            ))
+            benchmarks = benchmark_ollama_models(
+                LLMFactory.get_provider('ollama'),
+                list(variants),
+                [format_prompt(e['instruction'], e.get('input') or '') for e in samples],
+                [e['output'] for e in samples],
+                max_tokens=export_config.get('benchmark_max_tokens', 256)
             )
+            selected = select_variant(
+                benchmarks,
+                baseline=next(iter(variants)),
+                max_quality_drop=export_config.get('max_quality_drop', 0.02),
+                max_latency_ms=export_config.get('max_latency_ms')
+            )
+
+            subprocess.run(['ollama', 'cp', selected, model_name], check=True)
+            if not export_config.get('keep_variants', False):
+                for variant in variants:
+                    subprocess.run(['ollama', 'rm', variant], check=True)
 
-            logger.info(f"Successfully deployed model '{model_name}' to Ollama")
+            logger.info(
+                f"Successfully deployed model '{model_name}' to Ollama "
+                f"({variants[selected]}, {benchmarks[selected]['tokens_per_second']:.1f} tokens/s)"
+            )
 
             return {
                 'success': True,
-                'model_name': model_name
+                'model_name': model_name,
+                'quantization': variants[selected],
+                'benchmarks': benchmarks,
+                'digest': ollama_model_digest(model_name)
             }
 
         except subprocess.CalledProcessError as e:
@@ -378,7 +804,10 @@ SYSTEM "You are a code assistant specialized in this project's patterns and arch
         self,
         codebase_path: str,
         use_docker: bool = False,
-        model_name: str = 'custom-project-model'
+        model_name: str = 'custom-project-model',
+        from_stage: Optional[str] = None,
+        until_stage: Optional[str] = None,
+        force: bool = False
     ) -> Dict[str, Any]:
         """
         Execute complete fine-tuning workflow.
@@ -387,31 +816,203 @@ SYSTEM "You are a code assistant specialized in this project's patterns and arch
             codebase_path: Path to codebase for training
             use_docker: Whether to use Docker for training
             model_name: Name for deployed Ollama model
+            from_stage: First stage to execute ('dataset', 'training',
+                'evaluation' or 'deployment'); earlier stages are not run
+                and their existing outputs are used as-is
+            until_stage: Last stage to execute
+            force: Re-run selected stages even if their cached results are valid
 
         Returns:
-            Dict: Results from each stage of workflow
+            Dict: Results from each stage of workflow (each with its own
+                success flag), timings, failed_stages and success, which is
+                False if any selected stage failed
+
+        Note:
+            Each stage is fingerprinted from its inputs (codebase contents,
+            config section, upstream artifact hashes). A stage whose
+            fingerprint and outputs match the last successful run is skipped.
+            Fingerprints and per-stage timings are kept in
+            self.output_dir/workflow_manifest.json.
         """
-        results = {}
+        from .stages import STAGES, StageCache, fingerprint, hash_paths, hash_files
+        from .export import ollama_model_digest
+        from .dataset_generator import DatasetGenerator
 
-        # 1. Generate dataset
-        logger.info("=== Phase 1: Dataset Generation ===")
-        results['dataset'] = self.generate_dataset(codebase_path)
+        for stage in (from_stage, until_stage):
+            if stage is not None and stage not in STAGES:
+                raise ValueError(f"Unknown stage '{stage}'. Must be one of {STAGES}")
 
-        # 2. Train model
-        logger.info("=== Phase 2: Training ===")
-        results['training'] = self.train(use_docker=use_docker)
+        first = STAGES.index(from_stage or STAGES[0])
+        last = STAGES.index(until_stage or STAGES[-1])
+        selected = STAGES[first:last + 1]
 
-        if not results['training'].get('success'):
-            logger.error("Training failed, aborting workflow")
-            return results
+        cache = StageCache(self.output_dir)
+        dataset_outputs = [self.dataset_dir / 'train', self.dataset_dir / 'val']
+        adapter_outputs = [self.output_dir / 'adapter']
 
-        # 3. Evaluate
-        logger.info("=== Phase 3: Evaluation ===")
-        results['evaluation'] = self.evaluate()
+        def dataset_inputs():
+            gen_config = self.ft_config.get('dataset_generation', {})
+            generator = DatasetGenerator(gen_config)
+            codebase_hash = hash_files(generator.iter_source_files(codebase_path), codebase_path)
+            return fingerprint('dataset', codebase_hash, gen_config)
 
-        # 4. Deploy
-        logger.info("=== Phase 4: Deployment ===")
-        results['deployment'] = self.deploy_to_ollama(model_name)
+        def training_inputs():
+            return fingerprint(
+                'training',
+                self.base_model,
+                self.ft_config.get('base_model_revision'),
+                self.ft_config.get('lora_config', {}),
+                self.ft_config.get('training', {}),
+                use_docker,
+                hash_paths(dataset_outputs)
+            )
 
-        logger.info("=== Workflow Complete ===")
+        def evaluation_inputs():
+            return fingerprint(
+                'evaluation',
+                self.ft_config.get('evaluation', {}),
+                hash_paths(adapter_outputs),
+                hash_paths([self.dataset_dir / 'val'])
+            )
+
+        def deployment_inputs():
+            return fingerprint(
+                'deployment',
+                model_name,
+                self.ft_config.get('export', {}),
+                hash_paths(adapter_outputs)
+            )
+
+        def deployment_valid(result: Dict[str, Any]) -> bool:
+            # The deployed model lives in Ollama, not under output_dir: it must
+            # still exist and be the exact build this stage created
+            digest = ollama_model_digest(result.get('model_name', model_name))
+            return digest is not None and digest == result.get('digest')
+
+        validators = {'deployment': deployment_valid}
+
+        definitions = {
+            'dataset': (dataset_inputs, lambda: self.generate_dataset(codebase_path), dataset_outputs),
+            'training': (training_inputs, lambda: self.train(use_docker=use_docker), adapter_outputs),
+            'evaluation': (evaluation_inputs, self.evaluate, []),
+            'deployment': (deployment_inputs, lambda: self.deploy_to_ollama(model_name), []),
+        }
+        results: Dict[str, Any] = {}
+        failed: List[str] = []
+
+        for phase, stage in enumerate(STAGES, start=1):
+            if stage not in selected:
+                cache.timing(stage, 'skipped')
+                continue
+
+            logger.info(f"=== Phase {phase}: {stage.capitalize()} ===")
+            start = time.perf_counter()
+            compute_inputs, run_stage, outputs = definitions[stage]
+            stage_fingerprint = compute_inputs()
+
+            cached = None if force else cache.lookup(stage, stage_fingerprint, outputs, validators.get(stage))
+            if cached is not None:
+                logger.info(f"Stage '{stage}' inputs unchanged; reusing cached result")
+                results[stage] = {**cached, 'success': True}
+                cache.timing(stage, 'cached', time.perf_counter() - start)
+                continue
+
+            result = run_stage()
+            result['success'] = bool(result.get('success', False))
+            results[stage] = result
+            elapsed = time.perf_counter() - start
+
+            if result['success']:
+                cache.timing(stage, 'ran', elapsed)
+                cache.record(stage, stage_fingerprint, outputs, result, elapsed)
+                continue
+
+            failed.append(stage)
+            cache.timing(stage, 'failed', elapsed)
+            # Later stages need the dataset and adapter; evaluation is advisory
+            if stage in ('dataset', 'training'):
+                logger.error(f"Stage '{stage}' failed, aborting workflow")
+                break
+            logger.error(f"Stage '{stage}' failed, continuing")
+
+        cache.save()
+        results['timings'] = cache.run['stages']
+        results['failed_stages'] = failed
+        results['success'] = not failed
+        if failed:
+            results['error'] = f"Stage(s) failed: {', '.join(failed)}"
+
+        logger.info("=== Workflow Complete ===" if not failed else "=== Workflow Failed ===")
         return results
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point.
+
+    Usage:
+        python -m fine_tuning.engine generate_dataset /path/to/codebase
+        python -m fine_tuning.engine train [--use-docker]
+        python -m fine_tuning.engine evaluate
+        python -m fine_tuning.engine deploy custom-model
+        python -m fine_tuning.engine workflow /path/to/codebase --from-stage training
+    """
+    import argparse
+    from .stages import STAGES
+
+    parser = argparse.ArgumentParser(description='Fine-tune LLMs on a project codebase')
+    parser.add_argument('--config', help='Path to llm_config.yaml')
+    subparsers = parser.add_subparsers(dest='command')
+
+    dataset_parser = subparsers.add_parser('generate_dataset', help='Generate training dataset')
+    dataset_parser.add_argument('codebase_path')
+    dataset_parser.add_argument('--max-examples', type=int)
+
+    train_parser = subparsers.add_parser('train', help='Train the adapter')
+    train_parser.add_argument('--use-docker', action='store_true')
+
+    subparsers.add_parser('evaluate', help='Evaluate the trained adapter')
+
+    deploy_parser = subparsers.add_parser('deploy', help='Deploy to Ollama')
+    deploy_parser.add_argument('model_name', nargs='?', default='custom-project-model')
+
+    workflow_parser = subparsers.add_parser('workflow', help='Run the full cached workflow')
+    workflow_parser.add_argument('codebase_path')
+    workflow_parser.add_argument('--use-docker', action='store_true')
+    workflow_parser.add_argument('--model-name', default='custom-project-model')
+    workflow_parser.add_argument('--from-stage', choices=STAGES)
+    workflow_parser.add_argument('--until-stage', choices=STAGES)
+    workflow_parser.add_argument('--force', action='store_true', help='Ignore cached stage results')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    structured_logging.configure(command='fine_tuning.engine')
+
+    engine = FineTuneEngine(args.config)
+
+    # The training container runs this module without arguments
+    command = args.command or 'train'
+    if command == 'generate_dataset':
+        result = engine.generate_dataset(args.codebase_path, args.max_examples)
+    elif command == 'train':
+        result = engine.train(use_docker=getattr(args, 'use_docker', False))
+    elif command == 'evaluate':
+        result = engine.evaluate()
+    elif command == 'deploy':
+        result = engine.deploy_to_ollama(args.model_name)
+    else:
+        result = engine.run_full_workflow(
+            args.codebase_path,
+            use_docker=args.use_docker,
+            model_name=args.model_name,
+            from_stage=args.from_stage,
+            until_stage=args.until_stage,
+            force=args.force
+        )
+
+    print(json.dumps(result, indent=2, default=str))
+    return 0 if result.get('success') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
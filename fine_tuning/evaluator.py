@@ -0,0 +1,297 @@
+"""
+Model Evaluator
+
+Scores a fine-tuned adapter on the validation split:
+- perplexity from batched forward passes over length-sorted, padded batches
+- generation quality from batched, KV-cached generate() calls
+- optionally, generation through the deployed Ollama model using
+  concurrent OllamaProvider.batch requests
+
+Results are cached by a fingerprint of the adapter weights (or Ollama model
+digest), the validation shards and the evaluation settings, so unchanged
+checkpoints are never re-scored.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+from .dataset_generator import format_prompt
+from .dataset_writer import read_shards
+from .export import ollama_model_digest
+from .stages import hash_file
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('local', 'ollama')
+
+# Bump when metrics or prompt formatting change so cached results are invalidated
+EVALUATOR_VERSION = 2
+
+
+def token_f1(prediction: str, reference: str) -> float:
+    """
+    Whitespace-token F1 overlap between a prediction and a reference.
+
+    Args:
+        prediction: Generated text
+        reference: Expected text
+
+    Returns:
+        float: F1 score in [0, 1]
+    """
+    pred_tokens = prediction.split()
+    ref_tokens = reference.split()
+    if not pred_tokens or not ref_tokens:
+        return float(pred_tokens == ref_tokens)
+
+    remaining = {}
+    for token in ref_tokens:
+        remaining[token] = remaining.get(token, 0) + 1
+
+    overlap = 0
+    for token in pred_tokens:
+        if remaining.get(token, 0) > 0:
+            remaining[token] -= 1
+            overlap += 1
+
+    if overlap == 0:
+        return 0.0
+    precision = overlap / len(pred_tokens)
+    recall = overlap / len(ref_tokens)
+    return 2 * precision * recall / (precision + recall)
+
+
+class ModelEvaluator:
+    """
+    Batched evaluator for fine-tuned adapters.
+    """
+
+    def __init__(
+        self,
+        adapter_path: Path,
+        val_files: List[str],
+        config: Optional[Dict[str, Any]] = None
+    ):
+        """
+        Initialize evaluator.
+
+        Args:
+            adapter_path: Saved PEFT adapter directory
+            val_files: Validation JSONL shards
+            config: fine_tuning.evaluation section of llm_config.yaml
+        """
+        config = config or {}
+        self.adapter_path = Path(adapter_path)
+        self.val_files = list(val_files)
+        self.config = config
+
+        self.backend = config.get('backend', 'local')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"Unknown evaluation backend '{self.backend}'. Must be one of {BACKENDS}")
+
+        self.batch_size = config.get('batch_size', 8)
+        self.max_samples = config.get('max_samples', 200)
+        self.max_new_tokens = config.get('max_new_tokens', 256)
+        self.max_length = config.get('max_length', 512)
+        self.ollama_model = config.get('ollama_model', 'custom-project-model')
+        self.num_report_samples = config.get('num_report_samples', 5)
+        self.cache_dir = Path(config.get('cache_dir', self.adapter_path.parent / 'eval_cache'))
+
+    def evaluate(self) -> Dict[str, Any]:
+        """
+        Evaluate the model, returning cached results when nothing changed.
+
+        Returns:
+            Dict: Evaluation metrics and sample outputs
+        """
+        examples = list(read_shards(self.val_files))
+        if not examples:
+            return {'success': False, 'error': 'No validation examples found'}
+
+        key = self._cache_key()
+        cache_path = self.cache_dir / f"{key}.json" if key else None
+        if cache_path is not None and cache_path.exists():
+            logger.info(f"Evaluation cache hit for {self.backend} model ({key})")
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                results = json.load(f)
+            results['cached'] = True
+            return results
+
+        samples = examples[:self.max_samples]
+        prompts = [format_prompt(e['instruction'], e.get('input') or '') for e in samples]
+        references = [e['output'] for e in samples]
+
+        start = time.perf_counter()
+        if self.backend == 'ollama':
+            results = {}
+            predictions = self._generate_ollama(prompts)
+        else:
+            model, tokenizer = self._load_model()
+            results = self._perplexity(model, tokenizer, examples)
+            predictions = self._generate_local(model, tokenizer, prompts)
+        elapsed = time.perf_counter() - start
+
+        scores = [token_f1(p, r) for p, r in zip(predictions, references)]
+        results.update({
+            'success': True,
+            'backend': self.backend,
+            'num_examples': len(examples),
+            'num_generated': len(predictions),
+            'token_f1': sum(scores) / len(scores),
+            'exact_match': sum(p.strip() == r.strip() for p, r in zip(predictions, references)) / len(scores),
+            'eval_seconds': elapsed,
+            'samples': [
+                {'prompt': p, 'reference': r, 'prediction': pred}
+                for p, r, pred in list(zip(prompts, references, predictions))[:self.num_report_samples]
+            ],
+        })
+
+        if cache_path is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            with open(cache_path, 'w', encoding='utf-8') as f:
+                json.dump(results, f, indent=2)
+
+        results['cached'] = False
+        return results
+
+    def _cache_key(self) -> Optional[str]:
+        """
+        Fingerprint of the model under test, validation data and settings.
+
+        Returns:
+            Optional[str]: Cache key, or None when the Ollama model's digest
+                cannot be determined (results are then not cached, since a
+                re-deployed model would otherwise hit a stale entry)
+        """
+        if self.backend == 'ollama':
+            digest = ollama_model_digest(self.ollama_model)
+            if digest is None:
+                logger.warning(f"No digest for Ollama model {self.ollama_model}; evaluation will not be cached")
+                return None
+            model_id = {'ollama': self.ollama_model, 'digest': digest}
+        else:
+            model_id = {
+                path.name: hash_file(str(path))
+                for path in sorted(self.adapter_path.iterdir())
+                if path.is_file() and path.name.startswith('adapter_')
+            }
+
+        payload = {
+            'version': EVALUATOR_VERSION,
+            'model': model_id,
+            'val': [hash_file(path) for path in self.val_files],
+            'settings': {
+                'backend': self.backend,
+                'max_samples': self.max_samples,
+                'max_new_tokens': self.max_new_tokens,
+                'max_length': self.max_length,
+            },
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+
+    def _load_model(self):
+        """Load base model + adapter for inference."""
+        import torch
+        from peft import AutoPeftModelForCausalLM
+        from transformers import AutoTokenizer
+
+        tokenizer = AutoTokenizer.from_pretrained(str(self.adapter_path))
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+
+        model = AutoPeftModelForCausalLM.from_pretrained(
+            str(self.adapter_path),
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            device_map='auto' if torch.cuda.is_available() else None
+        )
+        model.eval()
+        return model, tokenizer
+
+    def _length_sorted_batches(self, lengths: List[int]) -> List[List[int]]:
+        """Group indices into batches of similar length to minimize padding."""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+        return [order[i:i + self.batch_size] for i in range(0, len(order), self.batch_size)]
+
+    def _perplexity(self, model, tokenizer, examples: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Token-level perplexity with one forward pass per padded batch."""
+        import torch
+
+        texts = [
+            format_prompt(e['instruction'], e.get('input') or '', e['output'])
+            for e in examples
+        ]
+        encoded = tokenizer(texts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded['input_ids']]
+
+        tokenizer.padding_side = 'right'
+        total_nll = 0.0
+        total_tokens = 0
+        with torch.inference_mode():
+            for batch_indices in self._length_sorted_batches(lengths):
+                batch = tokenizer.pad(
+                    {'input_ids': [encoded['input_ids'][i] for i in batch_indices]},
+                    return_tensors='pt'
+                ).to(model.device)
+
+                logits = model(**batch).logits[:, :-1]
+                targets = batch['input_ids'][:, 1:]
+                mask = batch['attention_mask'][:, 1:].bool()
+
+                nll = torch.nn.functional.cross_entropy(
+                    logits.float().reshape(-1, logits.size(-1)),
+                    targets.reshape(-1),
+                    reduction='none'
+                ).view_as(targets)
+                total_nll += nll[mask].sum().item()
+                total_tokens += mask.sum().item()
+
+        mean_nll = total_nll / max(total_tokens, 1)
+        return {'eval_loss': mean_nll, 'perplexity': math.exp(mean_nll), 'eval_tokens': total_tokens}
+
+    def _generate_local(self, model, tokenizer, prompts: List[str]) -> List[str]:
+        """Batched, left-padded generation with the KV cache enabled."""
+        import torch
+
+        tokenizer.padding_side = 'left'
+        # Over-long prompts lose their head, not the trailing "### Output:" cue
+        tokenizer.truncation_side = 'left'
+        encoded = tokenizer(prompts, truncation=True, max_length=self.max_length)
+        lengths = [len(ids) for ids in encoded['input_ids']]
+
+        predictions: List[Optional[str]] = [None] * len(prompts)
+        with torch.inference_mode():
+            for batch_indices in self._length_sorted_batches(lengths):
+                batch = tokenizer.pad(
+                    {'input_ids': [encoded['input_ids'][i] for i in batch_indices]},
+                    return_tensors='pt'
+                ).to(model.device)
+
+                output = model.generate(
+                    **batch,
+                    max_new_tokens=self.max_new_tokens,
+                    do_sample=False,
+                    use_cache=True,
+                    pad_token_id=tokenizer.pad_token_id
+                )
+                generated = output[:, batch['input_ids'].shape[1]:]
+                for index, text in zip(batch_indices, tokenizer.batch_decode(generated, skip_special_tokens=True)):
+                    predictions[index] = text
+
+        return predictions
+
+    def _generate_ollama(self, prompts: List[str]) -> List[str]:
+        """Generate through the deployed Ollama model with concurrent requests."""
+        from llm import LLMFactory
+
+        provider = LLMFactory.get_provider('ollama')
+        return provider.batch(
+            [[{'role': 'user', 'content': prompt}] for prompt in prompts],
+            model=self.ollama_model,
+            max_tokens=self.max_new_tokens,
+            temperature=0.0
+        )
@@ -0,0 +1,295 @@
+"""
+Adapter Merge and Quantized Export
+
+Merges a LoRA adapter into its base model one safetensors shard at a time
+(peak memory is roughly one shard, not two full models), then builds
+quantized Ollama variants and benchmarks them with provider telemetry so
+the fastest variant within a quality tolerance can be deployed.
+"""
+
+import json
+import logging
+import shutil
+import statistics
+import subprocess
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Files copied alongside merged weights (tokenizer/config metadata)
+_METADATA_SUFFIXES = ('.json', '.model', '.txt', '.tiktoken')
+
+
+def _resolve_model_dir(base_model: str, revision: Optional[str] = None) -> Path:
+    """Local directory for a base model, downloading safetensors if needed."""
+    local = Path(base_model)
+    if local.is_dir():
+        return local
+
+    from huggingface_hub import snapshot_download
+
+    return Path(snapshot_download(
+        base_model,
+        revision=revision,
+        allow_patterns=['*.safetensors', '*.json', '*.model', '*.txt', '*.tiktoken']
+    ))
+
+
+def _load_lora_pairs(adapter_path: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Load LoRA A/B matrices keyed by the base weight name they modify.
+
+    Returns:
+        Dict: base weight key -> {'A': tensor, 'B': tensor}
+    """
+    from safetensors.torch import load_file
+
+    tensors = load_file(str(adapter_path / 'adapter_model.safetensors'))
+    pairs: Dict[str, Dict[str, Any]] = {}
+
+    for key, tensor in tensors.items():
+        for part in ('A', 'B'):
+            marker = f'.lora_{part}.'
+            if marker in key:
+                module = key.split(marker)[0]
+                if module.startswith('base_model.model.'):
+                    module = module[len('base_model.model.'):]
+                pairs.setdefault(f'{module}.weight', {})[part] = tensor
+                break
+        else:
+            logger.warning(f"Ignoring non-LoRA adapter tensor {key}; it is not merged")
+
+    return pairs
+
+
+def merge_lora_streaming(
+    base_model: str,
+    adapter_path: Path,
+    output_dir: Path,
+    revision: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Merge a LoRA adapter into base weights shard by shard.
+
+    For every targeted weight W, writes W + scaling * (B @ A), computed in
+    fp32 and cast back to W's dtype. Untargeted tensors are copied through.
+
+    Args:
+        base_model: Hugging Face model id or local directory
+        adapter_path: PEFT adapter directory (adapter_model.safetensors)
+        output_dir: Directory for the merged safetensors model
+        revision: Base model revision
+
+    Returns:
+        Dict: Merge statistics (shards, merged_weights, output_dir)
+
+    Raises:
+        ValueError: If adapter weights do not match any base weight
+    """
+    from safetensors import safe_open
+    from safetensors.torch import save_file
+
+    adapter_path = Path(adapter_path)
+    output_dir = Path(output_dir)
+
+    with open(adapter_path / 'adapter_config.json', 'r') as f:
+        adapter_config = json.load(f)
+
+    r = adapter_config['r']
+    alpha = adapter_config.get('lora_alpha', r)
+    scaling = alpha / (r ** 0.5) if adapter_config.get('use_rslora') else alpha / r
+    fan_in_fan_out = adapter_config.get('fan_in_fan_out', False)
+
+    model_dir = _resolve_model_dir(base_model, revision)
+    shards = sorted(model_dir.glob('*.safetensors'))
+    if not shards:
+        raise ValueError(f"No safetensors shards found for base model {base_model}")
+
+    pairs = _load_lora_pairs(adapter_path)
+    unmerged = set(pairs)
+
+    tmp_dir = output_dir.with_name(output_dir.name + '.tmp')
+    if tmp_dir.exists():
+        shutil.rmtree(tmp_dir)
+    tmp_dir.mkdir(parents=True)
+
+    for shard in shards:
+        merged = {}
+        with safe_open(str(shard), framework='pt') as f:
+            metadata = f.metadata() or {}
+            for key in f.keys():
+                tensor = f.get_tensor(key)
+                pair = pairs.get(key)
+                if pair is not None:
+                    delta = pair['B'].float() @ pair['A'].float()
+                    if fan_in_fan_out:
+                        delta = delta.T
+                    tensor = (tensor.float() + scaling * delta).to(tensor.dtype)
+                    unmerged.discard(key)
+                merged[key] = tensor.contiguous()
+
+        save_file(merged, str(tmp_dir / shard.name), metadata={**metadata, 'format': 'pt'})
+        logger.info(f"Merged shard {shard.name} ({len(merged)} tensors)")
+        del merged
+
+    if unmerged:
+        shutil.rmtree(tmp_dir)
+        raise ValueError(f"{len(unmerged)} adapter weights had no matching base weight, e.g. {sorted(unmerged)[:3]}")
+
+    # Config/index from the base model; tokenizer files from the adapter (pad token etc.)
+    for source_dir in (model_dir, adapter_path):
+        for path in source_dir.iterdir():
+            if path.is_file() and path.suffix in _METADATA_SUFFIXES and not path.name.startswith('adapter_'):
+                shutil.copy2(path, tmp_dir / path.name)
+
+    if output_dir.exists():
+        shutil.rmtree(output_dir)
+    tmp_dir.rename(output_dir)
+
+    stats = {
+        'output_dir': str(output_dir),
+        'shards': len(shards),
+        'merged_weights': len(pairs),
+        'scaling': scaling,
+    }
+    logger.info(f"Merged adapter into {output_dir}: {stats}")
+    return stats
+
+
+def create_ollama_model(model_name: str, modelfile_path: Path, quantization: Optional[str] = None) -> None:
+    """
+    Create an Ollama model from a Modelfile, optionally quantizing it.
+
+    Args:
+        model_name: Name to create in Ollama
+        modelfile_path: Modelfile whose FROM points at the merged model
+        quantization: Ollama quantization type (e.g. 'q4_K_M', 'q8_0');
+            None or 'f16' keeps the merged precision
+
+    Raises:
+        subprocess.CalledProcessError: If ollama create fails
+    """
+    command = ['ollama', 'create', model_name, '-f', str(modelfile_path)]
+    if quantization and quantization != 'f16':
+        command += ['--quantize', quantization]
+
+    logger.info(f"Creating Ollama model {model_name} ({quantization or 'f16'})")
+    subprocess.run(command, check=True)
+
+
+def ollama_model_digest(model_name: str) -> Optional[str]:
+    """
+    Look up the ID (digest prefix) of a local Ollama model.
+
+    Args:
+        model_name: Model name; a name without a tag means ':latest'
+
+    Returns:
+        Optional[str]: ID column of `ollama list`, or None if the model is
+            missing or ollama cannot be run
+    """
+    wanted = model_name if ':' in model_name else f"{model_name}:latest"
+    try:
+        listing = subprocess.run(['ollama', 'list'], check=True, capture_output=True, text=True).stdout
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Could not list Ollama models: {e}")
+        return None
+
+    for line in listing.splitlines()[1:]:
+        fields = line.split()
+        if len(fields) >= 2 and fields[0] == wanted:
+            return fields[1]
+    return None
+
+
+def benchmark_ollama_models(
+    provider,
+    models: List[str],
+    prompts: List[str],
+    references: Optional[List[str]] = None,
+    max_tokens: int = 256
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Measure latency, tokens/s and (optionally) quality for Ollama models.
+
+    Each model is warmed up with one request so load time does not skew the
+    steady-state numbers, then the prompts are sent through provider.batch().
+
+    Args:
+        provider: OllamaProvider instance
+        models: Ollama model names to compare
+        prompts: Benchmark prompts
+        references: Expected outputs for token-F1 quality scoring
+        max_tokens: Generation cap per prompt
+
+    Returns:
+        Dict: Model name -> latency_p50_ms, tokens_per_second, load_ms,
+            and token_f1 when references are given
+    """
+    from .evaluator import token_f1
+
+    results = {}
+    for model in models:
+        provider.get_telemetry(clear=True)
+        provider.invoke([{'role': 'user', 'content': prompts[0]}], model=model, max_tokens=1)
+        load_ms = provider.get_telemetry(clear=True)[-1]['load_ms']
+
+        outputs = provider.batch(
+            [[{'role': 'user', 'content': prompt}] for prompt in prompts],
+            model=model,
+            max_tokens=max_tokens,
+            temperature=0.0
+        )
+        records = provider.get_telemetry(clear=True)
+
+        completion_tokens = sum(r['completion_tokens'] for r in records)
+        eval_seconds = sum(r['eval_ms'] for r in records) / 1000
+        result = {
+            'latency_p50_ms': statistics.median(r['latency_ms'] for r in records),
+            'tokens_per_second': completion_tokens / eval_seconds if eval_seconds else 0.0,
+            'load_ms': load_ms,
+        }
+        if references:
+            scores = [token_f1(o, ref) for o, ref in zip(outputs, references)]
+            result['token_f1'] = sum(scores) / len(scores)
+
+        logger.info(f"Benchmark {model}: {result}")
+        results[model] = result
+
+    return results
+
+
+def select_variant(
+    benchmarks: Dict[str, Dict[str, Any]],
+    baseline: str,
+    max_quality_drop: float = 0.02,
+    max_latency_ms: Optional[float] = None
+) -> str:
+    """
+    Pick the fastest variant whose quality stays within tolerance of the baseline.
+
+    Args:
+        benchmarks: Output of benchmark_ollama_models()
+        baseline: Model name of the unquantized reference variant
+        max_quality_drop: Allowed absolute token-F1 drop versus the baseline
+        max_latency_ms: Optional p50 latency ceiling
+
+    Returns:
+        str: Selected model name (the baseline if nothing else qualifies)
+    """
+    baseline_f1 = benchmarks[baseline].get('token_f1')
+
+    acceptable = []
+    for model, result in benchmarks.items():
+        if baseline_f1 is not None and result.get('token_f1', 0.0) < baseline_f1 - max_quality_drop:
+            continue
+        if max_latency_ms is not None and result['latency_p50_ms'] > max_latency_ms:
+            continue
+        acceptable.append(model)
+
+    if not acceptable:
+        logger.warning("No variant met the quality/latency targets; keeping the baseline")
+        return baseline
+
+    return max(acceptable, key=lambda model: benchmarks[model]['tokens_per_second'])
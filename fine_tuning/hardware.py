@@ -0,0 +1,112 @@
+"""
+Hardware Selection for Training
+
+Chooses between GPU (QLoRA) and CPU training, picks the CPU precision the
+host supports, and pins torch/dataloader thread counts for CPU runs.
+"""
+
+import logging
+import os
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+DEVICES = ('auto', 'cuda', 'cpu')
+
+
+def resolve_device(requested: str = 'auto') -> str:
+    """
+    Resolve the training device.
+
+    Args:
+        requested: 'auto', 'cuda' or 'cpu'
+
+    Returns:
+        str: 'cuda' or 'cpu'
+
+    Raises:
+        ValueError: If the device is unknown or CUDA was requested but is missing
+    """
+    import torch
+
+    if requested not in DEVICES:
+        raise ValueError(f"Unknown device '{requested}'. Must be one of {DEVICES}")
+
+    cuda_available = torch.cuda.is_available()
+    if requested == 'cuda' and not cuda_available:
+        raise ValueError("training.device is 'cuda' but no CUDA device is available")
+
+    if requested == 'auto':
+        return 'cuda' if cuda_available else 'cpu'
+    return requested
+
+
+def cpu_supports_bf16() -> bool:
+    """
+    Check whether the CPU has native bf16 support (AVX512-BF16 or AMX).
+
+    Returns:
+        bool: True if bf16 matmuls run natively on this CPU
+    """
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def cpu_training_settings(training_config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compute CPU training settings from the training config.
+
+    Args:
+        training_config: fine_tuning.training section of llm_config.yaml
+
+    Returns:
+        Dict: precision ('bf16' or 'fp32'), intra_op_threads,
+            inter_op_threads, dataloader_workers and gradient_checkpointing
+    """
+    cpu_config = training_config.get('cpu', {})
+    cores = os.cpu_count() or 1
+
+    dataloader_workers = cpu_config.get('dataloader_workers', min(2, max(0, cores // 8)))
+    precision = cpu_config.get('precision', 'auto')
+    if precision == 'auto':
+        precision = 'bf16' if cpu_supports_bf16() else 'fp32'
+    if precision not in ('bf16', 'fp32'):
+        raise ValueError(f"Unknown CPU precision '{precision}'. Must be bf16, fp32 or auto")
+
+    return {
+        'precision': precision,
+        'intra_op_threads': cpu_config.get('intra_op_threads', max(1, cores - dataloader_workers)),
+        'inter_op_threads': cpu_config.get('inter_op_threads', 1),
+        'dataloader_workers': dataloader_workers,
+        'gradient_checkpointing': cpu_config.get('gradient_checkpointing', True),
+    }
+
+
+def apply_cpu_threads(settings: Dict[str, Any]) -> None:
+    """
+    Pin torch intra-op and inter-op thread pools.
+
+    Args:
+        settings: Output of cpu_training_settings()
+
+    Note:
+        torch only allows setting inter-op threads before parallel work has
+        started; if it already has, the existing value is kept.
+    """
+    import torch
+
+    torch.set_num_threads(settings['intra_op_threads'])
+    try:
+        torch.set_num_interop_threads(settings['inter_op_threads'])
+    except RuntimeError as e:
+        logger.warning(f"Could not set inter-op threads: {e}")
+
+    logger.info(
+        f"CPU training: {settings['intra_op_threads']} intra-op / "
+        f"{settings['inter_op_threads']} inter-op threads, "
+        f"{settings['dataloader_workers']} dataloader workers, {settings['precision']}"
+    )
@@ -0,0 +1,224 @@
+"""
+Resumable and Incremental Training
+
+Helpers for resuming interrupted Trainer runs from their latest checkpoint,
+and for incremental runs that continue a previous adapter on only the
+examples it has not seen, plus a replay sample of older data.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import shutil
+import time
+from pathlib import Path
+from typing import Dict, Any, Iterable, Optional, Set
+
+from .dataset_writer import ShardedJSONLWriter, example_key, read_shards
+
+logger = logging.getLogger(__name__)
+
+DATASET_MANIFEST_NAME = 'dataset_manifest.json'
+RUN_MARKER_NAME = 'training_run.json'
+
+_CHECKPOINT_DIR = re.compile(r'^checkpoint-(\d+)$')
+
+
+def load_trained_keys(adapter_dir: Path) -> Set[str]:
+    """
+    Load the example keys an adapter has already been trained on.
+
+    Args:
+        adapter_dir: Saved adapter directory
+
+    Returns:
+        Set[str]: Example keys (empty if no manifest was recorded)
+    """
+    manifest_path = Path(adapter_dir) / DATASET_MANIFEST_NAME
+    if not manifest_path.exists():
+        return set()
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        return set(json.load(f).get('examples', []))
+
+
+def save_trained_keys(adapter_dir: Path, keys: Iterable[str], base_model: str) -> None:
+    """
+    Record the example keys an adapter has been trained on.
+
+    Args:
+        adapter_dir: Saved adapter directory
+        keys: Example keys from dataset_writer.example_key()
+        base_model: Base model the adapter belongs to
+    """
+    manifest_path = Path(adapter_dir) / DATASET_MANIFEST_NAME
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'base_model': base_model,
+            'created_at': time.time(),
+            'examples': sorted(keys),
+        }, f)
+
+
+def build_incremental_split(
+    train_shards: list,
+    trained_keys: Set[str],
+    output_dir: Path,
+    replay_ratio: float = 0.1,
+    seed: str = '',
+    shard_size: int = 10000,
+    compression: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Write a training split of new examples plus a replay sample of old ones.
+
+    Old examples are sampled deterministically from their key hash, so the
+    replay set is stable across reruns and the split streams in constant
+    memory (apart from trained_keys itself).
+
+    Args:
+        train_shards: Current full training shards
+        trained_keys: Keys the previous adapter was trained on
+        output_dir: Directory to write the incremental 'train' shards under
+        replay_ratio: Fraction of already-trained examples to replay
+        seed: Salt for the replay sample
+        shard_size: Examples per shard
+        compression: None, 'gzip' or 'zstd'
+
+    Returns:
+        Dict: new_examples, replay_examples, train_files and all_keys
+    """
+    all_keys = set()
+    new_examples = 0
+    replay_examples = 0
+
+    with ShardedJSONLWriter(output_dir, 'train', shard_size, compression) as writer:
+        for example in read_shards(train_shards):
+            key = example_key(example)
+            all_keys.add(key)
+
+            if key not in trained_keys:
+                writer.write(example)
+                new_examples += 1
+                continue
+
+            digest = hashlib.blake2b((seed + key).encode('utf-8'), digest_size=8).digest()
+            if int.from_bytes(digest, 'big') / 2 ** 64 < replay_ratio:
+                writer.write(example)
+                replay_examples += 1
+
+    logger.info(
+        f"Incremental split: {new_examples} new examples, {replay_examples} replayed "
+        f"({len(trained_keys)} previously trained)"
+    )
+
+    return {
+        'new_examples': new_examples,
+        'replay_examples': replay_examples,
+        'train_files': writer.shards,
+        'all_keys': all_keys,
+    }
+
+
+def latest_checkpoint(output_dir: Path) -> Optional[str]:
+    """
+    Find the highest-numbered Trainer checkpoint directory.
+
+    Args:
+        output_dir: Trainer output directory
+
+    Returns:
+        Optional[str]: Checkpoint path, or None if there are none
+    """
+    output_dir = Path(output_dir)
+    if not output_dir.is_dir():
+        return None
+
+    checkpoints = [
+        (int(match.group(1)), path)
+        for path in output_dir.iterdir()
+        if path.is_dir() and (match := _CHECKPOINT_DIR.match(path.name))
+    ]
+    if not checkpoints:
+        return None
+    return str(max(checkpoints)[1])
+
+
+def checkpoint_tokens_seen(checkpoint: Optional[str]) -> int:
+    """
+    Read how many input tokens a run had processed when a checkpoint was saved.
+
+    Args:
+        checkpoint: Checkpoint directory (None for a fresh run)
+
+    Returns:
+        int: num_input_tokens_seen from its trainer_state.json, or 0
+    """
+    if not checkpoint:
+        return 0
+    try:
+        with open(Path(checkpoint) / 'trainer_state.json', 'r', encoding='utf-8') as f:
+            return int(json.load(f).get('num_input_tokens_seen') or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def start_run(output_dir: Path, run_key: str, keep_checkpoints: bool = False) -> Optional[str]:
+    """
+    Begin a training run, returning the checkpoint to resume from if any.
+
+    A run marker is written at start and removed by finish_run(). If a marker
+    with the same run_key is still present, the previous run was interrupted
+    and training resumes from its latest checkpoint. Otherwise stale
+    checkpoints from earlier runs are removed so they cannot be mistaken for
+    this run's progress.
+
+    Args:
+        output_dir: Trainer output directory
+        run_key: Identifies the data and settings of this run
+        keep_checkpoints: Never delete existing checkpoints (the caller is
+            resuming from one explicitly)
+
+    Returns:
+        Optional[str]: Checkpoint path to pass to Trainer.train()
+    """
+    output_dir = Path(output_dir)
+    marker_path = output_dir / RUN_MARKER_NAME
+
+    previous_key = None
+    if marker_path.exists():
+        try:
+            with open(marker_path, 'r', encoding='utf-8') as f:
+                previous_key = json.load(f).get('run_key')
+        except (OSError, ValueError):
+            previous_key = None
+
+    resume_from = None
+    if previous_key == run_key:
+        resume_from = latest_checkpoint(output_dir)
+        if resume_from:
+            logger.info(f"Resuming interrupted run from {resume_from}")
+    elif not keep_checkpoints:
+        if previous_key is not None:
+            logger.info("Previous interrupted run used different data/settings; starting fresh")
+        for path in output_dir.glob('checkpoint-*'):
+            if path.is_dir() and _CHECKPOINT_DIR.match(path.name):
+                shutil.rmtree(path, ignore_errors=True)
+
+    with open(marker_path, 'w', encoding='utf-8') as f:
+        json.dump({'run_key': run_key, 'started_at': time.time()}, f)
+
+    return resume_from
+
+
+def finish_run(output_dir: Path) -> None:
+    """
+    Mark the current training run as complete.
+
+    Args:
+        output_dir: Trainer output directory
+    """
+    marker_path = Path(output_dir) / RUN_MARKER_NAME
+    if marker_path.exists():
+        marker_path.unlink()
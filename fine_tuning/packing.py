@@ -0,0 +1,153 @@
+"""
+Sequence Packing and Padding Efficiency
+
+Packs tokenized examples into max_length blocks with per-example position_ids,
+so padding-free attention kernels (flash_attention_2) keep each example's
+attention inside its own boundaries. Other kernels ignore those boundaries,
+so FineTuneEngine only packs when flash_attention_2 is in use and falls back
+to group_by_length otherwise. Also estimates padding efficiency for the
+supported batching strategies.
+"""
+
+import random
+from typing import Dict, Any, List, Optional
+
+IGNORE_INDEX = -100
+
+STRATEGIES = ('none', 'group_by_length', 'packing')
+
+
+def pack_examples(
+    batch: Dict[str, List[List[int]]],
+    max_length: int,
+    eos_token_id: Optional[int] = None
+) -> Dict[str, List[List[int]]]:
+    """
+    Greedily pack tokenized examples into blocks of at most max_length tokens.
+
+    Intended for Dataset.map(batched=True). Examples are never split across
+    blocks. Position ids restart at 0 for every example, and the first label
+    of each example after the first is masked so the model is never trained to
+    predict one example from the tail of another.
+
+    Args:
+        batch: Batched tokenizer output with 'input_ids'
+        max_length: Block size in tokens
+        eos_token_id: Appended to each example when it still fits
+
+    Returns:
+        Dict: 'input_ids', 'position_ids', 'labels' and 'length' per block
+    """
+    packed = {'input_ids': [], 'position_ids': [], 'labels': [], 'length': []}
+    block_ids: List[int] = []
+    block_positions: List[int] = []
+    block_labels: List[int] = []
+
+    def flush():
+        if block_ids:
+            packed['input_ids'].append(list(block_ids))
+            packed['position_ids'].append(list(block_positions))
+            packed['labels'].append(list(block_labels))
+            packed['length'].append(len(block_ids))
+            block_ids.clear()
+            block_positions.clear()
+            block_labels.clear()
+
+    for ids in batch['input_ids']:
+        ids = list(ids[:max_length])
+        if eos_token_id is not None and (not ids or ids[-1] != eos_token_id) and len(ids) < max_length:
+            ids.append(eos_token_id)
+
+        if len(block_ids) + len(ids) > max_length:
+            flush()
+
+        labels = list(ids)
+        if block_ids:
+            labels[0] = IGNORE_INDEX
+
+        block_ids.extend(ids)
+        block_positions.extend(range(len(ids)))
+        block_labels.extend(labels)
+
+    flush()
+    return packed
+
+
+class PackedDataCollator:
+    """
+    Collates packed blocks, right-padding to the longest block in the batch.
+
+    No attention_mask is emitted: example boundaries are carried by the
+    restarting position_ids, which padding-free attention implementations use
+    to keep attention within each example. Only use it with
+    flash_attention_2 (see FineTuneEngine._resolve_batching).
+    """
+
+    def __init__(self, pad_token_id: int):
+        """
+        Initialize collator.
+
+        Args:
+            pad_token_id: Token id used for padding input_ids
+        """
+        self.pad_token_id = pad_token_id
+
+    def __call__(self, features: List[Dict[str, Any]]) -> Dict[str, Any]:
+        import torch
+
+        width = max(len(f['input_ids']) for f in features)
+
+        def pad(key, value):
+            return [list(f[key]) + [value] * (width - len(f[key])) for f in features]
+
+        return {
+            'input_ids': torch.tensor(pad('input_ids', self.pad_token_id), dtype=torch.long),
+            'position_ids': torch.tensor(pad('position_ids', 0), dtype=torch.long),
+            'labels': torch.tensor(pad('labels', IGNORE_INDEX), dtype=torch.long),
+        }
+
+
+def padding_efficiency(
+    lengths: List[int],
+    batch_size: int,
+    strategy: str = 'none',
+    seed: int = 42
+) -> float:
+    """
+    Estimate the fraction of batch tokens that are real (non-padding) tokens.
+
+    Args:
+        lengths: Sequence lengths as they will be batched (packed block
+            lengths for 'packing')
+        batch_size: Per-device batch size
+        strategy: 'none' (random batches), 'group_by_length' or 'packing'
+        seed: Shuffle seed for the batch simulation
+
+    Returns:
+        float: Real tokens / total tokens, in [0, 1]
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown strategy '{strategy}'. Must be one of {STRATEGIES}")
+    if not lengths:
+        return 0.0
+
+    order = list(range(len(lengths)))
+    random.Random(seed).shuffle(order)
+
+    if strategy == 'group_by_length':
+        # Mirror transformers' LengthGroupedSampler: sort within megabatches
+        megabatch = batch_size * 50
+        order = [
+            index
+            for start in range(0, len(order), megabatch)
+            for index in sorted(order[start:start + megabatch], key=lambda i: -lengths[i])
+        ]
+
+    real = 0
+    total = 0
+    for start in range(0, len(order), batch_size):
+        batch = [lengths[i] for i in order[start:start + batch_size]]
+        real += sum(batch)
+        total += max(batch) * len(batch)
+
+    return real / total
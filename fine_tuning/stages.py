@@ -0,0 +1,230 @@
+"""
+Workflow Stage Cache
+
+Content-addressed caching for FineTuneEngine.run_full_workflow. Each stage
+is fingerprinted from its inputs (codebase contents, config section,
+upstream artifact hashes); a stage is skipped when the manifest holds a
+successful result for the same fingerprint and its outputs are unchanged
+on disk (or, for outputs outside the filesystem such as a deployed Ollama
+model, still pass the stage's validate check). Per-stage timings are kept
+for every run.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('dataset', 'training', 'evaluation', 'deployment')
+
+MANIFEST_NAME = 'workflow_manifest.json'
+
+# Number of past runs whose timings are kept in the manifest
+MAX_RUN_HISTORY = 50
+
+
+def fingerprint(*parts: Any) -> str:
+    """
+    Hash arbitrary JSON-serializable inputs into a stage fingerprint.
+
+    Args:
+        *parts: Inputs (config sections, upstream hashes, names)
+
+    Returns:
+        str: Hex digest
+    """
+    encoded = json.dumps(parts, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def update_digest(digest: Any, path: Path) -> Any:
+    """
+    Feed a file's contents into a hashlib object, 1 MB at a time.
+
+    Args:
+        digest: hashlib hash object
+        path: File path
+
+    Returns:
+        The same hash object
+    """
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest
+
+
+def hash_file(path: Path, name: Optional[str] = None) -> str:
+    """
+    SHA-256 of a file's contents, optionally prefixed with a name.
+
+    Args:
+        path: File path
+        name: Hashed before the contents (e.g. a relative path)
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    if name is not None:
+        digest.update(name.encode('utf-8') + b'\0')
+    return update_digest(digest, path).hexdigest()
+
+
+def hash_paths(paths: Iterable[Path]) -> str:
+    """
+    Content hash of files and directory trees.
+
+    Args:
+        paths: Files or directories (missing paths hash as absent)
+
+    Returns:
+        str: Hex digest over relative names and file contents
+    """
+    digest = hashlib.sha256()
+    for root in paths:
+        root = Path(root)
+        digest.update(str(root.name).encode('utf-8') + b'\0')
+        if not root.exists():
+            digest.update(b'<missing>')
+            continue
+
+        files = [root] if root.is_file() else sorted(p for p in root.rglob('*') if p.is_file())
+        for path in files:
+            digest.update(str(path.relative_to(root.parent)).encode('utf-8') + b'\0')
+            update_digest(digest, path)
+
+    return digest.hexdigest()
+
+
+def hash_files(paths: Iterable[Path], root: str) -> str:
+    """
+    Content hash of an explicit list of files relative to a root.
+
+    Args:
+        paths: File paths (e.g. DatasetGenerator.iter_source_files())
+        root: Directory the relative names are computed from
+
+    Returns:
+        str: Hex digest
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(os.path.relpath(path, root).encode('utf-8') + b'\0')
+        update_digest(digest, path)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Manifest of completed stages, keyed by fingerprint.
+    """
+
+    def __init__(self, output_dir: Path):
+        """
+        Initialize stage cache.
+
+        Args:
+            output_dir: Directory holding workflow_manifest.json
+        """
+        self.path = Path(output_dir) / MANIFEST_NAME
+        self.manifest = self._load()
+        self.run: Dict[str, Any] = {'started_at': time.time(), 'stages': {}}
+
+    def lookup(
+        self,
+        stage: str,
+        stage_fingerprint: str,
+        outputs: List[Path],
+        validate: Optional[Callable[[Dict[str, Any]], bool]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached result for a stage if it is still valid.
+
+        Args:
+            stage: Stage name
+            stage_fingerprint: Fingerprint of the stage's inputs
+            outputs: Artifact paths the stage produces
+            validate: Checks outputs that are not files, given the cached
+                result; False forces a re-run
+
+        Returns:
+            Optional[Dict]: Cached stage result, or None on a miss
+        """
+        entry = self.manifest['stages'].get(stage)
+        if not entry or entry['fingerprint'] != stage_fingerprint:
+            return None
+        if entry.get('outputs_hash') != hash_paths(outputs):
+            logger.info(f"Stage '{stage}' outputs changed on disk; re-running")
+            return None
+        if validate is not None and not validate(entry['result']):
+            logger.info(f"Stage '{stage}' outputs are missing or were replaced; re-running")
+            return None
+        return entry['result']
+
+    def record(
+        self,
+        stage: str,
+        stage_fingerprint: str,
+        outputs: List[Path],
+        result: Dict[str, Any],
+        seconds: float
+    ) -> None:
+        """
+        Record a successful stage execution.
+
+        Args:
+            stage: Stage name
+            stage_fingerprint: Fingerprint of the stage's inputs
+            outputs: Artifact paths the stage produced
+            result: Stage result dictionary
+            seconds: Wall time of the stage
+        """
+        self.manifest['stages'][stage] = {
+            'fingerprint': stage_fingerprint,
+            'outputs_hash': hash_paths(outputs),
+            'result': result,
+            'seconds': seconds,
+            'completed_at': time.time(),
+        }
+        self.save()
+
+    def timing(self, stage: str, status: str, seconds: float = 0.0) -> None:
+        """
+        Record how a stage was handled in the current run.
+
+        Args:
+            stage: Stage name
+            status: 'ran', 'cached', 'skipped' or 'failed'
+            seconds: Wall time spent (including cache checks)
+        """
+        self.run['stages'][stage] = {'status': status, 'seconds': seconds}
+
+    def save(self) -> None:
+        """Atomically write the manifest, including the current run's timings."""
+        runs = [r for r in self.manifest['runs'] if r.get('started_at') != self.run['started_at']]
+        runs.append(self.run)
+        self.manifest['runs'] = runs[-MAX_RUN_HISTORY:]
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, indent=2, default=str)
+        os.replace(tmp_path, self.path)
+
+    def _load(self) -> Dict[str, Any]:
+        """Load the manifest, tolerating a missing or corrupt file."""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = {}
+
+        manifest.setdefault('stages', {})
+        manifest.setdefault('runs', [])
+        return manifest
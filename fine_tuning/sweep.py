@@ -0,0 +1,536 @@
+"""
+LoRA Hyperparameter Sweep
+
+Runs FineTuneEngine trials over a search space of fine_tuning config values
+(e.g. lora_config.r, lora_config.lora_alpha, training.learning_rate):
+- trials run as separate processes, packed onto GPUs by estimated memory or
+  onto CPU cores by thread count
+- successive halving: every trial trains for a small epoch budget, and only
+  the best 1/eta by eval loss continue (from their latest checkpoint) to the
+  next, larger budget
+- all trials share dataset_dir; the tokenized dataset cache is built once
+  in the parent before the first rung (per distinct tokenization setting)
+  and memory-mapped by every trial
+- a leaderboard (JSON and Markdown) is written to the sweep directory
+
+Example config (fine_tuning.sweep in llm_config.yaml):
+
+    sweep:
+      output_dir: ./models/sweep
+      num_trials: 8
+      search_space:
+        lora_config.r: [8, 16, 32]
+        lora_config.lora_alpha: [16, 32]
+        training.learning_rate: {low: 1.0e-5, high: 5.0e-4, log: true}
+      halving: {min_epochs: 1, max_epochs: 3, eta: 3}
+      resources: {trial_memory_gb: 10, cpu_threads_per_trial: 4}
+"""
+
+import copy
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import yaml
+
+import structured_logging
+
+logger = logging.getLogger(__name__)
+
+LEADERBOARD_NAME = 'leaderboard'
+
+# Seconds between checks on running trial processes
+POLL_INTERVAL = 2.0
+
+
+def expand_search_space(
+    search_space: Dict[str, Any],
+    num_trials: Optional[int] = None,
+    seed: int = 0
+) -> List[Dict[str, Any]]:
+    """
+    Turn a search space into a list of trial parameter sets.
+
+    Values are either a list of choices or a range {low, high, log}. With
+    only choices and no num_trials (or a grid no larger than num_trials) the
+    full grid is returned; otherwise num_trials random samples are drawn.
+
+    Args:
+        search_space: Dotted fine_tuning config path -> choices or range
+        num_trials: Number of random trials
+        seed: Sampling seed
+
+    Returns:
+        List[Dict]: One {path: value} dict per trial
+
+    Raises:
+        ValueError: If ranges are used without num_trials or a spec is invalid
+    """
+    for path, spec in search_space.items():
+        if isinstance(spec, dict) and not {'low', 'high'} <= set(spec):
+            raise ValueError(f"Range for '{path}' needs 'low' and 'high'")
+        if not isinstance(spec, (dict, list)) or spec == []:
+            raise ValueError(f"Search space entry '{path}' must be a non-empty list or a range")
+
+    paths = sorted(search_space)
+    has_ranges = any(isinstance(search_space[p], dict) for p in paths)
+
+    if not has_ranges:
+        grid_size = math.prod(len(search_space[p]) for p in paths)
+        if num_trials is None or grid_size <= num_trials:
+            return [
+                dict(zip(paths, values))
+                for values in itertools.product(*(search_space[p] for p in paths))
+            ]
+    elif num_trials is None:
+        raise ValueError("sweep.num_trials is required when the search space contains ranges")
+
+    rng = random.Random(seed)
+    trials = []
+    for _ in range(num_trials):
+        params = {}
+        for path in paths:
+            spec = search_space[path]
+            if isinstance(spec, list):
+                params[path] = rng.choice(spec)
+            elif spec.get('log'):
+                params[path] = math.exp(rng.uniform(math.log(spec['low']), math.log(spec['high'])))
+            elif isinstance(spec['low'], int) and isinstance(spec['high'], int):
+                params[path] = rng.randint(spec['low'], spec['high'])
+            else:
+                params[path] = rng.uniform(spec['low'], spec['high'])
+        trials.append(params)
+    return trials
+
+
+def halving_budgets(min_epochs: float, max_epochs: float, eta: int) -> List[float]:
+    """
+    Epoch budget of each successive halving rung.
+
+    Args:
+        min_epochs: Budget of the first rung
+        max_epochs: Budget of the final rung
+        eta: Budget growth (and survivor reduction) factor per rung
+
+    Returns:
+        List[float]: Increasing budgets ending at max_epochs
+    """
+    if eta < 2:
+        raise ValueError("halving.eta must be at least 2")
+
+    budgets = []
+    budget = min_epochs
+    while budget < max_epochs:
+        budgets.append(budget)
+        budget *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+
+def set_config_value(config: Dict[str, Any], path: str, value: Any) -> None:
+    """
+    Set a dotted path (e.g. 'lora_config.r') in a nested config dict.
+
+    Args:
+        config: Config dictionary to modify in place
+        path: Dotted key path
+        value: Value to set
+    """
+    *parents, leaf = path.split('.')
+    for key in parents:
+        config = config.setdefault(key, {})
+    config[leaf] = value
+
+
+def detect_slots(resources: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Describe the devices trials can be packed onto.
+
+    Each CUDA device is one slot whose capacity is its memory in GB; without
+    CUDA there is a single CPU slot whose capacity is the core count.
+
+    Args:
+        resources: fine_tuning.sweep.resources section
+
+    Returns:
+        List[Dict]: Slots with name, device, env, capacity and used
+    """
+    import torch
+
+    if torch.cuda.is_available() and resources.get('device', 'auto') != 'cpu':
+        slots = []
+        for index in range(torch.cuda.device_count()):
+            total_gb = torch.cuda.get_device_properties(index).total_memory / 1024 ** 3
+            slots.append({
+                'name': f'cuda:{index}',
+                'device': 'cuda',
+                'env': {'CUDA_VISIBLE_DEVICES': str(index)},
+                'capacity': resources.get('gpu_memory_gb') or total_gb,
+                'used': 0.0,
+            })
+        return slots
+
+    return [{
+        'name': 'cpu',
+        'device': 'cpu',
+        'env': {'CUDA_VISIBLE_DEVICES': ''},
+        'capacity': float(resources.get('cpu_cores') or os.cpu_count() or 1),
+        'used': 0.0,
+    }]
+
+
+class SweepRunner:
+    """
+    Parallel successive-halving sweep over FineTuneEngine trials.
+    """
+
+    def __init__(self, config_path: Optional[str] = None):
+        """
+        Initialize sweep runner.
+
+        Args:
+            config_path: Path to llm_config.yaml (uses default if None)
+        """
+        if config_path is None:
+            config_path = Path(__file__).parent.parent / 'config' / 'llm_config.yaml'
+
+        with open(config_path, 'r') as f:
+            self.config = yaml.safe_load(f)
+
+        ft_config = self.config.get('fine_tuning', {})
+        self.sweep_config = ft_config.get('sweep', {})
+        if not self.sweep_config.get('search_space'):
+            raise ValueError("fine_tuning.sweep.search_space is not configured")
+
+        self.sweep_dir = Path(self.sweep_config.get('output_dir', './models/sweep')).resolve()
+        self.resources = self.sweep_config.get('resources', {})
+
+        halving = self.sweep_config.get('halving', {})
+        self.eta = halving.get('eta', 3)
+        self.budgets = halving_budgets(
+            halving.get('min_epochs', 1),
+            halving.get('max_epochs', ft_config.get('training', {}).get('num_epochs', 3)),
+            self.eta
+        )
+
+        # Share the base dataset (and its tokenized cache) across all trials
+        self.dataset_dir = str(Path(ft_config.get('dataset_dir', './data/training')).resolve())
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Run the sweep.
+
+        Returns:
+            Dict: success, best trial, leaderboard and sweep_dir
+        """
+        params = expand_search_space(
+            self.sweep_config['search_space'],
+            self.sweep_config.get('num_trials'),
+            self.sweep_config.get('seed', 0)
+        )
+        self.sweep_dir.mkdir(parents=True, exist_ok=True)
+
+        trials = [
+            {'id': f'trial-{index:03d}', 'params': p, 'status': 'pending', 'rung': -1,
+             'epochs': 0, 'eval_loss': None, 'seconds': 0.0}
+            for index, p in enumerate(params)
+        ]
+        logger.info(f"Sweep: {len(trials)} trials, epoch budgets {self.budgets}, eta={self.eta}")
+        self._prepare_datasets(trials)
+
+        survivors = trials
+        for rung, epochs in enumerate(self.budgets):
+            logger.info(f"Rung {rung}: training {len(survivors)} trials for {epochs} epochs")
+            self._run_rung(survivors, rung, epochs)
+
+            finished = sorted(
+                (t for t in survivors if t['status'] == 'active'),
+                key=lambda t: t['eval_loss']
+            )
+            if rung == len(self.budgets) - 1:
+                for trial in finished:
+                    trial['status'] = 'completed'
+                break
+
+            keep = max(1, len(finished) // self.eta)
+            for trial in finished[keep:]:
+                trial['status'] = 'stopped'
+                logger.info(f"Stopping {trial['id']} at rung {rung} (eval_loss={trial['eval_loss']:.4f})")
+            survivors = finished[:keep]
+            self._write_leaderboard(trials)
+
+            if not survivors:
+                break
+
+        leaderboard = self._write_leaderboard(trials)
+        best = next((t for t in leaderboard if t['status'] == 'completed'), None)
+        if best:
+            logger.info(f"Best trial {best['id']}: eval_loss={best['eval_loss']:.4f} {best['params']}")
+
+        return {
+            'success': best is not None,
+            'best': best,
+            'leaderboard': leaderboard,
+            'sweep_dir': str(self.sweep_dir),
+            **({} if best else {'error': 'No trial completed successfully'})
+        }
+
+    def _prepare_datasets(self, trials: List[Dict[str, Any]]) -> None:
+        """
+        Build the tokenized dataset cache once for every tokenization setting.
+
+        Note:
+            Trials that start together would otherwise all miss the cache and
+            tokenize the same data concurrently. A failure here is only
+            logged; the trials then tokenize for themselves.
+        """
+        from .engine import FineTuneEngine
+
+        prepare_dir = self.sweep_dir / 'prepare'
+        prepare_dir.mkdir(parents=True, exist_ok=True)
+
+        settings = {}
+        for trial in trials:
+            ft_config = self._trial_config(trial)['fine_tuning']
+            training = ft_config.get('training', {})
+            signature = json.dumps([
+                ft_config.get('base_model'),
+                ft_config.get('base_model_revision'),
+                training.get('max_length'),
+                training.get('batching')
+            ], default=str)
+            settings.setdefault(signature, trial)
+
+        for index, trial in enumerate(settings.values()):
+            config = self._trial_config(trial)
+            config['fine_tuning']['output_dir'] = str(prepare_dir)
+            config_path = prepare_dir / f'config-{index}.yaml'
+            with open(config_path, 'w') as f:
+                yaml.safe_dump(config, f, sort_keys=False)
+
+            start = time.perf_counter()
+            result = FineTuneEngine(str(config_path)).prepare_dataset()
+            if result['success']:
+                logger.info(f"Tokenized dataset {result['key']} ready in {time.perf_counter() - start:.1f}s")
+            else:
+                logger.warning(f"Could not pre-build the tokenized dataset: {result['error']}")
+
+    def _trial_cost(self, trial: Dict[str, Any], slot: Dict[str, Any]) -> float:
+        """Estimated resource use of a trial on a slot (GB on GPU, threads on CPU)."""
+        if slot['device'] == 'cpu':
+            cost = self.resources.get('cpu_threads_per_trial', max(1, int(slot['capacity']) // 4))
+        else:
+            # Activation memory grows with batch size and sequence length
+            base = self.config.get('fine_tuning', {}).get('training', {})
+            training = self._trial_config(trial)['fine_tuning'].get('training', {})
+            scale = (training.get('batch_size', 4) * training.get('max_length', 512)) / (
+                base.get('batch_size', 4) * base.get('max_length', 512)
+            )
+            cost = self.resources.get('trial_memory_gb', 10) * scale
+
+        # A trial larger than any slot still runs, alone
+        return min(cost, slot['capacity'])
+
+    def _find_slot(self, trial: Dict[str, Any], slots: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Best-fit slot with room for the trial, or None."""
+        fitting = [
+            slot for slot in slots
+            if slot['capacity'] - slot['used'] >= self._trial_cost(trial, slot)
+        ]
+        if not fitting:
+            return None
+        return min(fitting, key=lambda slot: slot['capacity'] - slot['used'] - self._trial_cost(trial, slot))
+
+    def _trial_config(self, trial: Dict[str, Any]) -> Dict[str, Any]:
+        """Full config for a trial with its parameters applied."""
+        config = copy.deepcopy(self.config)
+        ft_config = config.setdefault('fine_tuning', {})
+        ft_config.pop('sweep', None)
+        for path, value in trial['params'].items():
+            set_config_value(ft_config, path, value)
+        ft_config['output_dir'] = str(self.sweep_dir / trial['id'])
+        ft_config['dataset_dir'] = self.dataset_dir
+        return config
+
+    def _launch(self, trial: Dict[str, Any], slot: Dict[str, Any], rung: int, epochs: float, cost: float):
+        """Write the trial config and start its process."""
+        trial_dir = self.sweep_dir / trial['id']
+        trial_dir.mkdir(parents=True, exist_ok=True)
+
+        config = self._trial_config(trial)
+        training = config['fine_tuning'].setdefault('training', {})
+        training['num_epochs'] = epochs
+        if rung > 0:
+            training['resume_from_checkpoint'] = 'latest'
+
+        # Run from the current directory so relative config paths keep their meaning
+        package_root = str(Path(__file__).parent.parent)
+        env = {**os.environ, **slot['env']}
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [package_root, env.get('PYTHONPATH')]))
+        if slot['device'] == 'cpu':
+            threads = int(cost)
+            training['device'] = 'cpu'
+            training.setdefault('cpu', {}).update({
+                'intra_op_threads': threads,
+                'inter_op_threads': 1,
+                'dataloader_workers': 0,
+            })
+            training['tokenize_num_proc'] = threads
+            env['OMP_NUM_THREADS'] = str(threads)
+        else:
+            training['device'] = 'cuda'
+
+        config_path = trial_dir / f'config-rung{rung}.yaml'
+        with open(config_path, 'w') as f:
+            yaml.safe_dump(config, f, sort_keys=False)
+
+        result_path = trial_dir / f'result-rung{rung}.json'
+        log_handle = open(trial_dir / f'rung{rung}.log', 'w')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'fine_tuning.sweep', 'run-trial', str(config_path), str(result_path)],
+            env=env,
+            stdout=log_handle,
+            stderr=subprocess.STDOUT
+        )
+        logger.info(f"Launched {trial['id']} rung {rung} on {slot['name']} ({cost:g} {self._unit(slot)})")
+        return process, log_handle, result_path
+
+    def _run_rung(self, trials: List[Dict[str, Any]], rung: int, epochs: float) -> None:
+        """Run every trial of a rung, packing as many as fit at once."""
+        slots = detect_slots(self.resources)
+        pending = sorted(
+            trials,
+            key=lambda t: max(self._trial_cost(t, slot) for slot in slots),
+            reverse=True
+        )
+        running = []
+
+        while pending or running:
+            for trial in list(pending):
+                slot = self._find_slot(trial, slots)
+                if slot is None:
+                    continue
+                cost = self._trial_cost(trial, slot)
+                slot['used'] += cost
+                process, log_handle, result_path = self._launch(trial, slot, rung, epochs, cost)
+                running.append((trial, slot, cost, process, log_handle, result_path, time.time()))
+                pending.remove(trial)
+
+            time.sleep(POLL_INTERVAL)
+
+            for entry in list(running):
+                trial, slot, cost, process, log_handle, result_path, started = entry
+                if process.poll() is None:
+                    continue
+
+                log_handle.close()
+                slot['used'] -= cost
+                running.remove(entry)
+                trial['seconds'] += time.time() - started
+                self._record_result(trial, rung, epochs, process.returncode, result_path)
+
+    def _record_result(self, trial: Dict[str, Any], rung: int, epochs: float, returncode: int, result_path: Path) -> None:
+        """Update a trial from its result file."""
+        result = {}
+        if result_path.exists():
+            with open(result_path, 'r', encoding='utf-8') as f:
+                result = json.load(f)
+
+        eval_loss = (result.get('eval_metrics') or {}).get('eval_loss')
+        if returncode != 0 or not result.get('success') or eval_loss is None:
+            trial['status'] = 'failed'
+            trial['error'] = result.get('error') or f"exit code {returncode}, see {result_path.parent}/rung{rung}.log"
+            logger.warning(f"{trial['id']} failed at rung {rung}: {trial['error']}")
+            return
+
+        trial.update({
+            'status': 'active',
+            'rung': rung,
+            'epochs': epochs,
+            'eval_loss': eval_loss,
+            'adapter_path': result.get('adapter_path'),
+            'tokens_per_second': result.get('tokens_per_second'),
+        })
+        logger.info(f"{trial['id']} rung {rung}: eval_loss={eval_loss:.4f}")
+
+    def _write_leaderboard(self, trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Rank trials (furthest rung first, then eval loss) and write leaderboard files."""
+        leaderboard = sorted(
+            trials,
+            key=lambda t: (-t['rung'], t['eval_loss'] if t['eval_loss'] is not None else math.inf)
+        )
+
+        with open(self.sweep_dir / f'{LEADERBOARD_NAME}.json', 'w', encoding='utf-8') as f:
+            json.dump(leaderboard, f, indent=2, default=str)
+
+        param_names = sorted({name for t in trials for name in t['params']})
+        lines = [
+            '| rank | trial | status | epochs | eval_loss | ' + ' | '.join(param_names) + ' |',
+            '|' + ' --- |' * (5 + len(param_names)),
+        ]
+        for rank, t in enumerate(leaderboard, 1):
+            loss = f"{t['eval_loss']:.4f}" if t['eval_loss'] is not None else '-'
+            values = [f"{t['params'].get(name):.3g}" if isinstance(t['params'].get(name), float)
+                      else str(t['params'].get(name)) for name in param_names]
+            lines.append(f"| {rank} | {t['id']} | {t['status']} | {t['epochs']} | {loss} | " + ' | '.join(values) + ' |')
+
+        with open(self.sweep_dir / f'{LEADERBOARD_NAME}.md', 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        return leaderboard
+
+    @staticmethod
+    def _unit(slot: Dict[str, Any]) -> str:
+        return 'threads' if slot['device'] == 'cpu' else 'GB'
+
+
+def _run_trial(config_path: str, result_path: str) -> int:
+    """Train one trial in this process and write its result."""
+    from .engine import FineTuneEngine
+
+    result = FineTuneEngine(config_path).train()
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, default=str)
+    return 0 if result.get('success') else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point.
+
+    Usage:
+        python -m fine_tuning.sweep [--config llm_config.yaml]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Parallel LoRA hyperparameter sweep')
+    parser.add_argument('--config', help='Path to llm_config.yaml')
+    subparsers = parser.add_subparsers(dest='command')
+
+    # Internal: used by SweepRunner to run a single trial process
+    trial_parser = subparsers.add_parser('run-trial')
+    trial_parser.add_argument('trial_config')
+    trial_parser.add_argument('result_path')
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    structured_logging.configure(command='fine_tuning.sweep')
+
+    if args.command == 'run-trial':
+        return _run_trial(args.trial_config, args.result_path)
+
+    result = SweepRunner(args.config).run()
+    print(json.dumps({k: v for k, v in result.items() if k != 'leaderboard'}, indent=2, default=str))
+    return 0 if result['success'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
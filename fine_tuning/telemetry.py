@@ -0,0 +1,235 @@
+"""
+Training Performance Telemetry
+
+Trainer callback that streams per-step performance records (step time,
+data-wait vs compute split, tokens/s, memory high-water marks) to JSONL,
+plus a summarizer that flags input-pipeline bottlenecks.
+
+Usage:
+    python -m fine_tuning.telemetry models/fine-tuned/perf.jsonl
+"""
+
+import json
+import logging
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+try:
+    from transformers import TrainerCallback
+except ImportError:  # summarizer works without transformers installed
+    TrainerCallback = object
+
+logger = logging.getLogger(__name__)
+
+PERF_LOG_NAME = 'perf.jsonl'
+
+# Fraction of step time spent waiting on data above which we flag the input pipeline
+DATA_WAIT_THRESHOLD = 0.15
+
+
+def _peak_rss_mb() -> float:
+    """Process peak resident set size in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class PerformanceCallback(TrainerCallback):
+    """
+    Streams one JSONL record per optimizer step to output_dir/perf.jsonl.
+
+    Data wait is the time between the end of one step and the start of the
+    next (dataloader fetch + collation); compute is the time inside the step.
+    Evaluation, checkpoint saves and logging run after on_step_end, so their
+    time is recorded as overhead on the following step rather than as data
+    wait.
+    Token counts come from state.num_input_tokens_seen, so TrainingArguments
+    must set include_num_input_tokens_seen=True.
+    """
+
+    def __init__(self, output_dir: Path, flush_every: int = 20):
+        """
+        Initialize callback.
+
+        Args:
+            output_dir: Directory to write perf.jsonl into
+            flush_every: Number of records buffered between writes
+        """
+        self.path = Path(output_dir) / PERF_LOG_NAME
+        self.flush_every = flush_every
+
+        self._buffer: List[str] = []
+        self._handle = None
+        self._step_start: Optional[float] = None
+        self._step_end: Optional[float] = None
+        self._overhead = 0.0
+        self._tokens_seen = 0
+        self._peak_vram_mb = 0.0
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        if state.is_world_process_zero:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = open(self.path, 'w', encoding='utf-8')
+        self._step_end = time.perf_counter()
+        self._tokens_seen = getattr(state, 'num_input_tokens_seen', 0) or 0
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_start = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        now = time.perf_counter()
+        data_wait = (self._step_start - self._step_end) if self._step_end is not None else 0.0
+        compute = now - self._step_start
+        overhead, self._overhead = self._overhead, 0.0
+        step_time = data_wait + compute + overhead
+
+        vram_mb = None
+        try:
+            import torch
+
+            if torch.cuda.is_available():
+                vram_mb = torch.cuda.max_memory_allocated() / (1024 * 1024)
+                self._peak_vram_mb = max(self._peak_vram_mb, vram_mb)
+                torch.cuda.reset_peak_memory_stats()
+        except ImportError:
+            pass
+
+        tokens_seen = getattr(state, 'num_input_tokens_seen', 0) or 0
+        step_tokens = tokens_seen - self._tokens_seen
+        self._tokens_seen = tokens_seen
+
+        record = {
+            'step': state.global_step,
+            'epoch': state.epoch,
+            'wall_time': time.time(),
+            'step_time': step_time,
+            'data_wait': data_wait,
+            'compute': compute,
+            'overhead': overhead,
+            'tokens': step_tokens,
+            'tokens_per_second': step_tokens / step_time if step_time > 0 else 0.0,
+            'peak_rss_mb': _peak_rss_mb(),
+            'step_peak_vram_mb': vram_mb,
+            'peak_vram_mb': self._peak_vram_mb if vram_mb is not None else None,
+        }
+        self._write(record)
+        self._step_end = time.perf_counter()
+
+    def on_evaluate(self, args, state, control, **kwargs):
+        self._mark_overhead()
+
+    def on_save(self, args, state, control, **kwargs):
+        self._mark_overhead()
+
+    def on_log(self, args, state, control, **kwargs):
+        self._mark_overhead()
+
+    def _mark_overhead(self) -> None:
+        """Count time since the last step ended as eval/save/log overhead, not data wait."""
+        if self._step_end is not None:
+            now = time.perf_counter()
+            self._overhead += now - self._step_end
+            self._step_end = now
+
+    def on_train_end(self, args, state, control, **kwargs):
+        self._flush()
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        """Buffer a record, flushing periodically."""
+        if self._handle is None:
+            return
+        self._buffer.append(json.dumps(record))
+        if len(self._buffer) >= self.flush_every:
+            self._flush()
+
+    def _flush(self) -> None:
+        """Write buffered records to disk."""
+        if self._handle is not None and self._buffer:
+            self._handle.write('\n'.join(self._buffer) + '\n')
+            self._handle.flush()
+            self._buffer.clear()
+
+
+def summarize_performance(path: Path, skip_steps: int = 2) -> Dict[str, Any]:
+    """
+    Summarize a perf.jsonl file and flag likely bottlenecks.
+
+    Args:
+        path: Path to perf.jsonl
+        skip_steps: Warm-up steps to exclude from the summary
+
+    Returns:
+        Dict: Step time percentiles, throughput, data-wait and eval/save
+            overhead fractions, memory high-water marks and a list of findings
+    """
+    records = []
+    if not Path(path).exists():
+        return {'steps': 0, 'findings': ['No step records found']}
+
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                records.append(json.loads(line))
+
+    records = records[skip_steps:] if len(records) > skip_steps else records
+    if not records:
+        return {'steps': 0, 'findings': ['No step records found']}
+
+    step_times = sorted(r['step_time'] for r in records)
+    total_time = sum(step_times)
+    total_wait = sum(r['data_wait'] for r in records)
+    total_overhead = sum(r.get('overhead', 0.0) for r in records)
+    total_tokens = sum(r['tokens'] for r in records)
+    wait_fraction = total_wait / total_time if total_time else 0.0
+    vram = [r['peak_vram_mb'] for r in records if r.get('peak_vram_mb') is not None]
+
+    summary = {
+        'steps': len(records),
+        'step_time_p50': statistics.median(step_times),
+        'step_time_p95': step_times[min(len(step_times) - 1, int(len(step_times) * 0.95))],
+        'tokens_per_second': total_tokens / total_time if total_time else 0.0,
+        'data_wait_fraction': wait_fraction,
+        'overhead_fraction': total_overhead / total_time if total_time else 0.0,
+        'peak_rss_mb': max(r['peak_rss_mb'] for r in records),
+        'peak_vram_mb': max(vram) if vram else None,
+        'findings': [],
+    }
+
+    if wait_fraction > DATA_WAIT_THRESHOLD:
+        summary['findings'].append(
+            f"Input pipeline bottleneck: {wait_fraction:.0%} of step time is spent waiting "
+            "for data. Increase dataloader_num_workers, enable the tokenized dataset cache, "
+            "or move preprocessing out of the data collator."
+        )
+
+    if summary['step_time_p95'] > 2 * summary['step_time_p50']:
+        summary['findings'].append(
+            "Step times are highly variable (p95 > 2x median); check for evaluation, "
+            "checkpointing or memory pressure stalls."
+        )
+
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Print a summary for a perf.jsonl file."""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Summarize fine-tuning performance telemetry')
+    parser.add_argument('path', help='Path to perf.jsonl')
+    parser.add_argument('--skip-steps', type=int, default=2, help='Warm-up steps to ignore')
+    args = parser.parse_args(argv)
+
+    print(json.dumps(summarize_performance(Path(args.path), args.skip_steps), indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
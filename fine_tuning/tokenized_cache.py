@@ -0,0 +1,129 @@
+"""
+Tokenized Dataset Cache
+
+Persists tokenized datasets as Arrow on disk, keyed by the content hashes of
+the dataset shards, the tokenizer identity and the tokenization settings.
+Cache hits are memory-mapped with datasets.load_from_disk, so repeated
+training runs skip tokenization entirely.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+from typing import Dict, Any, Callable, List, Optional
+
+from .stages import hash_file
+
+logger = logging.getLogger(__name__)
+
+# Bump when the prompt format or tokenization logic changes
+TOKENIZATION_VERSION = 2
+
+
+def cache_key(
+    data_files: Dict[str, List[str]],
+    tokenizer: Any,
+    max_length: int,
+    revision: Optional[str] = None,
+    extra: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Compute the cache key for a tokenized dataset.
+
+    Args:
+        data_files: Split name mapped to shard paths
+        tokenizer: Hugging Face tokenizer
+        max_length: Maximum sequence length used for tokenization
+        revision: Tokenizer/model revision (branch, tag or commit)
+        extra: Additional settings that change the tokenized output
+
+    Returns:
+        str: Hex digest identifying the tokenized dataset
+    """
+    payload = {
+        'version': TOKENIZATION_VERSION,
+        'shards': {
+            split: [hash_file(path) for path in paths]
+            for split, paths in sorted(data_files.items())
+        },
+        'tokenizer': {
+            'name': getattr(tokenizer, 'name_or_path', None),
+            'class': type(tokenizer).__name__,
+            'vocab_size': len(tokenizer),
+            'revision': revision or 'main',
+        },
+        'max_length': max_length,
+        'extra': extra or {},
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()[:32]
+
+
+def load_tokenized_dataset(
+    data_files: Dict[str, List[str]],
+    transform: Callable[[Any, Optional[int]], Any],
+    cache_dir: Path,
+    key: str,
+    num_proc: Optional[int] = None,
+    keep: int = 3
+):
+    """
+    Load a tokenized dataset from cache, tokenizing and saving it on a miss.
+
+    Args:
+        data_files: Split name mapped to JSONL shard paths
+        transform: Function taking the raw DatasetDict and num_proc and
+            returning the tokenized DatasetDict (called only on a cache miss)
+        cache_dir: Root directory for cached datasets
+        key: Cache key from cache_key()
+        num_proc: Processes for tokenization on a miss
+        keep: Number of most recent cache entries to retain
+
+    Returns:
+        DatasetDict: Memory-mapped tokenized dataset
+    """
+    from datasets import load_dataset, load_from_disk
+
+    cache_dir = Path(cache_dir)
+    entry = cache_dir / key
+
+    if (entry / 'dataset_dict.json').exists():
+        logger.info(f"Tokenized dataset cache hit: {entry}")
+        os.utime(entry)
+        return load_from_disk(str(entry))
+
+    logger.info(f"Tokenized dataset cache miss; tokenizing with num_proc={num_proc}")
+    raw = load_dataset('json', data_files=data_files)
+    tokenized = transform(raw, num_proc)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_entry = cache_dir / f".{key}.{os.getpid()}.tmp"
+    if tmp_entry.exists():
+        shutil.rmtree(tmp_entry)
+    tokenized.save_to_disk(str(tmp_entry))
+    try:
+        os.replace(tmp_entry, entry)
+    except OSError:
+        # Another process (e.g. a parallel sweep trial) published this key first
+        logger.info(f"Tokenized dataset {key} was cached concurrently; using existing entry")
+        shutil.rmtree(tmp_entry, ignore_errors=True)
+
+    _prune(cache_dir, keep)
+
+    # Reload so training reads the memory-mapped Arrow files, not in-memory tables
+    return load_from_disk(str(entry))
+
+
+def _prune(cache_dir: Path, keep: int) -> None:
+    """Remove all but the `keep` most recently used cache entries."""
+    entries = sorted(
+        (p for p in cache_dir.iterdir() if p.is_dir() and not p.name.startswith('.')),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True
+    )
+    for stale in entries[keep:]:
+        logger.debug(f"Pruning tokenized cache entry {stale}")
+        shutil.rmtree(stale, ignore_errors=True)
@@ -46,6 +46,8 @@ echo "📊 Installing logging system..."
 cp "$SCRIPT_DIR/logging-system.sh" "$COMMANDS_DIR/logging-system.sh"
 cp "$SCRIPT_DIR/command-wrapper.sh" "$COMMANDS_DIR/command-wrapper.sh"
 cp "$SCRIPT_DIR/log-viewer.sh" "$COMMANDS_DIR/log-viewer.sh"
+rm -rf "$COMMANDS_DIR/structured_logging"
+cp -R "$SCRIPT_DIR/structured_logging" "$COMMANDS_DIR/structured_logging"
 chmod +x "$COMMANDS_DIR/logging-system.sh"
 chmod +x "$COMMANDS_DIR/command-wrapper.sh"
 chmod +x "$COMMANDS_DIR/log-viewer.sh"
@@ -108,7 +110,8 @@ echo "🔗 Setting up Claude auto-install hooks..."
 "$COMMANDS_DIR/setup-claude-hooks.sh"
 
 # Create initial log entry
-echo "$(date '+%Y-%m-%d %H:%M:%S') [INFO] [INSTALLER] Claude Subagents installed successfully" >> "$LOG_DIR/subagent-commands.log"
+PYTHONPATH="$COMMANDS_DIR" python3 -m structured_logging.cli --log-dir "$LOG_DIR" \
+    emit INFO INSTALLER "Claude Subagents installed successfully" || true
 
 # List the available commands
 echo ""
@@ -8,5 +8,9 @@ supporting both local models (via Ollama) and cloud providers (Anthropic, OpenAI
 from .provider import LLMProvider
 from .factory import LLMFactory
 from .config_loader import load_llm_config
+from .prompt_library import PromptLibrary
+from .orchestrator import Orchestrator
+from .map_reduce import MapReduceAnalyzer
+from .middleware import Middleware
 
-__all__ = ['LLMProvider', 'LLMFactory', 'load_llm_config']
+__all__ = ['LLMProvider', 'LLMFactory', 'load_llm_config', 'PromptLibrary', 'Orchestrator', 'MapReduceAnalyzer', 'Middleware']
@@ -0,0 +1,468 @@
+"""
+Anthropic Provider Implementation
+
+Cloud provider (and fallback target) backed by the Anthropic Messages API.
+
+- Prompt caching: system messages (the large, stable sub-agent definitions
+  from PromptLibrary) are sent as a cache_control block, so repeated
+  requests read them from the cache instead of paying for them again
+- Concurrent batch paced by the API's rate-limit headers: all workers share
+  one pacer that honours anthropic-ratelimit-* and retry-after
+- Streaming over SSE with deadlines, cancellation and retries (resilience.py)
+
+Point base_url at llm/stub_server.py to test or benchmark offline.
+"""
+
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional
+
+import anthropic
+import httpx
+
+from . import tracing
+from .provider import LLMProvider
+from .resilience import CancellationToken, Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = 'claude-sonnet-4-5'
+
+# Transient statuses; 529 is returned when the API is overloaded
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class RateLimitPacer:
+    """
+    Shared request pacing from configured limits and API rate-limit headers.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None):
+        """
+        Initialize pacer.
+
+        Args:
+            requests_per_minute: Client-side cap, spaces requests evenly (None = no cap)
+        """
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self.waited_seconds = 0.0
+
+    def wait(self, deadline: Optional[Deadline] = None, cancel: Optional[CancellationToken] = None) -> None:
+        """
+        Block until this request may be sent.
+
+        Args:
+            deadline: Call deadline; waiting never extends past it
+            cancel: Cancellation token, wakes the wait early
+
+        Raises:
+            DeadlineExceeded: If the wait would overrun the deadline
+            RequestCancelled: If cancelled while waiting
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot, self._paused_until)
+            self._next_slot = start + self.interval
+        delay = start - now
+        if delay <= 0:
+            return
+
+        if deadline is not None and delay >= deadline.remaining():
+            raise DeadlineExceeded(
+                f"Rate-limit pause of {delay:.1f}s exceeds the remaining {max(0.0, deadline.remaining()):.1f}s of the deadline"
+            )
+
+        self.waited_seconds += delay
+        with tracing.span('llm.queue_wait', **{'llm.queue': 'rate_limit', 'llm.wait_ms': delay * 1000}):
+            if cancel is not None:
+                if cancel.wait(delay):
+                    cancel.check()
+            else:
+                time.sleep(delay)
+
+    def update(self, headers: Any) -> None:
+        """
+        Pause everyone until the reset time when the window is used up.
+
+        Args:
+            headers: Response headers (anthropic-ratelimit-*, retry-after)
+        """
+        pause = 0.0
+        retry_after = headers.get('retry-after')
+        if retry_after:
+            try:
+                pause = float(retry_after)
+            except ValueError:
+                pass
+
+        for kind in ('requests', 'tokens', 'input-tokens', 'output-tokens'):
+            remaining = headers.get(f'anthropic-ratelimit-{kind}-remaining')
+            reset = headers.get(f'anthropic-ratelimit-{kind}-reset')
+            if remaining is None or reset is None:
+                continue
+            try:
+                if int(remaining) > 0:
+                    continue
+                reset_at = datetime.fromisoformat(reset.replace('Z', '+00:00')).timestamp()
+            except ValueError:
+                continue
+            pause = max(pause, reset_at - time.time())
+
+        if pause > 0:
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            logger.info(f"Anthropic rate limit reached; pausing requests for {pause:.1f}s")
+
+
+class AnthropicProvider(LLMProvider):
+    """
+    Anthropic Messages API provider with prompt caching and paced batching.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize Anthropic provider.
+
+        Args:
+            config: Provider configuration from llm_config.yaml (api_key,
+                base_url, models, settings)
+        """
+        super().__init__(config)
+
+        self.api_key = config.get('api_key')
+        self.base_url = config.get('base_url') or None
+
+        models_config = config.get('models', {})
+        self.default_model = models_config.get('default', DEFAULT_MODEL)
+
+        self.settings = config.get('settings', {})
+        self.max_tokens = self.settings.get('max_tokens', 4096)
+        self.temperature = self.settings.get('temperature')
+        self.top_p = self.settings.get('top_p')
+        self.prompt_caching = self.settings.get('prompt_caching', True)
+        self.batch_concurrency = self.settings.get('batch_concurrency', 4)
+        self.request_timeout = self.settings.get('request_timeout', 600)
+
+        # Retries are handled by resilience.py so they share the retry budget
+        self.client = anthropic.Anthropic(
+            api_key=self.api_key or 'missing',
+            base_url=self.base_url,
+            max_retries=0,
+            timeout=self.request_timeout
+        )
+        self.pacer = RateLimitPacer(self.settings.get('requests_per_minute'))
+
+        logger.info(f"Initialized Anthropic provider (default model: {self.default_model})")
+
+    def _request(self, messages: List[Dict[str, str]], model: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Build Messages API parameters.
+
+        System messages become one system block; with prompt caching it is
+        marked cache_control so identical prefixes are read from the cache.
+        """
+        system = '\n\n'.join(m['content'] for m in messages if m['role'] == 'system')
+        params: Dict[str, Any] = {
+            'model': model,
+            'max_tokens': kwargs.get('max_tokens', self.max_tokens),
+            'messages': [{'role': m['role'], 'content': m['content']} for m in messages if m['role'] != 'system'],
+        }
+        if system:
+            block: Dict[str, Any] = {'type': 'text', 'text': system}
+            if kwargs.get('prompt_caching', self.prompt_caching):
+                block['cache_control'] = {'type': 'ephemeral'}
+            params['system'] = [block]
+        if kwargs.get('stop'):
+            params['stop_sequences'] = kwargs['stop']
+
+        # Sent as extra_body: newer SDKs no longer accept sampling arguments directly
+        sampling = {
+            name: kwargs.get(name, default)
+            for name, default in (('temperature', self.temperature), ('top_p', self.top_p))
+            if kwargs.get(name, default) is not None
+        }
+        if sampling:
+            params['extra_body'] = sampling
+        return params
+
+    def _send(self, params: Dict[str, Any], deadline: Optional[Deadline], cancel: Optional[CancellationToken]):
+        """
+        One paced request attempt; returns the raw response.
+
+        Raises:
+            DeadlineExceeded: If the deadline passes while waiting for the API
+        """
+        self.pacer.wait(deadline, cancel)
+        timeout = self.request_timeout
+        if deadline is not None:
+            timeout = max(0.001, min(timeout, deadline.remaining()))
+        try:
+            raw = self.client.messages.with_raw_response.create(**params, timeout=timeout)
+        except anthropic.APIStatusError as e:
+            self.pacer.update(e.response.headers)
+            raise
+        except anthropic.APITimeoutError:
+            if deadline is not None and timeout < self.request_timeout:
+                raise DeadlineExceeded(
+                    f"Anthropic request to {params['model']} exceeded its {deadline.timeout:.1f}s deadline"
+                ) from None
+            raise
+        self.pacer.update(raw.headers)
+        return raw
+
+    def invoke(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """
+        Synchronous invocation of an Anthropic model.
+
+        Args:
+            messages: List of message dictionaries
+            model: Model name override (uses default if None)
+            **kwargs: Additional parameters (max_tokens, temperature, stop,
+                prompt_caching, deadline/timeout, cancel)
+
+        Returns:
+            str: Generated response text
+
+        Raises:
+            anthropic.APIError: If the request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes first
+            RequestCancelled: If the cancel token is triggered
+        """
+        self.validate_messages(messages)
+
+        model = model or self.default_model
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel = kwargs.pop('cancel', None)
+        params = self._request(messages, model, kwargs)
+
+        try:
+            logger.debug(f"Invoking Anthropic with model {model}")
+            start = time.perf_counter()
+            raw = self._call_with_retries(
+                lambda: self._send(params, deadline, cancel),
+                deadline,
+                cancel,
+                what=f"Anthropic request to {model}"
+            )
+            response = raw.parse()
+            self._record_usage_telemetry(model, response.usage, start)
+
+            return ''.join(block.text for block in response.content if block.type == 'text')
+
+        except anthropic.APIError as e:
+            logger.error(f"Anthropic request failed: {e}")
+            raise
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Streaming invocation of an Anthropic model.
+
+        Args:
+            messages: List of message dictionaries
+            model: Model name override (uses default if None)
+            **kwargs: Additional parameters (see invoke)
+
+        Yields:
+            str: Chunks of generated response text
+
+        Raises:
+            anthropic.APIError: If the request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes mid-stream
+            RequestCancelled: If the cancel token is triggered
+        """
+        self.validate_messages(messages)
+
+        model = model or self.default_model
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel = kwargs.pop('cancel', None)
+        params = self._request(messages, model, kwargs)
+        params['stream'] = True
+
+        logger.debug(f"Streaming from Anthropic with model {model}")
+        start = time.perf_counter()
+        try:
+            stream = self._call_with_retries(
+                lambda: self._send(params, deadline, cancel).parse(),
+                deadline,
+                cancel,
+                what=f"Anthropic stream from {model}"
+            )
+        except anthropic.APIError as e:
+            logger.error(f"Anthropic streaming failed: {e}")
+            raise
+
+        first_token = None
+        usage: Dict[str, Any] = {}
+        try:
+            for event in stream:
+                if cancel is not None:
+                    cancel.check()
+                if deadline is not None:
+                    deadline.check(f"Anthropic stream from {model}")
+
+                if event.type == 'message_start':
+                    usage = event.message.usage.model_dump()
+                elif event.type == 'message_delta':
+                    usage['output_tokens'] = event.usage.output_tokens
+                elif event.type == 'content_block_delta' and getattr(event.delta, 'type', None) == 'text_delta':
+                    if first_token is None and event.delta.text:
+                        first_token = time.perf_counter()
+                    yield event.delta.text
+                elif event.type == 'message_stop':
+                    self._record_usage_telemetry(model, usage, start, first_token)
+
+        except httpx.TimeoutException:
+            # Reads are bounded by the remaining deadline (see _send)
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(f"Anthropic stream from {model} exceeded its {deadline.timeout:.1f}s deadline") from None
+            raise
+        except anthropic.APIError as e:
+            logger.error(f"Anthropic streaming failed: {e}")
+            raise
+        finally:
+            # Also runs when the consumer stops early; closes the HTTP response
+            stream.close()
+
+    def batch(
+        self,
+        message_batches: List[List[Dict[str, str]]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        Concurrent batch invocation, paced by the API rate limits.
+
+        Note:
+            Requests run on up to settings.batch_concurrency threads that
+            share one RateLimitPacer, so a 429 or an exhausted window pauses
+            all of them instead of each retrying independently. The
+            asynchronous Message Batches API is not used: its results can
+            take hours, which does not fit interactive sub-agents.
+
+        Args:
+            message_batches: List of message lists
+            model: Model name override
+            **kwargs: Additional parameters (batch_concurrency overrides the
+                setting; deadline/timeout and cancel apply to the whole batch)
+
+        Returns:
+            List[str]: List of generated responses, in input order
+        """
+        concurrency = kwargs.pop('batch_concurrency', self.batch_concurrency)
+
+        if not message_batches:
+            return []
+
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        if deadline is not None:
+            kwargs['deadline'] = deadline
+
+        if concurrency <= 1 or len(message_batches) == 1:
+            return [self.invoke(messages, model=model, **kwargs) for messages in message_batches]
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(message_batches))) as pool:
+            return list(pool.map(
+                lambda messages: self.invoke(messages, model=model, **kwargs),
+                message_batches
+            ))
+
+    def _record_usage_telemetry(
+        self,
+        model: str,
+        usage: Any,
+        start: float,
+        first_token: Optional[float] = None
+    ) -> None:
+        """
+        Record latency and token usage, including prompt cache hits.
+
+        Args:
+            model: Model name
+            usage: Usage object or dict from the response
+            start: perf_counter() value when the request was sent
+            first_token: perf_counter() value when the first token arrived
+        """
+        if not isinstance(usage, dict):
+            usage = usage.model_dump()
+
+        latency_ms = (time.perf_counter() - start) * 1000
+        completion_tokens = usage.get('output_tokens') or 0
+        cache_read = usage.get('cache_read_input_tokens') or 0
+        cache_write = usage.get('cache_creation_input_tokens') or 0
+        decode_ms = latency_ms - ((first_token - start) * 1000 if first_token is not None else 0)
+
+        self._record_telemetry({
+            'model': model,
+            'latency_ms': latency_ms,
+            'ttft_ms': (first_token - start) * 1000 if first_token is not None else None,
+            'prompt_tokens': (usage.get('input_tokens') or 0) + cache_read + cache_write,
+            'completion_tokens': completion_tokens,
+            'cache_read_tokens': cache_read,
+            'cache_write_tokens': cache_write,
+            'tokens_per_second': completion_tokens / (decode_ms / 1000) if first_token is not None and decode_ms > 0 else 0.0,
+        })
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Whether an Anthropic error is transient.
+
+        Args:
+            error: Exception from a request attempt
+
+        Returns:
+            bool: True for connection errors, timeouts, 429, 529 and 5xx
+        """
+        if isinstance(error, anthropic.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS
+        return isinstance(error, anthropic.APIConnectionError) or super().is_retryable(error)
+
+    def is_available(self) -> bool:
+        """
+        Check that an API key is configured and the API is reachable.
+
+        Returns:
+            bool: True if the models endpoint answers
+        """
+        if not self.api_key:
+            logger.warning("Anthropic not available: no API key configured")
+            return False
+        try:
+            self.client.models.list(limit=1, timeout=10)
+            return True
+        except Exception as e:
+            logger.warning(f"Anthropic not available: {e}")
+            return False
+
+    def get_model_info(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get information about a model.
+
+        Args:
+            model: Model name (uses the default model if None)
+
+        Returns:
+            Dict: Model metadata
+        """
+        return {
+            'name': model or self.default_model,
+            'provider': 'anthropic',
+            'base_url': self.base_url or 'https://api.anthropic.com',
+            'prompt_caching': self.prompt_caching,
+            'batch_concurrency': self.batch_concurrency,
+        }
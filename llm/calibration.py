@@ -0,0 +1,463 @@
+"""
+Model Calibration Benchmark
+
+Measures every candidate model on every routed task and recommends a
+task_routing table for a stated latency/throughput target.
+
+For each local model (OllamaProvider.list_available_models()):
+- load time: the model is unloaded, then loaded by a one-token request
+- memory: resident size and VRAM share reported by Ollama once loaded
+and for each task in task_routing:
+- a fixed prompt set (llm.calibration.prompts.<task>, or built-in code
+  prompts) is streamed at realistic concurrency (the provider's
+  batch_concurrency), recording time to first token, per-request decode
+  speed and aggregate throughput.
+
+Targets come from llm_config.yaml:
+
+    llm:
+      calibration:
+        max_tokens: 256
+        repeats: 1
+        targets:
+          default:
+            max_ttft_ms: 3000           # p95 under concurrency
+            min_tokens_per_second: 15   # per-request decode speed
+            max_memory_gb: 24
+            optimize: quality           # quality | latency | throughput
+          code_generation:
+            max_ttft_ms: 8000
+
+Among models meeting a task's target, 'quality' picks the largest model,
+'latency' the lowest p95 time to first token and 'throughput' the highest
+aggregate tokens/s. The result is printed as an llm_config.yaml fragment.
+
+Usage:
+    python -m llm.calibration [--config config/llm_config.yaml] [--output routing.yaml]
+"""
+
+import json
+import logging
+import re
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from .config_loader import get_model_for_task
+from .model_store import normalize_model_name
+
+logger = logging.getLogger(__name__)
+
+# Used for tasks without llm.calibration.prompts.<task>
+DEFAULT_PROMPTS = [
+    "Write a Python function that merges overlapping intervals in a list of (start, end) tuples. "
+    "Include type hints and a docstring.",
+    "Review this code and list its bugs:\n\n"
+    "def average(values):\n    total = 0\n    for v in values:\n        total += v\n    return total / len(values)\n",
+    "Explain what a race condition is and show how a threading.Lock prevents one in Python.",
+    "Refactor this function to be easier to read without changing its behavior:\n\n"
+    "def f(a):\n    r = []\n    for i in range(len(a)):\n        if a[i] % 2 == 0:\n            r.append(a[i] * a[i])\n    return r\n",
+]
+
+DEFAULT_TARGET = {
+    'max_ttft_ms': None,
+    'min_tokens_per_second': None,
+    'min_throughput': None,
+    'max_memory_gb': None,
+    'optimize': 'quality',
+}
+
+
+def _percentile(values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile (None for no values)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _parameter_count(details: Dict[str, Any], size: Optional[int]) -> float:
+    """Model size in billions of parameters, from '13B'-style details or disk size."""
+    match = re.match(r'([\d.]+)\s*([BM])', str(details.get('parameter_size') or ''), re.IGNORECASE)
+    if match:
+        value = float(match.group(1))
+        return value / 1000 if match.group(2).upper() == 'M' else value
+    # Roughly 0.6 GB per billion parameters at the common 4-bit quantizations
+    return (size or 0) / 0.6e9
+
+
+def _model_key(model: str) -> str:
+    """Config key for a model name ('codellama:13b' -> 'codellama_13b')."""
+    return re.sub(r'[^0-9a-zA-Z]+', '_', model.replace(':latest', '')).strip('_').lower()
+
+
+class Calibrator:
+    """
+    Benchmarks models per task and derives a routing table.
+    """
+
+    def __init__(
+        self,
+        provider: Any,
+        config: Dict[str, Any],
+        provider_name: str = 'ollama',
+        concurrency: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        repeats: Optional[int] = None
+    ):
+        """
+        Initialize calibrator.
+
+        Args:
+            provider: OllamaProvider (possibly wrapped in middleware)
+            config: Full LLM configuration
+            provider_name: Provider name in the configuration
+            concurrency: Requests in flight (default: provider batch_concurrency)
+            max_tokens: Generation cap per prompt (default: calibration.max_tokens or 256)
+            repeats: Times the prompt set is run per task (default: calibration.repeats or 1)
+        """
+        self.provider = provider
+        self.config = config
+        self.provider_name = provider_name
+
+        self.settings = config['llm'].get('calibration', {}) or {}
+        self.concurrency = concurrency or self.settings.get('concurrency') or getattr(provider, 'batch_concurrency', 4)
+        self.max_tokens = max_tokens or self.settings.get('max_tokens', 256)
+        self.repeats = repeats or self.settings.get('repeats', 1)
+
+    def tasks(self, all_providers: bool = False) -> List[str]:
+        """
+        Tasks to calibrate.
+
+        Args:
+            all_providers: Include tasks currently routed to other providers
+
+        Returns:
+            List[str]: Task names from task_routing
+        """
+        tasks = []
+        for task_name in self.config['llm'].get('task_routing', {}):
+            routed_provider, _ = get_model_for_task(self.config, task_name)
+            if all_providers or routed_provider == self.provider_name:
+                tasks.append(task_name)
+        return tasks
+
+    def prompts_for(self, task_name: str) -> List[str]:
+        """Fixed prompt set for a task."""
+        return (self.settings.get('prompts', {}) or {}).get(task_name) or DEFAULT_PROMPTS
+
+    def target_for(self, task_name: str) -> Dict[str, Any]:
+        """Target for a task: built-in defaults < targets.default < targets.<task>."""
+        targets = self.settings.get('targets', {}) or {}
+        return {**DEFAULT_TARGET, **(targets.get('default') or {}), **(targets.get(task_name) or {})}
+
+    def _unload(self, model: str) -> None:
+        """Evict a model from memory so the next request measures a cold load."""
+        try:
+            self.provider.client.generate(model=model, prompt='', keep_alive=0)
+        except Exception as e:
+            logger.debug(f"Could not unload {model}: {e}")
+
+    def measure_model(self, model: str) -> Dict[str, Any]:
+        """
+        Measure cold load time and memory of one model.
+
+        Args:
+            model: Model name
+
+        Returns:
+            Dict: load_ms, memory_bytes, vram_bytes, parameters_b
+        """
+        self._unload(model)
+        self.provider.get_telemetry(clear=True)
+        self.provider.invoke([{'role': 'user', 'content': 'Hi'}], model=model, max_tokens=1, allow_pull=False)
+        records = self.provider.get_telemetry(clear=True)
+        load_ms = records[-1].get('load_ms') if records else None
+
+        memory = vram = None
+        try:
+            for running in self.provider.client.ps().get('models', []):
+                if normalize_model_name(running.get('name') or running.get('model', '')) == normalize_model_name(model):
+                    memory, vram = running.get('size'), running.get('size_vram')
+        except Exception as e:
+            logger.debug(f"Could not read memory use of {model}: {e}")
+
+        details = self.provider.get_model_info(model)
+        return {
+            'load_ms': load_ms,
+            'memory_bytes': memory,
+            'vram_bytes': vram,
+            'parameters_b': _parameter_count(details.get('details') or {}, details.get('size')),
+        }
+
+    def measure_task(self, model: str, task_name: str) -> Dict[str, Any]:
+        """
+        Run a task's prompt set against a loaded model at the configured concurrency.
+
+        Args:
+            model: Model name
+            task_name: Task name
+
+        Returns:
+            Dict: ttft_p50_ms, ttft_p95_ms, latency_p95_ms,
+                tokens_per_second (median per request), throughput
+                (aggregate tokens/s), requests, errors
+        """
+        prompts = self.prompts_for(task_name) * self.repeats
+
+        def run(prompt: str) -> Optional[str]:
+            try:
+                for _ in self.provider.stream([{'role': 'user', 'content': prompt}], model=model,
+                                              max_tokens=self.max_tokens, temperature=0.0, allow_pull=False):
+                    pass
+                return None
+            except Exception as e:
+                return str(e)
+
+        self.provider.get_telemetry(clear=True)
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(self.concurrency, len(prompts)))) as pool:
+            errors = [error for error in pool.map(run, prompts) if error]
+        wall = time.perf_counter() - start
+        records = [r for r in self.provider.get_telemetry(clear=True) if r.get('model') == model]
+
+        ttfts = [r['ttft_ms'] for r in records if r.get('ttft_ms') is not None]
+        speeds = [r['tokens_per_second'] for r in records if r.get('tokens_per_second')]
+        completion_tokens = sum(r.get('completion_tokens') or 0 for r in records)
+        for error in set(errors):
+            logger.warning(f"{model} on {task_name}: {error}")
+
+        return {
+            'ttft_p50_ms': statistics.median(ttfts) if ttfts else None,
+            'ttft_p95_ms': _percentile(ttfts, 0.95),
+            'latency_p95_ms': _percentile([r['latency_ms'] for r in records], 0.95),
+            'tokens_per_second': statistics.median(speeds) if speeds else None,
+            'throughput': completion_tokens / wall if wall else 0.0,
+            'requests': len(prompts),
+            'errors': len(errors),
+        }
+
+    def run(
+        self,
+        tasks: Optional[List[str]] = None,
+        models: Optional[List[str]] = None,
+        on_result: Optional[Callable[[Dict[str, Any]], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Benchmark every model on every task.
+
+        Note:
+            Models are the outer loop, so each is loaded once; it is
+            unloaded again afterwards so the next one has the memory to
+            itself.
+
+        Args:
+            tasks: Task names (default: tasks routed to this provider)
+            models: Candidate models (default: list_available_models())
+            on_result: Called with each result row as it completes
+
+        Returns:
+            Dict: success, models (per-model measurements), results (rows
+                with model, task and task measurements), error
+        """
+        tasks = tasks or self.tasks()
+        models = models or self.provider.list_available_models()
+        if not tasks or not models:
+            return {'success': False, 'models': {}, 'results': [],
+                    'error': 'No tasks to calibrate' if not tasks
+                    else f"No local models found on {self.provider.host}; pull one with 'ollama pull'"}
+
+        logger.info(f"Calibrating {len(models)} models on {len(tasks)} tasks at concurrency {self.concurrency}")
+
+        model_results: Dict[str, Dict[str, Any]] = {}
+        rows: List[Dict[str, Any]] = []
+        for model in models:
+            try:
+                model_results[model] = self.measure_model(model)
+            except Exception as e:
+                logger.error(f"Skipping {model}: {e}")
+                model_results[model] = {'error': str(e)}
+                continue
+
+            for task_name in tasks:
+                row = {'model': model, 'task': task_name, **self.measure_task(model, task_name)}
+                rows.append(row)
+                if on_result is not None:
+                    on_result(row)
+            self._unload(model)
+
+        if not rows:
+            return {'success': False, 'models': model_results, 'results': [],
+                    'error': f"None of the {len(models)} models could be measured"}
+        return {'success': True, 'models': model_results, 'results': rows}
+
+    def recommend(self, calibration: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Pick a model per task for its target.
+
+        Args:
+            calibration: Output of run()
+
+        Returns:
+            Dict: Task -> model, meets_target, violations, target and the
+                merged measurements of the chosen model
+        """
+        by_task: Dict[str, List[Dict[str, Any]]] = {}
+        for row in calibration['results']:
+            merged = {**calibration['models'].get(row['model'], {}), **row}
+            if not merged['errors'] and merged.get('ttft_p95_ms') is not None:
+                by_task.setdefault(row['task'], []).append(merged)
+
+        recommendations = {}
+        for task_name, candidates in by_task.items():
+            target = self.target_for(task_name)
+            scored = [(candidate, self._violations(candidate, target)) for candidate in candidates]
+            passing = [candidate for candidate, violations in scored if not violations]
+
+            if passing:
+                chosen = self._best(passing, target.get('optimize', 'quality'))
+                violations: List[str] = []
+            else:
+                # Nothing meets the target: take the one closest to it
+                chosen, violations = min(scored, key=lambda item: (len(item[1]), item[0]['ttft_p95_ms']))
+
+            recommendations[task_name] = {**chosen, 'meets_target': not violations,
+                                          'violations': violations, 'target': target}
+        return recommendations
+
+    @staticmethod
+    def _violations(candidate: Dict[str, Any], target: Dict[str, Any]) -> List[str]:
+        """Target constraints a candidate misses."""
+        violations = []
+        if target.get('max_ttft_ms') is not None and candidate['ttft_p95_ms'] > target['max_ttft_ms']:
+            violations.append(f"p95 TTFT {candidate['ttft_p95_ms']:.0f} ms > {target['max_ttft_ms']} ms")
+        if target.get('min_tokens_per_second') is not None and (candidate.get('tokens_per_second') or 0) < target['min_tokens_per_second']:
+            violations.append(f"{candidate.get('tokens_per_second') or 0:.1f} tok/s < {target['min_tokens_per_second']}")
+        if target.get('min_throughput') is not None and candidate['throughput'] < target['min_throughput']:
+            violations.append(f"throughput {candidate['throughput']:.1f} tok/s < {target['min_throughput']}")
+        if target.get('max_memory_gb') is not None and (candidate.get('memory_bytes') or 0) > target['max_memory_gb'] * 1e9:
+            violations.append(f"memory {candidate['memory_bytes'] / 1e9:.1f} GB > {target['max_memory_gb']} GB")
+        return violations
+
+    @staticmethod
+    def _best(candidates: List[Dict[str, Any]], optimize: str) -> Dict[str, Any]:
+        """Best passing candidate for the optimization goal."""
+        if optimize == 'latency':
+            return min(candidates, key=lambda c: c['ttft_p95_ms'])
+        if optimize == 'throughput':
+            return max(candidates, key=lambda c: c['throughput'])
+        if optimize == 'quality':
+            # Largest model within the target; faster first among equals
+            return max(candidates, key=lambda c: (c.get('parameters_b') or 0, -c['ttft_p95_ms']))
+        raise ValueError(f"Unknown optimize goal '{optimize}'. Must be 'quality', 'latency' or 'throughput'")
+
+    def to_yaml(self, recommendations: Dict[str, Dict[str, Any]]) -> str:
+        """
+        Render recommendations as an llm_config.yaml fragment.
+
+        Models get a key under providers.<name>.models (existing keys are
+        reused) and task_routing entries refer to them as provider.key.
+
+        Args:
+            recommendations: Output of recommend()
+
+        Returns:
+            str: YAML text with measurements as comments
+        """
+        provider_config = self.config['llm']['providers'].get(self.provider_name, {})
+        existing = {normalize_model_name(model): key for key, model in (provider_config.get('models') or {}).items() if model}
+
+        keys: Dict[str, str] = {}
+        for task_name in sorted(recommendations):
+            model = recommendations[task_name]['model']
+            keys.setdefault(model, existing.get(normalize_model_name(model)) or _model_key(model))
+
+        lines = [
+            f"# Generated by python -m llm.calibration on {datetime.now().strftime('%Y-%m-%d %H:%M')}",
+            f"# Concurrency {self.concurrency}, max_tokens {self.max_tokens}, repeats {self.repeats}",
+            'llm:',
+            '  providers:',
+            f"    {self.provider_name}:",
+            '      models:',
+        ]
+        for model, key in sorted(keys.items(), key=lambda item: item[1]):
+            lines.append(f"        {key}: {json.dumps(model)}")
+
+        lines += ['', '  task_routing:']
+        for task_name in sorted(recommendations):
+            rec = recommendations[task_name]
+            load = f"{rec['load_ms'] / 1000:.1f}s" if rec.get('load_ms') is not None else '?'
+            memory = f"{rec['memory_bytes'] / 1e9:.1f} GB" if rec.get('memory_bytes') else '?'
+            lines.append(
+                f"    # p95 TTFT {rec['ttft_p95_ms']:.0f} ms, {rec.get('tokens_per_second') or 0:.1f} tok/s per request, "
+                f"{rec['throughput']:.1f} tok/s total, load {load}, memory {memory}; optimize {rec['target'].get('optimize')}"
+            )
+            if not rec['meets_target']:
+                lines.append(f"    # WARNING: no model met the target ({'; '.join(rec['violations'])})")
+            lines.append(f"    {task_name}: {self.provider_name}.{keys[rec['model']]}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command-line entry point.
+
+    Usage:
+        python -m llm.calibration [--config llm_config.yaml] [--output routing.yaml] [--json results.json]
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark local models per task and recommend task_routing')
+    parser.add_argument('--config', help='Path to llm_config.yaml')
+    parser.add_argument('--provider', default='ollama', help='Provider to calibrate')
+    parser.add_argument('--tasks', nargs='+', help='Tasks (default: those routed to the provider)')
+    parser.add_argument('--all-tasks', action='store_true', help='Also include tasks routed to other providers')
+    parser.add_argument('--models', nargs='+', help='Candidate models (default: all local models)')
+    parser.add_argument('--concurrency', type=int, help='Requests in flight (default: batch_concurrency)')
+    parser.add_argument('--max-tokens', type=int, help='Generation cap per prompt')
+    parser.add_argument('--repeats', type=int, help='Runs of the prompt set per task')
+    parser.add_argument('--output', help='Write the routing YAML here instead of stdout')
+    parser.add_argument('--json', help='Also write raw measurements to this file')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    from .factory import LLMFactory
+
+    LLMFactory.initialize(args.config)
+    # Background downloads would skew the measurements
+    settings = LLMFactory.get_config()['llm']['providers'][args.provider].setdefault('settings', {})
+    settings['model_store'] = {**(settings.get('model_store') or {}), 'prefetch_on_startup': False}
+    calibrator = Calibrator(LLMFactory.get_provider(args.provider), LLMFactory.get_config(), args.provider,
+                            args.concurrency, args.max_tokens, args.repeats)
+
+    def report(row: Dict[str, Any]) -> None:
+        print(f"{row['model']:<32} {row['task']:<28} p95 TTFT {row['ttft_p95_ms'] or 0:7.0f} ms  "
+              f"{row['tokens_per_second'] or 0:6.1f} tok/s  {row['throughput']:6.1f} tok/s total"
+              + (f"  {row['errors']} errors" if row['errors'] else ''), file=sys.stderr)
+
+    calibration = calibrator.run(args.tasks or calibrator.tasks(args.all_tasks), args.models, on_result=report)
+    if not calibration['success']:
+        logger.error(calibration['error'])
+        return 1
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(calibration, f, indent=2)
+
+    routing = calibrator.to_yaml(calibrator.recommend(calibration))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(routing)
+        logger.info(f"Recommended routing written to {args.output}")
+    else:
+        print(routing)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,7 +7,7 @@ Loads and validates LLM configuration from YAML files with environment variable
 import os
 import re
 import yaml
-from typing import Dict, Any
+from typing import Dict, Any, Set
 from pathlib import Path
 
 
@@ -201,3 +201,33 @@ def get_model_for_task(
         model_name = provider_config.get('model')
 
     return provider_name, model_name
+
+
+def get_routed_models(
+    config: Dict[str, Any],
+    provider_name: str
+) -> Set[str]:
+    """
+    Get every model a provider may be asked for by task routing.
+
+    Args:
+        config: Full LLM configuration
+        provider_name: Name of provider (e.g., 'ollama')
+
+    Returns:
+        Set[str]: Models named in task_routing for this provider, plus its
+            default model (used by unrouted tasks and provider-only routes)
+    """
+    llm_config = config['llm']
+    models = set()
+
+    default_model = llm_config['providers'].get(provider_name, {}).get('models', {}).get('default')
+    if default_model:
+        models.add(default_model)
+
+    for task_name in llm_config.get('task_routing', {}):
+        routed_provider, model_name = get_model_for_task(config, task_name)
+        if routed_provider == provider_name and model_name:
+            models.add(model_name)
+
+    return models
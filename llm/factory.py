@@ -6,10 +6,19 @@ Handles provider selection, fallback, and task routing.
 """
 
 import logging
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Iterator, List, Optional
+from . import tracing
 from .provider import LLMProvider
 from .ollama_provider import OllamaProvider
-from .config_loader import load_llm_config, get_provider_config, get_model_for_task
+from .middleware import Middleware, MiddlewareProvider, build_middleware
+from .config_loader import load_llm_config, get_provider_config, get_model_for_task, get_routed_models
+from .resilience import (
+    CancellationToken,
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+    configure_retry_budget,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -23,6 +32,7 @@ class LLMFactory:
 
     _providers: Dict[str, LLMProvider] = {}
     _config: Optional[Dict[str, Any]] = None
+    _middleware: List[Middleware] = []
 
     @classmethod
     def initialize(cls, config_path: Optional[str] = None) -> None:
@@ -33,8 +43,40 @@ class LLMFactory:
             config_path: Path to configuration file (uses default if None)
         """
         cls._config = load_llm_config(config_path)
+        configure_retry_budget(cls._config['llm'].get('retry_budget'))
+        cls._middleware = build_middleware(cls._config['llm'].get('middleware'))
         logger.info("LLM Factory initialized")
 
+    @classmethod
+    def use(cls, middleware: Middleware) -> None:
+        """
+        Append a middleware to the chain applied to every provider.
+
+        Args:
+            middleware: Middleware instance (innermost of the global chain)
+
+        Note:
+            Providers already created are re-wrapped, so the change applies
+            to them too.
+        """
+        if cls._config is None:
+            cls.initialize()
+
+        cls._middleware.append(middleware)
+        for provider_name, provider in list(cls._providers.items()):
+            if isinstance(provider, MiddlewareProvider):
+                provider = provider.provider
+            cls._providers[provider_name] = cls._wrap(provider_name, provider)
+
+    @classmethod
+    def _wrap(cls, provider_name: str, provider: LLMProvider) -> LLMProvider:
+        """Apply the global and provider-level middleware chain."""
+        provider_middleware = build_middleware(provider.config.get('middleware'))
+        chain = cls._middleware + provider_middleware
+        if not chain:
+            return provider
+        return MiddlewareProvider(provider, chain, provider_name)
+
     @classmethod
     def get_provider(
         cls,
@@ -77,7 +119,8 @@ class LLMFactory:
             return cls._providers[provider_name]
 
         # Create new provider instance
-        provider = cls._create_provider(provider_name)
+        with tracing.span('llm.factory.create_provider', **{'llm.provider_name': provider_name}):
+            provider = cls._wrap(provider_name, cls._create_provider(provider_name))
         cls._providers[provider_name] = provider
 
         return provider
@@ -98,20 +141,27 @@ class LLMFactory:
         """
         provider_config = get_provider_config(cls._config, provider_name)
 
-        if provider_name == 'ollama':
-            return OllamaProvider(provider_config)
-        elif provider_name == 'anthropic':
+        # 'type' lets several servers of one kind be configured (e.g. vllm, llamacpp)
+        provider_type = provider_config.get('type', provider_name)
+
+        if provider_type == 'ollama':
+            return OllamaProvider(provider_config, protected_models=get_routed_models(cls._config, provider_name))
+        elif provider_type == 'anthropic':
             # Import here to avoid circular dependency
             from .anthropic_provider import AnthropicProvider
             return AnthropicProvider(provider_config)
+        elif provider_type == 'openai_compatible':
+            from .openai_compatible_provider import OpenAICompatibleProvider
+            return OpenAICompatibleProvider(provider_config)
         else:
-            raise ValueError(f"Unknown provider type: {provider_name}")
+            raise ValueError(f"Unknown provider type: {provider_type}")
 
     @classmethod
     def get_provider_with_fallback(
         cls,
         primary_provider: Optional[str] = None,
-        task_name: Optional[str] = None
+        task_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None
     ) -> LLMProvider:
         """
         Get provider with automatic fallback on failure.
@@ -119,10 +169,14 @@ class LLMFactory:
         Args:
             primary_provider: Primary provider to try
             task_name: Task name for routing
+            deadline: Call deadline; no further availability probes are made once it passes
 
         Returns:
             LLMProvider: Available provider (primary or fallback)
 
+        Raises:
+            DeadlineExceeded: If the deadline passes while probing
+
         Note:
             If primary provider is unavailable and fallback is enabled,
             returns fallback provider instead.
@@ -134,6 +188,8 @@ class LLMFactory:
         provider = cls.get_provider(primary_provider, task_name)
 
         # Check if provider is available
+        if deadline is not None:
+            deadline.check('Provider selection')
         if provider.is_available():
             return provider
 
@@ -145,6 +201,8 @@ class LLMFactory:
                     f"Primary provider unavailable, falling back to {fallback_name}"
                 )
                 fallback_provider = cls.get_provider(fallback_name)
+                if deadline is not None:
+                    deadline.check('Provider selection')
                 if fallback_provider.is_available():
                     return fallback_provider
 
@@ -152,6 +210,157 @@ class LLMFactory:
         logger.error("No available providers found")
         return provider
 
+    @classmethod
+    def _route(
+        cls,
+        provider_name: Optional[str],
+        task_name: Optional[str],
+        deadline: Optional[Deadline]
+    ) -> tuple:
+        """Resolve (provider, model or None, fallback provider or None) for a call."""
+        with tracing.span('llm.factory.lookup', **{'llm.provider_name': provider_name, 'llm.task': task_name}) as span:
+            provider = cls.get_provider_with_fallback(provider_name, task_name, deadline)
+            if span is not None:
+                span.set_attribute('llm.provider', provider.name)
+
+        model = None
+        if task_name and provider_name is None:
+            routed, model = get_model_for_task(cls._config, task_name)
+            if provider is not cls.get_provider(routed):
+                # Already fell back; the routed model belongs to the other provider
+                model = None
+
+        fallback = None
+        if cls._config['llm'].get('enable_fallback', False):
+            fallback_name = cls._config['llm'].get('fallback_provider')
+            if fallback_name:
+                candidate = cls.get_provider(fallback_name)
+                if candidate is not provider:
+                    fallback = candidate
+
+        return provider, model, fallback
+
+    @classmethod
+    def invoke(
+        cls,
+        messages: List[Dict[str, str]],
+        provider_name: Optional[str] = None,
+        task_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancellationToken] = None,
+        **kwargs
+    ) -> str:
+        """
+        Invoke the routed provider under one deadline, falling back on failure.
+
+        Args:
+            messages: Messages to send
+            provider_name: Explicit provider
+            task_name: Task name for routing
+            deadline: Deadline inherited from the caller
+            timeout: Seconds for this call (combined with deadline; earlier wins)
+            cancel: Cancellation token
+            **kwargs: Provider parameters
+
+        Returns:
+            str: Generated response text
+
+        Raises:
+            DeadlineExceeded: If the deadline passes (no fallback is attempted)
+            RequestCancelled: If cancelled
+            Exception: The fallback's error, or the primary's if there is no fallback
+
+        Note:
+            The fallback gets whatever time is left on the same deadline,
+            not a fresh timeout.
+        """
+        if cls._config is None:
+            cls.initialize()
+
+        deadline = Deadline.resolve(deadline, timeout)
+
+        with tracing.span('llm.factory.invoke', **{'llm.task': task_name}):
+            provider, model, fallback = cls._route(provider_name, task_name, deadline)
+
+            try:
+                return provider.invoke(messages, model=model, deadline=deadline, cancel=cancel, **kwargs)
+            except (DeadlineExceeded, RequestCancelled):
+                raise
+            except Exception as e:
+                if fallback is None:
+                    raise
+                logger.warning(f"{provider.name} failed ({e}); falling back to {fallback.name}")
+                return fallback.invoke(messages, deadline=deadline, cancel=cancel, **kwargs)
+
+    @classmethod
+    def stream(
+        cls,
+        messages: List[Dict[str, str]],
+        provider_name: Optional[str] = None,
+        task_name: Optional[str] = None,
+        deadline: Optional[Deadline] = None,
+        timeout: Optional[float] = None,
+        cancel: Optional[CancellationToken] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Stream from the routed provider under one deadline, falling back on failure.
+
+        Args:
+            messages: Messages to send
+            provider_name: Explicit provider
+            task_name: Task name for routing
+            deadline: Deadline inherited from the caller
+            timeout: Seconds for this call (combined with deadline; earlier wins)
+            cancel: Cancellation token
+            **kwargs: Provider parameters
+
+        Yields:
+            str: Chunks of generated response text
+
+        Note:
+            Falls back only if the primary fails before yielding anything;
+            a failure mid-stream is raised to the caller.
+        """
+        if cls._config is None:
+            cls.initialize()
+
+        deadline = Deadline.resolve(deadline, timeout)
+        return tracing.traced_iter(
+            'llm.factory.stream',
+            cls._stream(messages, provider_name, task_name, deadline, cancel, kwargs),
+            **{'llm.task': task_name}
+        )
+
+    @classmethod
+    def _stream(
+        cls,
+        messages: List[Dict[str, str]],
+        provider_name: Optional[str],
+        task_name: Optional[str],
+        deadline: Optional[Deadline],
+        cancel: Optional[CancellationToken],
+        kwargs: Dict[str, Any]
+    ) -> Iterator[str]:
+        """Routing and fallback for stream(); runs lazily on first next()."""
+        provider, model, fallback = cls._route(provider_name, task_name, deadline)
+
+        started = False
+        try:
+            for chunk in provider.stream(messages, model=model, deadline=deadline, cancel=cancel, **kwargs):
+                started = True
+                yield chunk
+            return
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            if started or fallback is None:
+                raise
+            logger.warning(f"{provider.name} failed ({e}); falling back to {fallback.name}")
+
+        yield from fallback.stream(messages, deadline=deadline, cancel=cancel, **kwargs)
+
     @classmethod
     def reset(cls) -> None:
         """
@@ -161,6 +370,8 @@ class LLMFactory:
         """
         cls._providers.clear()
         cls._config = None
+        cls._middleware = []
+        tracing.disable_tracing()
         logger.info("LLM Factory reset")
 
     @classmethod
@@ -0,0 +1,467 @@
+"""
+Map-Reduce Codebase Analysis
+
+Analyzes repositories larger than the model's context window:
+
+1. Chunking: files are split into token-budgeted chunks along file and
+   top-level definition boundaries (Python via ast, other languages at
+   unindented lines following a blank line). Small files in the same
+   directory are packed together, so an edit only re-chunks its directory.
+2. Map: uncached chunks go through provider.batch(), which runs them
+   concurrently up to the provider's batch_concurrency.
+3. Reduce: results are merged in a tree, up to fan_in at a time and within
+   the token budget, so no call is large. Group boundaries are chosen
+   from the results' cache keys, not their positions. Every reduce merges
+   at least two results (trimming them if a pair does not fit), so each
+   level is smaller than the last. The final reduce is streamed.
+
+Every map and reduce result is cached under a key derived from the prompt,
+model and its inputs' keys. After an edit, or a chunk added or removed, only
+the changed chunks and their ancestors in the reduce tree are recomputed.
+
+Usage:
+    engine = MapReduceAnalyzer(
+        provider,
+        map_prompt='List performance problems in this code with file and function names.',
+        reduce_prompt='Merge these findings, removing duplicates, most severe first.',
+        cache_dir='.llm-cache/perf'
+    )
+    result = engine.run('.', on_chunk=lambda text: print(text, end=''))
+"""
+
+import ast
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterator, List, Optional, Tuple
+
+from .provider import LLMProvider
+from .prompt_library import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EXTENSIONS = ['.py', '.js', '.jsx', '.ts', '.tsx', '.go', '.rs', '.java', '.rb', '.php', '.c', '.h', '.cpp', '.cs', '.sh']
+DEFAULT_EXCLUDE_DIRS = ['.git', 'node_modules', '__pycache__', '.venv', 'venv', 'dist', 'build', '.llm-cache']
+
+# Tokens reserved for the instruction and per-chunk headers
+PROMPT_OVERHEAD_TOKENS = 256
+
+# Start of a top-level block in brace/indent languages: unindented, after a blank line
+_TOP_LEVEL = re.compile(r'\n\n(?=[^\s}\])])')
+
+
+class Chunk:
+    """
+    A token-budgeted piece of the codebase.
+    """
+
+    def __init__(self, parts: List[Tuple[str, int, int, str]], tokenizer: Callable[[str], int]):
+        """
+        Initialize chunk.
+
+        Args:
+            parts: (relative path, first line, last line, text) pieces in order
+            tokenizer: Token counter
+        """
+        self.parts = parts
+        self.text = '\n\n'.join(
+            f"File: {path} (lines {first}-{last})\n```\n{text}\n```" for path, first, last, text in parts
+        )
+        self.token_count = tokenizer(self.text)
+        self.sha256 = hashlib.sha256(self.text.encode('utf-8')).hexdigest()
+
+    @property
+    def paths(self) -> List[str]:
+        """Files covered by this chunk."""
+        return sorted({path for path, _, _, _ in self.parts})
+
+
+def _split_points(path: str, source: str) -> List[int]:
+    """Character offsets where a top-level definition starts."""
+    if path.endswith('.py'):
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            line_offsets = [0]
+            for line in source.splitlines(keepends=True):
+                line_offsets.append(line_offsets[-1] + len(line))
+            points = []
+            for node in tree.body:
+                # Keep decorators with the definition they belong to
+                lineno = min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])])
+                points.append(line_offsets[lineno - 1])
+            return points
+
+    return [match.end() for match in _TOP_LEVEL.finditer(source)]
+
+
+def split_source(
+    path: str,
+    source: str,
+    max_tokens: int,
+    tokenizer: Callable[[str], int] = estimate_tokens
+) -> List[Tuple[str, int, int, str]]:
+    """
+    Split one file into pieces of at most max_tokens along definition boundaries.
+
+    Args:
+        path: Relative path (used to pick the splitter)
+        source: File contents
+        max_tokens: Token budget per piece
+        tokenizer: Token counter
+
+    Returns:
+        List[Tuple]: (path, first line, last line, text) pieces; a single
+            definition larger than the budget is split by lines
+    """
+    source = source.rstrip('\n')
+    if tokenizer(source) <= max_tokens:
+        return [(path, 1, source.count('\n') + 1, source)]
+
+    points = sorted({0, *_split_points(path, source), len(source)})
+    blocks = [source[start:end] for start, end in zip(points, points[1:])]
+
+    # Oversized blocks fall back to line boundaries
+    units: List[str] = []
+    for block in blocks:
+        if tokenizer(block) <= max_tokens:
+            units.append(block)
+            continue
+        current, current_tokens = '', 0
+        for line in block.splitlines(keepends=True):
+            line_tokens = tokenizer(line)
+            if current and current_tokens + line_tokens > max_tokens:
+                units.append(current)
+                current, current_tokens = '', 0
+            current += line
+            current_tokens += line_tokens
+        if current:
+            units.append(current)
+
+    pieces = []
+    line = 1
+    current, current_start, current_tokens = '', 1, 0
+    for unit in units + [None]:
+        unit_tokens = tokenizer(unit) if unit is not None else 0
+        if current and (unit is None or current_tokens + unit_tokens > max_tokens):
+            text = current.rstrip('\n')
+            if text.strip():
+                pieces.append((path, current_start, current_start + text.count('\n'), text))
+            current, current_start, current_tokens = '', line, 0
+        if unit is not None:
+            current += unit
+            current_tokens += unit_tokens
+            line += unit.count('\n')
+    return pieces
+
+
+def chunk_codebase(
+    root: str,
+    max_tokens: int,
+    extensions: Optional[List[str]] = None,
+    exclude_dirs: Optional[List[str]] = None,
+    tokenizer: Callable[[str], int] = estimate_tokens
+) -> List[Chunk]:
+    """
+    Split a codebase into token-budgeted chunks.
+
+    Args:
+        root: Codebase root directory
+        max_tokens: Token budget per chunk (headers included)
+        extensions: File extensions to include
+        exclude_dirs: Directory names to skip
+        tokenizer: Token counter
+
+    Returns:
+        List[Chunk]: Chunks in stable (directory, file, line) order
+    """
+    extensions = set(extensions or DEFAULT_EXTENSIONS)
+    exclude_dirs = set(exclude_dirs or DEFAULT_EXCLUDE_DIRS)
+    header_tokens = 32
+
+    chunks = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in exclude_dirs)
+
+        # Pack per directory so one file's growth cannot shift every later chunk
+        pending: List[Tuple[str, int, int, str]] = []
+        pending_tokens = 0
+        for filename in sorted(filenames):
+            path = Path(dirpath) / filename
+            if path.suffix not in extensions:
+                continue
+            try:
+                source = path.read_text(encoding='utf-8', errors='replace')
+            except OSError as e:
+                logger.warning(f"Skipping {path}: {e}")
+                continue
+
+            rel = path.relative_to(root).as_posix()
+            for piece in split_source(rel, source, max_tokens - header_tokens, tokenizer):
+                tokens = tokenizer(piece[3]) + header_tokens
+                if pending and pending_tokens + tokens > max_tokens:
+                    chunks.append(Chunk(pending, tokenizer))
+                    pending, pending_tokens = [], 0
+                pending.append(piece)
+                pending_tokens += tokens
+
+        if pending:
+            chunks.append(Chunk(pending, tokenizer))
+
+    return chunks
+
+
+class MapReduceAnalyzer:
+    """
+    Map-reduce analysis over LLMProvider.batch/stream with a result cache.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        map_prompt: str,
+        reduce_prompt: str,
+        model: Optional[str] = None,
+        max_chunk_tokens: Optional[int] = None,
+        fan_in: int = 4,
+        cache_dir: Optional[str] = None,
+        tokenizer: Callable[[str], int] = estimate_tokens,
+        **kwargs
+    ):
+        """
+        Initialize analyzer.
+
+        Args:
+            provider: Provider used for map (batch) and reduce calls
+            map_prompt: Instruction applied to each chunk
+            reduce_prompt: Instruction for merging partial results
+            model: Model override
+            max_chunk_tokens: Token budget per call input (default: the
+                provider's num_ctx minus max_tokens and prompt overhead)
+            fan_in: Maximum partial results merged per reduce call
+            cache_dir: Directory for the on-disk result cache (memory only if None)
+            tokenizer: Token counter
+            **kwargs: Extra provider parameters (temperature, max_tokens, ...)
+
+        Raises:
+            ValueError: If the budget leaves no room for input or fan_in < 2
+        """
+        self.provider = provider
+        self.map_prompt = map_prompt
+        self.reduce_prompt = reduce_prompt
+        self.model = model
+        self.fan_in = fan_in
+        self.tokenizer = tokenizer
+        self.kwargs = kwargs
+
+        if max_chunk_tokens is None:
+            settings = provider.config.get('settings', {})
+            num_ctx = kwargs.get('num_ctx', getattr(provider, 'num_ctx', settings.get('num_ctx', 4096)))
+            max_tokens = kwargs.get('max_tokens', getattr(provider, 'max_tokens', settings.get('max_tokens', 2048)))
+            max_chunk_tokens = num_ctx - max_tokens - PROMPT_OVERHEAD_TOKENS
+        if max_chunk_tokens <= 0:
+            raise ValueError(f"No input budget left (max_chunk_tokens={max_chunk_tokens}); raise num_ctx or lower max_tokens")
+        if fan_in < 2:
+            raise ValueError("fan_in must be at least 2")
+        self.max_chunk_tokens = max_chunk_tokens
+
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        if self.cache_dir:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._memory: Dict[str, str] = {}
+
+    def _key(self, kind: str, *parts: str) -> str:
+        """Cache key from the instruction, model and input hashes."""
+        prompt = self.map_prompt if kind == 'map' else self.reduce_prompt
+        model = self.model or getattr(self.provider, 'default_model', None)
+        payload = json.dumps([kind, prompt, model, parts])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _cached(self, key: str) -> Optional[str]:
+        """Look up a result in memory, then on disk."""
+        if key in self._memory:
+            return self._memory[key]
+        if self.cache_dir:
+            path = self.cache_dir / f"{key}.json"
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)['result']
+            except (OSError, ValueError, KeyError):
+                return None
+            self._memory[key] = result
+            return result
+        return None
+
+    def _store(self, key: str, result: str) -> None:
+        """Save a result in memory and on disk."""
+        self._memory[key] = result
+        if self.cache_dir:
+            path = self.cache_dir / f"{key}.json"
+            tmp_path = path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'result': result}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+
+    def _reduce_messages(self, results: List[str]) -> List[Dict[str, str]]:
+        """Messages for one reduce call, trimming results that do not fit the budget together."""
+        if sum(self.tokenizer(text) for text in results) > self.max_chunk_tokens:
+            share = self.max_chunk_tokens // len(results)
+            results = [self._trim(text, share) for text in results]
+        body = '\n\n'.join(f"### Partial result {i + 1}\n\n{text}" for i, text in enumerate(results))
+        return [{'role': 'user', 'content': f"{self.reduce_prompt}\n\n{body}"}]
+
+    def _trim(self, text: str, max_tokens: int) -> str:
+        """Cut a partial result down to about max_tokens."""
+        tokens = self.tokenizer(text)
+        if tokens <= max_tokens:
+            return text
+        marker = '\n[... truncated to fit the context window]'
+        keep = max(0, int(len(text) * max_tokens / tokens) - len(marker))
+        return text[:keep] + marker
+
+    def _groups(self, items: List[Tuple[str, str]]) -> Iterator[List[Tuple[str, str]]]:
+        """
+        Content-defined groups of at most fan_in results within the token budget.
+
+        Note:
+            A group ends after a result whose cache key hashes to a boundary
+            (about one in fan_in - 1), so group edges depend on the results
+            themselves rather than their positions: inserting or removing a
+            chunk only regroups its neighbourhood, and the rest of the tree
+            stays cached. fan_in and the budget still cap every group.
+
+            A group is never closed with fewer than two results, otherwise
+            oversized results would each stay alone and the reduce would
+            never converge. _reduce_messages() trims those instead.
+        """
+        divisor = max(2, self.fan_in - 1)
+        group: List[Tuple[str, str]] = []
+        tokens = 0
+        for item in items:
+            item_tokens = self.tokenizer(item[1])
+            over_budget = len(group) >= 2 and tokens + item_tokens > self.max_chunk_tokens
+            if group and (len(group) >= self.fan_in or over_budget):
+                yield group
+                group, tokens = [], 0
+            group.append(item)
+            tokens += item_tokens
+            if len(group) >= 2 and int(item[0][:8], 16) % divisor == 0:
+                yield group
+                group, tokens = [], 0
+        if group:
+            yield group
+
+    def run(
+        self,
+        root: Optional[str] = None,
+        chunks: Optional[List[Chunk]] = None,
+        on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyze a codebase.
+
+        Args:
+            root: Codebase root (chunked with chunk_codebase())
+            chunks: Pre-built chunks (instead of root)
+            on_chunk: Called with streamed text of the final reduce
+
+        Returns:
+            Dict: success, result, chunks, levels (reduce tree depth),
+                map_calls, reduce_calls, cache_hits, wall_ms, or error
+        """
+        start = time.perf_counter()
+        stats = {'map_calls': 0, 'reduce_calls': 0, 'cache_hits': 0}
+
+        try:
+            if chunks is None:
+                if root is None:
+                    raise ValueError("Either root or chunks is required")
+                chunks = chunk_codebase(root, self.max_chunk_tokens, tokenizer=self.tokenizer)
+            if not chunks:
+                raise ValueError("No source files found to analyze")
+
+            logger.info(f"Analyzing {len(chunks)} chunks (budget {self.max_chunk_tokens} tokens)")
+
+            # Map
+            level = [(self._key('map', chunk.sha256), chunk) for chunk in chunks]
+            missing = [(key, chunk) for key, chunk in level if self._cached(key) is None]
+            stats['cache_hits'] += len(level) - len(missing)
+            if missing:
+                responses = self.provider.batch(
+                    [[{'role': 'user', 'content': f"{self.map_prompt}\n\n{chunk.text}"}] for _, chunk in missing],
+                    model=self.model,
+                    **self.kwargs
+                )
+                stats['map_calls'] += len(missing)
+                for (key, _), response in zip(missing, responses):
+                    self._store(key, response)
+
+            results = [(key, self._cached(key)) for key, _ in level]
+
+            # Reduce, level by level, until one result is left
+            levels = 0
+            streamed = False
+            while len(results) > 1:
+                levels += 1
+                groups = list(self._groups(results))
+                final = len(groups) == 1
+                keyed = [(self._key('reduce', *(key for key, _ in group)), group) for group in groups]
+
+                todo = []
+                for key, group in keyed:
+                    if len(group) == 1:
+                        # Nothing to merge; carry the result up unchanged
+                        self._memory.setdefault(key, group[0][1])
+                    elif self._cached(key) is None:
+                        todo.append((key, group))
+                    else:
+                        stats['cache_hits'] += 1
+
+                if final and todo and on_chunk is not None:
+                    key, group = todo[0]
+                    pieces = []
+                    for piece in self.provider.stream(self._reduce_messages([text for _, text in group]), model=self.model, **self.kwargs):
+                        pieces.append(piece)
+                        on_chunk(piece)
+                    self._store(key, ''.join(pieces))
+                    streamed = True
+                elif todo:
+                    responses = self.provider.batch(
+                        [self._reduce_messages([text for _, text in group]) for _, group in todo],
+                        model=self.model,
+                        **self.kwargs
+                    )
+                    for (key, _), response in zip(todo, responses):
+                        self._store(key, response)
+                stats['reduce_calls'] += len(todo)
+
+                results = [(key, self._cached(key)) for key, _ in keyed]
+
+            result = results[0][1]
+            if on_chunk is not None and not streamed:
+                # Single chunk or fully cached: deliver the result in one piece
+                on_chunk(result)
+
+            wall_ms = (time.perf_counter() - start) * 1000
+            logger.info(
+                f"Map-reduce finished in {wall_ms / 1000:.1f}s: {stats['map_calls']} map and "
+                f"{stats['reduce_calls']} reduce calls, {stats['cache_hits']} cache hits"
+            )
+            return {
+                'success': True,
+                'result': result,
+                'chunks': len(chunks),
+                'levels': levels,
+                'wall_ms': wall_ms,
+                **stats,
+            }
+
+        except Exception as e:
+            logger.error(f"Map-reduce analysis failed: {e}")
+            return {'success': False, 'error': str(e), **stats}
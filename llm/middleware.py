@@ -0,0 +1,435 @@
+"""
+Provider Middleware
+
+Composable interceptors around LLMProvider.invoke/stream/batch, so
+cross-cutting concerns (tracing, profiling, caching, redaction, logging)
+are written once and applied to every provider by LLMFactory:
+
+    llm:
+      middleware:                 # outermost first, applied to all providers
+        - type: tracing
+          path: ~/.claude/logs/traces/llm-spans.jsonl
+        - type: profiler
+          threshold_ms: 10000
+        - class: mypackage.redact:RedactSecrets   # any Middleware subclass
+      providers:
+        ollama:
+          middleware: [...]       # optional, inside the global chain
+
+A middleware overrides any of invoke(call, call_next), stream(call,
+call_next) and batch(call, call_next); each receives a Call it may modify
+and must return call_next(call) or a replacement result. stream() returns
+an iterator. Requests issued internally by a provider's batch() do not
+pass through the chain again; batch() is intercepted as one call.
+"""
+
+import importlib
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type
+
+from . import tracing
+from .provider import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+
+class Call:
+    """
+    One intercepted provider call.
+    """
+
+    def __init__(
+        self,
+        provider: LLMProvider,
+        provider_name: str,
+        method: str,
+        messages: List[Any],
+        model: Optional[str],
+        kwargs: Dict[str, Any]
+    ):
+        """
+        Initialize call.
+
+        Args:
+            provider: Underlying provider
+            provider_name: Configured provider name (e.g. 'ollama', 'vllm')
+            method: 'invoke', 'stream' or 'batch'
+            messages: Messages (invoke/stream) or list of message lists (batch)
+            model: Requested model (None = provider default)
+            kwargs: Remaining provider parameters
+        """
+        self.provider = provider
+        self.provider_name = provider_name
+        self.method = method
+        self.messages = messages
+        self.model = model
+        self.kwargs = kwargs
+
+        # Free-form values shared between middleware of one call
+        self.metadata: Dict[str, Any] = {}
+
+    @property
+    def resolved_model(self) -> Optional[str]:
+        """The model that will actually be used."""
+        return self.model or getattr(self.provider, 'default_model', None)
+
+
+class Middleware:
+    """
+    Base class; each hook passes through unless overridden.
+    """
+
+    def invoke(self, call: Call, call_next: Callable[[Call], str]) -> str:
+        """Intercept a synchronous invocation."""
+        return call_next(call)
+
+    def stream(self, call: Call, call_next: Callable[[Call], Iterator[str]]) -> Iterator[str]:
+        """Intercept a streaming invocation."""
+        return call_next(call)
+
+    def batch(self, call: Call, call_next: Callable[[Call], List[str]]) -> List[str]:
+        """Intercept a batch invocation."""
+        return call_next(call)
+
+
+class MiddlewareProvider(LLMProvider):
+    """
+    Provider proxy that routes invoke/stream/batch through a middleware chain.
+
+    Every other attribute (default_model, batch_concurrency, telemetry,
+    provider-specific methods) is the wrapped provider's.
+    """
+
+    def __init__(self, provider: LLMProvider, middleware: List[Middleware], provider_name: str):
+        """
+        Wrap a provider.
+
+        Args:
+            provider: Provider to wrap
+            middleware: Chain, outermost first
+            provider_name: Configured provider name
+        """
+        # No super().__init__(): configuration and telemetry stay on the wrapped provider
+        self.provider = provider
+        self.middleware = list(middleware)
+        self.provider_name = provider_name
+
+    def __getattr__(self, name: str) -> Any:
+        # Only called for attributes not found on the proxy itself
+        return getattr(self.__dict__['provider'], name)
+
+    def __repr__(self) -> str:
+        return f"<{self.name} via {len(self.middleware)} middleware>"
+
+    @property
+    def name(self) -> str:
+        """Wrapped provider's class name."""
+        return self.provider.name
+
+    def _run(self, method: str, call: Call) -> Any:
+        """Call the chain for one method."""
+        def terminal(c: Call) -> Any:
+            return getattr(self.provider, method)(c.messages, model=c.model, **c.kwargs)
+
+        handler = terminal
+        for middleware in reversed(self.middleware):
+            handler = (lambda mw, nxt: lambda c: getattr(mw, method)(c, nxt))(middleware, handler)
+        return handler(call)
+
+    def invoke(self, messages: List[Dict[str, str]], model: Optional[str] = None, **kwargs) -> str:
+        """Invoke through the middleware chain (see LLMProvider.invoke)."""
+        return self._run('invoke', Call(self.provider, self.provider_name, 'invoke', messages, model, kwargs))
+
+    def stream(self, messages: List[Dict[str, str]], model: Optional[str] = None, **kwargs) -> Iterator[str]:
+        """Stream through the middleware chain (see LLMProvider.stream)."""
+        return self._run('stream', Call(self.provider, self.provider_name, 'stream', messages, model, kwargs))
+
+    def batch(self, message_batches: List[List[Dict[str, str]]], model: Optional[str] = None, **kwargs) -> List[str]:
+        """Batch through the middleware chain (see LLMProvider.batch)."""
+        return self._run('batch', Call(self.provider, self.provider_name, 'batch', message_batches, model, kwargs))
+
+    def is_available(self) -> bool:
+        return self.provider.is_available()
+
+    def get_model_info(self, *args, **kwargs) -> Dict[str, Any]:
+        return self.provider.get_model_info(*args, **kwargs)
+
+    def get_telemetry(self, clear: bool = False) -> List[Dict[str, Any]]:
+        return self.provider.get_telemetry(clear)
+
+    def is_retryable(self, error: Exception) -> bool:
+        return self.provider.is_retryable(error)
+
+    def validate_messages(self, messages: List[Dict[str, str]]) -> None:
+        self.provider.validate_messages(messages)
+
+
+class TracingMiddleware(Middleware):
+    """
+    Emits one span per request, with request phases as child spans.
+    """
+
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 1.0, service_name: str = 'llm'):
+        """
+        Install the process-wide tracer (see tracing.configure_tracing).
+
+        Args:
+            path: Trace file (default: <log dir>/traces/llm-spans.jsonl)
+            sample_rate: Fraction of traces recorded
+            service_name: service.name resource attribute
+        """
+        self.tracer = tracing.configure_tracing(path, sample_rate, service_name)
+
+    def _attributes(self, call: Call) -> Dict[str, Any]:
+        """Request attributes (OpenTelemetry gen_ai conventions where they exist)."""
+        attributes = {
+            'gen_ai.system': call.provider_name,
+            'gen_ai.request.model': call.resolved_model,
+            'gen_ai.request.max_tokens': call.kwargs.get('max_tokens'),
+            'gen_ai.request.temperature': call.kwargs.get('temperature'),
+            'llm.provider': call.provider.name,
+        }
+        if call.method == 'batch':
+            attributes['llm.batch.size'] = len(call.messages)
+        else:
+            attributes['llm.messages'] = len(call.messages)
+        return attributes
+
+    def invoke(self, call: Call, call_next: Callable[[Call], str]) -> str:
+        with tracing.span('llm.invoke', kind=tracing.SPAN_KIND_CLIENT, **self._attributes(call)) as span:
+            result = call_next(call)
+            if span is not None:
+                span.set_attribute('llm.response_chars', len(result))
+            return result
+
+    def stream(self, call: Call, call_next: Callable[[Call], Iterator[str]]) -> Iterator[str]:
+        return tracing.traced_iter('llm.stream', call_next(call), kind=tracing.SPAN_KIND_CLIENT, **self._attributes(call))
+
+    def batch(self, call: Call, call_next: Callable[[Call], List[str]]) -> List[str]:
+        with tracing.span('llm.batch', kind=tracing.SPAN_KIND_CLIENT, **self._attributes(call)):
+            return call_next(call)
+
+
+class ProfilerMiddleware(Middleware):
+    """
+    Sampling profiler for slow requests.
+
+    While requests are in flight, one background thread samples the stacks
+    of the threads running them every interval_ms. Samples of requests
+    that finish under threshold_ms are discarded; for slower ones they are
+    written in folded-stack format (flamegraph.pl, speedscope) and passed
+    to the optional hook.
+    """
+
+    def __init__(
+        self,
+        threshold_ms: float = 10000,
+        interval_ms: float = 10,
+        output_dir: Optional[str] = None,
+        hook: Optional[Any] = None,
+        max_depth: int = 64
+    ):
+        """
+        Initialize profiler.
+
+        Args:
+            threshold_ms: Requests slower than this are reported
+            interval_ms: Sampling interval
+            output_dir: Directory for .folded profiles (default:
+                <log dir>/profiles; '' disables writing)
+            hook: Callable or 'module:function' called as
+                hook(call, elapsed_ms, stacks) for slow requests
+            max_depth: Frames kept per sample (innermost)
+        """
+        self.threshold_ms = threshold_ms
+        self.interval = interval_ms / 1000
+        if output_dir is None:
+            output_dir = str(tracing.default_trace_path().parent.parent / 'profiles')
+        self.output_dir = Path(output_dir).expanduser() if output_dir else None
+        self.hook = _load_object(hook) if isinstance(hook, str) else hook
+        self.max_depth = max_depth
+
+        self.slow_requests = 0
+        self._active: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def _fold(self, frame) -> str:
+        """Collapse a stack into 'outer;...;inner' frame names."""
+        names = []
+        while frame is not None and len(names) < self.max_depth:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _sample(self) -> None:
+        """Sampler thread; exits when no requests are in flight."""
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                entries = [entry for entry in self._active.values() if entry['running']]
+            frames = sys._current_frames()
+            for entry in entries:
+                frame = frames.get(entry['thread'])
+                if frame is not None:
+                    entry['stacks'][self._fold(frame)] += 1
+
+    def _begin(self) -> Dict[str, Any]:
+        """Register the current thread's request."""
+        entry = {'thread': threading.get_ident(), 'start': time.perf_counter(), 'running': True, 'stacks': Counter()}
+        with self._lock:
+            self._active[id(entry)] = entry
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='llm-profiler', daemon=True)
+                self._thread.start()
+        return entry
+
+    def _finish(self, call: Call, entry: Dict[str, Any]) -> None:
+        """Unregister a request and report it if slow."""
+        with self._lock:
+            self._active.pop(id(entry), None)
+        elapsed_ms = (time.perf_counter() - entry['start']) * 1000
+        if elapsed_ms < self.threshold_ms:
+            return
+
+        self.slow_requests += 1
+        stacks = dict(entry['stacks'])
+        path = self._write(call, stacks) if stacks else None
+        logger.warning(
+            f"Slow {call.method} to {call.provider_name}/{call.resolved_model}: {elapsed_ms:.0f} ms"
+            + (f"; profile written to {path}" if path else '')
+        )
+
+        span = tracing.current_span()
+        if span is not None:
+            span.set_attributes({'llm.slow': True, 'llm.profile': str(path) if path else None})
+
+        if self.hook is not None:
+            try:
+                self.hook(call, elapsed_ms, stacks)
+            except Exception as e:
+                logger.error(f"Slow-request hook failed: {e}")
+
+    def _write(self, call: Call, stacks: Dict[str, int]) -> Optional[Path]:
+        """Write folded stacks; returns the file path."""
+        if self.output_dir is None:
+            return None
+        model = str(call.resolved_model or 'default').replace('/', '_').replace(':', '_')
+        path = self.output_dir / f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{call.method}-{model}.folded"
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                for stack, count in sorted(stacks.items(), key=lambda item: -item[1]):
+                    f.write(f"{stack} {count}\n")
+            return path
+        except OSError as e:
+            logger.warning(f"Failed to write profile {path}: {e}")
+            return None
+
+    def invoke(self, call: Call, call_next: Callable[[Call], str]) -> str:
+        entry = self._begin()
+        try:
+            return call_next(call)
+        finally:
+            self._finish(call, entry)
+
+    def batch(self, call: Call, call_next: Callable[[Call], List[str]]) -> List[str]:
+        # Samples the calling thread; worker threads show up as waits
+        entry = self._begin()
+        try:
+            return call_next(call)
+        finally:
+            self._finish(call, entry)
+
+    def stream(self, call: Call, call_next: Callable[[Call], Iterator[str]]) -> Iterator[str]:
+        def profiled() -> Iterator[str]:
+            entry = self._begin()
+            try:
+                iterator = iter(call_next(call))
+                while True:
+                    # Only sample while the stream is producing, not while the consumer works
+                    entry['running'] = True
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        entry['running'] = False
+                    yield chunk
+            finally:
+                self._finish(call, entry)
+
+        return profiled()
+
+
+_MIDDLEWARE_TYPES: Dict[str, Type[Middleware]] = {
+    'tracing': TracingMiddleware,
+    'profiler': ProfilerMiddleware,
+}
+
+
+def register_middleware(type_name: str, middleware_class: Type[Middleware]) -> None:
+    """
+    Register a middleware class for use as `type:` in llm_config.yaml.
+
+    Args:
+        type_name: Name used in configuration
+        middleware_class: Middleware subclass
+    """
+    _MIDDLEWARE_TYPES[type_name] = middleware_class
+
+
+def _load_object(path: str) -> Any:
+    """Import 'package.module:attribute'."""
+    module_name, _, attribute = path.partition(':')
+    if not attribute:
+        raise ValueError(f"Expected 'module:attribute', got '{path}'")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+def build_middleware(specs: Optional[List[Dict[str, Any]]]) -> List[Middleware]:
+    """
+    Instantiate middleware from configuration.
+
+    Args:
+        specs: Entries with either 'type' (a registered name) or 'class'
+            ('module:Class'); remaining keys are constructor arguments.
+            Entries with enabled: false are skipped
+
+    Returns:
+        List[Middleware]: Chain, outermost first
+
+    Raises:
+        ValueError: If an entry names an unknown type or is malformed
+    """
+    chain: List[Middleware] = []
+    for spec in specs or []:
+        options = dict(spec)
+        if not options.pop('enabled', True):
+            continue
+        type_name = options.pop('type', None)
+        class_path = options.pop('class', None)
+
+        if class_path:
+            middleware_class = _load_object(class_path)
+        elif type_name in _MIDDLEWARE_TYPES:
+            middleware_class = _MIDDLEWARE_TYPES[type_name]
+        else:
+            raise ValueError(
+                f"Unknown middleware {type_name or spec!r}. "
+                f"Use one of {sorted(_MIDDLEWARE_TYPES)} or 'class: module:Class'"
+            )
+
+        chain.append(middleware_class(**options))
+        logger.debug(f"Configured middleware {middleware_class.__name__}")
+    return chain
@@ -0,0 +1,560 @@
+"""
+Ollama Model Store Management
+
+Keeps the models the configuration needs on disk, and keeps downloads out
+of the request path:
+
+- Prefetch: all configured and routed models are pulled in parallel
+  (settings.model_store.pull_concurrency) in the background at startup
+  (prefetch_on_startup, on by default) or on demand, with per-model
+  progress reporting.
+- No inline pulls while prefetching: a request for a model that is not on
+  disk fails fast with ModelNotAvailable, instead of stalling for a
+  multi-GB download, unless the call passes allow_pull=True. With
+  prefetch_on_startup off, missing models are pulled inline as before
+  (allow_inline_pull defaults to the opposite of prefetch_on_startup).
+- Disk budget: last use of every model is tracked (persisted across
+  processes). When disk_budget_gb is exceeded, the least recently used
+  models are deleted. Models named in task_routing, the default model,
+  pinned models and recently used models are never evicted.
+- The local model list is cached (list_ttl), so the per-request
+  availability check no longer costs a round trip to the server.
+
+Usage:
+    python -m llm.model_store status
+    python -m llm.model_store prefetch
+    python -m llm.model_store evict --dry-run
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+
+from .resilience import Deadline
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_STATE_FILE = Path.home() / '.claude' / 'llm' / 'model-usage.json'
+
+ProgressCallback = Callable[[str, Dict[str, Any]], None]
+
+
+class ModelNotAvailable(RuntimeError):
+    """The model is not on disk and pulling it inline is not allowed."""
+
+
+def normalize_model_name(name: str) -> str:
+    """Add Ollama's implicit ':latest' tag ('llama3' -> 'llama3:latest')."""
+    return name if ':' in name.rsplit('/', 1)[-1] else f"{name}:latest"
+
+
+def _timestamp(value: Any) -> float:
+    """Epoch seconds from an Ollama modified_at value (0 if unparseable)."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if not value:
+        return 0.0
+    # Ollama reports nanoseconds, which fromisoformat() does not accept
+    text = re.sub(r'(\.\d{6})\d+', r'\1', str(value)).replace('Z', '+00:00')
+    try:
+        return datetime.fromisoformat(text).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class ModelStore:
+    """
+    Disk-aware manager for an Ollama provider's local models.
+    """
+
+    def __init__(
+        self,
+        provider: Any,
+        config: Optional[Dict[str, Any]] = None,
+        protected: Optional[Iterable[str]] = None
+    ):
+        """
+        Initialize store.
+
+        Args:
+            provider: OllamaProvider whose client and models config are used
+            config: settings.model_store section (disk_budget_gb,
+                pull_concurrency, prefetch_on_startup, allow_inline_pull,
+                min_idle_seconds, list_ttl, pinned, state_file)
+            protected: Models that must never be evicted (task routing)
+        """
+        config = config or {}
+        self.provider = provider
+
+        budget_gb = config.get('disk_budget_gb')
+        self.disk_budget_bytes = int(budget_gb * 1e9) if budget_gb else None
+        self.pull_concurrency = max(1, config.get('pull_concurrency', 2))
+        self.prefetch_on_startup = config.get('prefetch_on_startup', True)
+        # Without a prefetch, pulling inline is the only way a model arrives
+        self.allow_inline_pull = config.get('allow_inline_pull', not self.prefetch_on_startup)
+        self.min_idle_seconds = config.get('min_idle_seconds', 300)
+        self.list_ttl = config.get('list_ttl', 30)
+        self.state_file = Path(config.get('state_file') or DEFAULT_STATE_FILE).expanduser()
+
+        self.protected: Set[str] = {
+            normalize_model_name(m) for m in list(protected or []) + list(config.get('pinned', []))
+        }
+
+        # Pull progress per model: status, completed, total, done, error
+        self.progress: Dict[str, Dict[str, Any]] = {}
+
+        self._local: Dict[str, Dict[str, Any]] = {}
+        self._listed_at = 0.0
+        self._last_used: Dict[str, float] = self._load_state()
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        self._forgotten: Set[str] = set()
+        self._pulls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._evict_lock = threading.Lock()
+
+        atexit.register(self.save)
+
+    @property
+    def configured_models(self) -> Set[str]:
+        """Models named in the provider's models section or protected."""
+        models = self.provider.config.get('models', {}) or {}
+        return {normalize_model_name(m) for m in models.values() if m} | self.protected
+
+    def _load_state(self) -> Dict[str, float]:
+        """Read persisted last-use times."""
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return {k: float(v) for k, v in json.load(f).get('last_used', {}).items()}
+        except (OSError, ValueError, AttributeError):
+            return {}
+
+    def save(self) -> None:
+        """Persist last-use times, merged with other processes' updates."""
+        with self._lock:
+            if not self._dirty:
+                return
+            merged = self._load_state()
+            for model in self._forgotten:
+                merged.pop(model, None)
+            for model, ts in self._last_used.items():
+                merged[model] = max(ts, merged.get(model, 0.0))
+            self._last_used = merged
+            self._dirty = False
+            self._saved_at = time.monotonic()
+
+        try:
+            self.state_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.state_file.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'last_used': merged}, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.state_file)
+        except OSError as e:
+            logger.warning(f"Failed to save model usage to {self.state_file}: {e}")
+
+    def touch(self, model: str) -> None:
+        """
+        Record a use of a model.
+
+        Args:
+            model: Model name
+        """
+        with self._lock:
+            name = normalize_model_name(model)
+            self._last_used[name] = time.time()
+            self._forgotten.discard(name)
+            self._dirty = True
+            due = time.monotonic() - self._saved_at > 60
+        if due:
+            self.save()
+
+    def forget(self, model: str) -> None:
+        """Drop a deleted model from the cache and usage records."""
+        name = normalize_model_name(model)
+        with self._lock:
+            self._local.pop(name, None)
+            self._last_used.pop(name, None)
+            self._forgotten.add(name)
+            self._dirty = True
+
+    def refresh(self, deadline: Optional[Deadline] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Re-read the local model list from the server.
+
+        Args:
+            deadline: Bounds the list request
+
+        Returns:
+            Dict: Model name -> list entry (size, modified_at, digest, ...)
+        """
+        models = self.provider.list_tags(deadline)
+        local = {}
+        for entry in models.get('models', []):
+            name = entry.get('name') or entry.get('model')
+            if name:
+                local[normalize_model_name(name)] = entry
+        with self._lock:
+            self._local = local
+            self._listed_at = time.monotonic()
+        return local
+
+    def local_models(self, deadline: Optional[Deadline] = None) -> Dict[str, Dict[str, Any]]:
+        """Local model list, refreshed when older than list_ttl."""
+        if time.monotonic() - self._listed_at > self.list_ttl:
+            return self.refresh(deadline)
+        return self._local
+
+    def is_local(self, model: str, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Whether a model is on disk (re-listing once before answering no).
+
+        Args:
+            model: Model name
+            deadline: Bounds the list requests
+        """
+        name = normalize_model_name(model)
+        if name in self.local_models(deadline):
+            return True
+        return name in self.refresh(deadline)
+
+    def ensure(self, model: str, allow_pull: Optional[bool] = None, deadline: Optional[Deadline] = None) -> bool:
+        """
+        Make sure a model can serve a request.
+
+        Args:
+            model: Model name
+            allow_pull: Pull (and wait) if missing; default settings
+                model_store.allow_inline_pull
+            deadline: Bounds the list requests (an inline pull ignores it)
+
+        Returns:
+            bool: True if the model had to be pulled
+
+        Raises:
+            ModelNotAvailable: If the model is missing and pulling is not allowed
+            DeadlineExceeded: If the deadline passes while listing models
+            ResponseError: If the pull fails
+        """
+        name = normalize_model_name(model)
+        if self.is_local(name, deadline):
+            self.touch(name)
+            return False
+
+        allowed = self.allow_inline_pull if allow_pull is None else allow_pull
+        if not allowed:
+            progress = self.progress.get(name, {})
+            if name in self._pulls and progress.get('total'):
+                state = f"still downloading ({100 * progress.get('completed', 0) / progress['total']:.0f}%)"
+            elif name in self._pulls:
+                state = 'still downloading'
+            else:
+                state = 'not pulled'
+            raise ModelNotAvailable(
+                f"Model {model} is {state}. Prefetch it (python -m llm.model_store prefetch) "
+                f"or pass allow_pull=True to wait for the download"
+            )
+
+        logger.warning(f"Pulling {model} inline; this request waits for the download")
+        self.pull(name)
+        self.touch(name)
+        return True
+
+    def pull(self, model: str, on_progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Pull a model, joining an in-progress pull of the same model.
+
+        Args:
+            model: Model name
+            on_progress: Called as on_progress(model, progress) per update
+
+        Returns:
+            Dict: success, model, seconds, size
+
+        Raises:
+            ResponseError: If the pull fails
+        """
+        name = normalize_model_name(model)
+        with self._lock:
+            future = self._pulls.get(name)
+            owner = future is None
+            if owner:
+                future = self._pulls[name] = Future()
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = self._pull(name, on_progress)
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pulls.pop(name, None)
+
+    def _pull(self, name: str, on_progress: Optional[ProgressCallback]) -> Dict[str, Any]:
+        """Stream one pull, tracking progress; then apply the disk budget."""
+        logger.info(f"Pulling model {name}...")
+        start = time.perf_counter()
+        progress = self.progress[name] = {'status': 'starting', 'completed': 0, 'total': 0, 'done': False}
+        layers: Dict[str, List[int]] = {}
+        next_log = 0.1
+
+        try:
+            for update in self.provider.client.pull(name, stream=True):
+                progress['status'] = update.get('status') or progress['status']
+                # Updates report per-layer byte counts; sum them for the model
+                if update.get('digest') and update.get('total'):
+                    layers[update['digest']] = [update.get('completed') or 0, update['total']]
+                    progress['completed'] = sum(done for done, _ in layers.values())
+                    progress['total'] = sum(total for _, total in layers.values())
+                if on_progress is not None:
+                    on_progress(name, dict(progress))
+                if progress['total'] and progress['completed'] / progress['total'] >= next_log:
+                    logger.info(f"Pulling {name}: {100 * progress['completed'] / progress['total']:.0f}%")
+                    next_log += 0.1
+        except Exception as e:
+            progress.update({'status': 'failed', 'error': str(e), 'done': True})
+            if on_progress is not None:
+                on_progress(name, dict(progress))
+            raise
+
+        progress.update({'status': 'success', 'completed': progress['total'], 'done': True})
+        if on_progress is not None:
+            on_progress(name, dict(progress))
+
+        # A fresh pull counts as a use, so it is not the first model evicted
+        self.touch(name)
+        size = self.refresh().get(name, {}).get('size') or progress['total']
+        seconds = time.perf_counter() - start
+        logger.info(f"Pulled {name} ({size / 1e9:.1f} GB) in {seconds:.0f}s")
+
+        self.enforce_budget(keep={name})
+        return {'success': True, 'model': name, 'seconds': seconds, 'size': size}
+
+    def prefetch(
+        self,
+        models: Optional[Iterable[str]] = None,
+        on_progress: Optional[ProgressCallback] = None,
+        wait: bool = True
+    ) -> Dict[str, Any]:
+        """
+        Pull missing models in parallel.
+
+        Args:
+            models: Models to fetch (default: configured_models)
+            on_progress: Called as on_progress(model, progress) per update
+            wait: Block until all pulls finish; otherwise they continue on
+                daemon threads (so they never delay interpreter exit)
+
+        Returns:
+            Dict: Model -> result dict ('success', plus 'error' or timing)
+                when waiting; model -> Future otherwise. Models already on
+                disk are reported with 'cached': True
+        """
+        wanted = sorted({normalize_model_name(m) for m in (models or self.configured_models)})
+        try:
+            local = self.refresh()
+        except Exception as e:
+            logger.warning(f"Cannot prefetch models, Ollama is not reachable: {e}")
+            return {name: {'success': False, 'error': str(e)} for name in wanted}
+
+        results: Dict[str, Any] = {name: {'success': True, 'cached': True} for name in wanted if name in local}
+        missing = [name for name in wanted if name not in local]
+        if not missing:
+            return results
+
+        logger.info(f"Prefetching {len(missing)} models ({self.pull_concurrency} at a time): {', '.join(missing)}")
+        slots = threading.Semaphore(self.pull_concurrency)
+        futures: Dict[str, Future] = {name: Future() for name in missing}
+
+        def worker(name: str) -> None:
+            with slots:
+                try:
+                    futures[name].set_result(self.pull(name, on_progress))
+                except Exception as e:
+                    logger.error(f"Prefetch of {name} failed: {e}")
+                    futures[name].set_result({'success': False, 'model': name, 'error': str(e)})
+
+        threads = [threading.Thread(target=worker, args=(name,), name=f"model-prefetch-{name}", daemon=True)
+                   for name in missing]
+        for thread in threads:
+            thread.start()
+
+        if not wait:
+            results.update(futures)
+            return results
+
+        for thread in threads:
+            thread.join()
+        results.update({name: future.result() for name, future in futures.items()})
+        return results
+
+    def disk_usage(self) -> int:
+        """Bytes used by local models (shared layers are counted per model)."""
+        return sum(entry.get('size') or 0 for entry in self.local_models().values())
+
+    def _last_use(self, name: str) -> float:
+        """Last recorded use, falling back to when the model was pulled."""
+        return self._last_used.get(name) or _timestamp(self._local.get(name, {}).get('modified_at'))
+
+    def eviction_candidates(self, keep: Iterable[str] = ()) -> List[str]:
+        """
+        Evictable models, least recently used first.
+
+        Args:
+            keep: Extra models to spare
+
+        Returns:
+            List[str]: Unprotected models idle for at least min_idle_seconds
+        """
+        spared = self.protected | {normalize_model_name(m) for m in keep} | set(self._pulls)
+        idle_before = time.time() - self.min_idle_seconds
+        candidates = [
+            name for name in self.local_models()
+            if name not in spared and self._last_use(name) <= idle_before
+        ]
+        return sorted(candidates, key=self._last_use)
+
+    def enforce_budget(self, dry_run: bool = False, keep: Iterable[str] = ()) -> List[str]:
+        """
+        Delete least recently used models until usage fits the disk budget.
+
+        Args:
+            dry_run: Only report what would be deleted
+            keep: Extra models to spare (e.g. the one just pulled)
+
+        Returns:
+            List[str]: Evicted (or, with dry_run, evictable) models
+        """
+        if self.disk_budget_bytes is None:
+            return []
+
+        # Parallel pulls finish together; one eviction pass at a time, on a fresh listing
+        with self._evict_lock:
+            return self._enforce_budget(dry_run, keep)
+
+    def _enforce_budget(self, dry_run: bool, keep: Iterable[str]) -> List[str]:
+        """Body of enforce_budget(); caller holds _evict_lock."""
+        local = self.refresh()
+        usage = sum(entry.get('size') or 0 for entry in local.values())
+        evicted = []
+        for name in self.eviction_candidates(keep):
+            if usage <= self.disk_budget_bytes:
+                break
+            size = local[name].get('size') or 0
+            if dry_run:
+                logger.info(f"Would evict {name} ({size / 1e9:.1f} GB)")
+            else:
+                logger.info(f"Evicting least recently used model {name} ({size / 1e9:.1f} GB)")
+                try:
+                    self.provider.client.delete(name)
+                except Exception as e:
+                    logger.error(f"Failed to evict {name}: {e}")
+                    continue
+                self.forget(name)
+            usage -= size
+            evicted.append(name)
+
+        if usage > self.disk_budget_bytes:
+            logger.warning(
+                f"Models use {usage / 1e9:.1f} GB, over the {self.disk_budget_bytes / 1e9:.1f} GB budget, "
+                f"but the rest are protected or in use"
+            )
+        if evicted and not dry_run:
+            self.refresh()
+            self.save()
+        return evicted
+
+    def status(self) -> List[Dict[str, Any]]:
+        """
+        Describe local and configured models.
+
+        Returns:
+            List[Dict]: name, local, size, last_used (epoch or None),
+                protected, and pull progress for downloads in flight
+        """
+        local = self.local_models()
+        rows = []
+        for name in sorted(set(local) | self.configured_models):
+            last_use = self._last_use(name) if name in local else self._last_used.get(name)
+            rows.append({
+                'name': name,
+                'local': name in local,
+                'size': local.get(name, {}).get('size'),
+                'last_used': last_use or None,
+                'protected': name in self.protected,
+                'pulling': self.progress.get(name) if name in self._pulls else None,
+            })
+        return rows
+
+
+def main() -> None:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Manage the local Ollama model store')
+    parser.add_argument('--config', help='Path to llm_config.yaml (default: config/llm_config.yaml)')
+    parser.add_argument('--provider', default='ollama', help='Ollama provider name in the config')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help='List models, sizes, last use and protection')
+    prefetch_parser = subparsers.add_parser('prefetch', help='Pull configured models in parallel')
+    prefetch_parser.add_argument('models', nargs='*', help='Models to pull (default: all configured)')
+    evict_parser = subparsers.add_parser('evict', help='Apply the disk budget now')
+    evict_parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    from .factory import LLMFactory
+
+    LLMFactory.initialize(args.config)
+    # Pulls happen only through the prefetch command, never as a side effect of status/evict
+    settings = LLMFactory.get_config()['llm']['providers'][args.provider].setdefault('settings', {})
+    settings['model_store'] = {**(settings.get('model_store') or {}), 'prefetch_on_startup': False}
+    store = LLMFactory.get_provider(args.provider).store
+
+    if args.command == 'status':
+        budget = f"{store.disk_budget_bytes / 1e9:.1f} GB" if store.disk_budget_bytes else 'unlimited'
+        print(f"Disk usage: {store.disk_usage() / 1e9:.1f} GB (budget: {budget})")
+        for row in store.status():
+            last = datetime.fromtimestamp(row['last_used']).strftime('%Y-%m-%d %H:%M') if row['last_used'] else 'never'
+            size = f"{row['size'] / 1e9:.1f} GB" if row['size'] else '-'
+            flags = ('protected ' if row['protected'] else '') + ('' if row['local'] else 'missing')
+            print(f"  {row['name']:<40} {size:>9}  last used {last:<16} {flags}")
+
+    elif args.command == 'prefetch':
+        last_reported: Dict[str, tuple] = {}
+
+        def report(model: str, progress: Dict[str, Any]) -> None:
+            total = progress.get('total')
+            pct = int(100 * progress.get('completed', 0) / total) if total else None
+            # One line per status change or percent, not per network chunk
+            if last_reported.get(model) == (progress.get('status'), pct):
+                return
+            last_reported[model] = (progress.get('status'), pct)
+            print(f"{model:<40} {f'{pct:3d}%' if pct is not None else '    '} {progress.get('status', '')}", file=sys.stderr)
+
+        results = store.prefetch(args.models or None, on_progress=report)
+        failed = [name for name, result in results.items() if not result.get('success')]
+        for name in failed:
+            print(f"Failed: {name}: {results[name].get('error')}", file=sys.stderr)
+        sys.exit(1 if failed else 0)
+
+    elif args.command == 'evict':
+        evicted = store.enforce_budget(dry_run=args.dry_run)
+        print('\n'.join(evicted) if evicted else 'Nothing to evict')
+
+
+if __name__ == '__main__':
+    main()
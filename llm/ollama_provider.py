@@ -5,15 +5,27 @@ Provides local LLM capabilities using Ollama runtime.
 Supports streaming, batch processing, and automatic model management.
 """
 
+import json
 import logging
-from typing import List, Dict, Any, Iterator, Optional
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Dict, Any, Iterator, Optional
+import httpx
 import ollama
 from ollama import Client, ResponseError
 
+from . import tracing
+from .model_store import ModelStore, normalize_model_name
 from .provider import LLMProvider
+from .resilience import Deadline, DeadlineExceeded
 
 logger = logging.getLogger(__name__)
 
+# Returned while a model is loading or the server is saturated
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
 
 class OllamaProvider(LLMProvider):
     """
@@ -22,17 +34,29 @@ class OllamaProvider(LLMProvider):
     Connects to local Ollama instance to run models like Llama, Mistral, CodeLlama, etc.
     """
 
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], protected_models: Optional[Iterable[str]] = None):
         """
         Initialize Ollama provider.
 
         Args:
             config: Provider configuration from llm_config.yaml
+            protected_models: Models the model store must never evict
+                (those named in task_routing)
         """
         super().__init__(config)
 
         self.host = config.get('host', 'http://localhost:11434')
-        self.client = Client(host=self.host)
+
+        # Upper bound for any single HTTP call; per-call deadlines shorten it
+        self.request_timeout = config.get('settings', {}).get('request_timeout', 600)
+
+        # Model management (list, pull, ps, delete)
+        self.client = Client(host=self.host, timeout=self.request_timeout)
+
+        # Generation requests, so each call can carry its own timeout and be
+        # interrupted from another thread
+        base_url = self.host if '://' in self.host else f"http://{self.host}"
+        self.http = httpx.Client(base_url=base_url, timeout=self.request_timeout)
 
         # Get model configuration
         models_config = config.get('models', {})
@@ -45,6 +69,16 @@ class OllamaProvider(LLMProvider):
         self.top_p = self.settings.get('top_p', 0.9)
         self.num_ctx = self.settings.get('num_ctx', 4096)
 
+        # Should not exceed the server's OLLAMA_NUM_PARALLEL
+        self.batch_concurrency = self.settings.get('batch_concurrency', 4)
+
+        # Local models, last use and disk budget (settings.model_store)
+        self.store = ModelStore(self, self.settings.get('model_store'), protected_models)
+        if self.store.prefetch_on_startup:
+            # Listing models may be slow; keep it off the constructor's path
+            threading.Thread(target=self.store.prefetch, kwargs={'wait': False},
+                             name='model-prefetch', daemon=True).start()
+
         logger.info(f"Initialized Ollama provider at {self.host}")
         logger.info(f"Default model: {self.default_model}")
 
@@ -60,37 +94,46 @@ class OllamaProvider(LLMProvider):
         Args:
             messages: List of message dictionaries
             model: Model name override (uses default if None)
-            **kwargs: Additional parameters (temperature, max_tokens, etc.)
+            **kwargs: Additional parameters (temperature, max_tokens,
+                allow_pull, etc.)
 
         Returns:
             str: Generated response text
 
         Raises:
-            ResponseError: If Ollama request fails
+            ModelNotAvailable: If the model is not pulled and allow_pull is off
+            ResponseError: If Ollama request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes first
+            RequestCancelled: If the cancel token is triggered
+
+        Note:
+            With a deadline or cancel token the request is streamed
+            internally, so it can be interrupted mid-generation. Without
+            them it is bounded by settings.request_timeout.
         """
         self.validate_messages(messages)
 
         model = model or self.default_model
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel = kwargs.pop('cancel', None)
+
+        if deadline is not None or cancel is not None:
+            return ''.join(self.stream(messages, model=model, deadline=deadline, cancel=cancel, **kwargs))
 
         # Ensure model is available
-        self._ensure_model_available(model)
+        self._ensure_model_available(model, kwargs.pop('allow_pull', None))
 
-        # Merge settings
-        options = {
-            'temperature': kwargs.get('temperature', self.temperature),
-            'num_predict': kwargs.get('max_tokens', self.max_tokens),
-            'top_p': kwargs.get('top_p', self.top_p),
-            'num_ctx': kwargs.get('num_ctx', self.num_ctx),
-        }
+        options = self._options(kwargs)
 
         try:
             logger.debug(f"Invoking Ollama with model {model}")
-            response = self.client.chat(
-                model=model,
-                messages=messages,
-                options=options,
-                stream=False
+            start = time.perf_counter()
+            body = {'model': model, 'messages': messages, 'options': options, 'stream': False}
+            response = self._call_with_retries(
+                lambda: self._send('POST', '/api/chat', body, what=f"Ollama request to {model}").json(),
+                what=f"Ollama request to {model}"
             )
+            self._record_response_telemetry(model, response, start)
 
             return response['message']['content']
 
@@ -110,45 +153,201 @@ class OllamaProvider(LLMProvider):
         Args:
             messages: List of message dictionaries
             model: Model name override (uses default if None)
-            **kwargs: Additional parameters
+            **kwargs: Additional parameters (see invoke)
 
         Yields:
             str: Chunks of generated response text
 
         Raises:
-            ResponseError: If Ollama request fails
+            ModelNotAvailable: If the model is not pulled and allow_pull is off
+            ResponseError: If Ollama request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes mid-stream
+            RequestCancelled: If the cancel token is triggered
+
+        Note:
+            Every HTTP read is bounded by the time left in the deadline.
+            Once the response is open, cancel() and the deadline also
+            interrupt a stalled read from another thread. Closing the
+            response makes Ollama abort the generation server-side.
         """
         self.validate_messages(messages)
 
         model = model or self.default_model
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel = kwargs.pop('cancel', None)
 
         # Ensure model is available
-        self._ensure_model_available(model)
+        self._ensure_model_available(model, kwargs.pop('allow_pull', None), deadline)
 
-        # Merge settings
-        options = {
-            'temperature': kwargs.get('temperature', self.temperature),
-            'num_predict': kwargs.get('max_tokens', self.max_tokens),
-            'top_p': kwargs.get('top_p', self.top_p),
-            'num_ctx': kwargs.get('num_ctx', self.num_ctx),
-        }
+        options = self._options(kwargs)
+
+        what = f"Ollama stream from {model}"
+        body = {'model': model, 'messages': messages, 'options': options, 'stream': True}
 
+        logger.debug(f"Streaming from Ollama with model {model}")
+        start = time.perf_counter()
         try:
-            logger.debug(f"Streaming from Ollama with model {model}")
-            stream = self.client.chat(
-                model=model,
-                messages=messages,
-                options=options,
-                stream=True
+            response = self._call_with_retries(
+                lambda: self._send('POST', '/api/chat', body, deadline, stream=True, what=what),
+                deadline,
+                cancel,
+                what=what
             )
+        except (ResponseError, httpx.HTTPError) as e:
+            logger.error(f"Ollama streaming failed: {e}")
+            raise
+
+        abort = self._aborter(response)
+        unregister = cancel.on_cancel(abort) if cancel is not None else None
+        timer = None
+        if deadline is not None:
+            timer = threading.Timer(max(0.0, deadline.remaining()), abort)
+            timer.daemon = True
+            timer.start()
 
-            for chunk in stream:
+        first_token = None
+        done = False
+        try:
+            for line in response.iter_lines():
+                if cancel is not None:
+                    cancel.check()
+                if deadline is not None:
+                    deadline.check(what)
+
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('error'):
+                    raise ResponseError(chunk['error'])
+
+                if chunk.get('done'):
+                    done = True
+                    self._record_response_telemetry(model, chunk, start, first_token)
                 if 'message' in chunk and 'content' in chunk['message']:
+                    if first_token is None and chunk['message']['content']:
+                        first_token = time.perf_counter()
                     yield chunk['message']['content']
 
+            if not done:
+                # A shut-down connection can also read as a clean end of stream
+                if cancel is not None:
+                    cancel.check()
+                if deadline is not None:
+                    deadline.check(what)
+
+        except httpx.HTTPError as e:
+            # A read interrupted by cancel() or the deadline timer
+            if cancel is not None:
+                cancel.check()
+            if deadline is not None:
+                deadline.check(what)
+            logger.error(f"Ollama streaming failed: {e}")
+            raise
         except ResponseError as e:
             logger.error(f"Ollama streaming failed: {e}")
             raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            if unregister is not None:
+                unregister()
+            # Also runs when the consumer stops iterating early
+            response.close()
+
+    def _send(
+        self,
+        method: str,
+        path: str,
+        body: Optional[Dict[str, Any]] = None,
+        deadline: Optional[Deadline] = None,
+        stream: bool = False,
+        what: str = 'Ollama request'
+    ) -> httpx.Response:
+        """
+        Send one request to the Ollama API.
+
+        Args:
+            method: HTTP method
+            path: API path, e.g. /api/chat
+            body: JSON request body
+            deadline: Bounds the connect and every read (with request_timeout)
+            stream: Return before the body is read
+            what: Description for the deadline error
+
+        Returns:
+            httpx.Response: Response with a 2xx status
+
+        Raises:
+            ResponseError: On an error status, as raised by the ollama client
+            DeadlineExceeded: If the deadline passes while waiting for the server
+            httpx.TransportError: On connection failures and request_timeout
+        """
+        timeout = self.request_timeout
+        if deadline is not None:
+            timeout = max(0.001, min(timeout, deadline.remaining()))
+
+        request = self.http.build_request(method, path, json=body, timeout=timeout)
+        try:
+            response = self.http.send(request, stream=stream)
+        except httpx.TimeoutException:
+            if deadline is not None and timeout < self.request_timeout:
+                raise DeadlineExceeded(f"{what} exceeded its {deadline.timeout:.1f}s deadline") from None
+            raise
+
+        if response.status_code >= 400:
+            response.read()
+            response.close()
+            try:
+                message = response.json().get('error') or response.text
+            except ValueError:
+                message = response.text
+            raise ResponseError(message, response.status_code)
+        return response
+
+    @staticmethod
+    def _aborter(response: httpx.Response) -> Callable[[], None]:
+        """
+        Build a function that interrupts a read blocked on the response.
+
+        Note:
+            Meant to be called from another thread. Closing the socket does
+            not wake a thread blocked in recv(); shutting it down does, and
+            the reader then gets an httpx.ReadError.
+        """
+        def abort() -> None:
+            network_stream = response.extensions.get('network_stream')
+            sock = network_stream.get_extra_info('socket') if network_stream is not None else None
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+        return abort
+
+    def _options(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge per-call parameters with the configured defaults."""
+        return {
+            'temperature': kwargs.get('temperature', self.temperature),
+            'num_predict': kwargs.get('max_tokens', self.max_tokens),
+            'top_p': kwargs.get('top_p', self.top_p),
+            'num_ctx': kwargs.get('num_ctx', self.num_ctx),
+        }
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Whether an Ollama error is transient.
+
+        Args:
+            error: Exception from a request attempt
+
+        Returns:
+            bool: True for 408/429/5xx responses and transport errors
+        """
+        if isinstance(error, ResponseError):
+            return getattr(error, 'status_code', None) in RETRYABLE_STATUS
+
+        return isinstance(error, httpx.TransportError) or super().is_retryable(error)
 
     def batch(
         self,
@@ -160,25 +359,73 @@ class OllamaProvider(LLMProvider):
         Batch invocation of Ollama model.
 
         Note:
-            Currently processes sequentially. Could be parallelized
-            if Ollama supports concurrent requests in future.
+            Requests are sent concurrently, up to settings.batch_concurrency
+            at a time. Set it no higher than the server's OLLAMA_NUM_PARALLEL,
+            otherwise extra requests just queue server-side.
 
         Args:
             message_batches: List of message lists
             model: Model name override
-            **kwargs: Additional parameters
+            **kwargs: Additional parameters (batch_concurrency overrides the
+                setting; deadline/timeout and cancel apply to the whole batch)
 
         Returns:
-            List[str]: List of generated responses
+            List[str]: List of generated responses, in input order
         """
         model = model or self.default_model
+        concurrency = kwargs.pop('batch_concurrency', self.batch_concurrency)
+
+        # One deadline for the whole batch, shared by every request
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        if deadline is not None:
+            kwargs['deadline'] = deadline
 
-        results = []
-        for messages in message_batches:
-            response = self.invoke(messages, model=model, **kwargs)
-            results.append(response)
+        if not message_batches:
+            return []
 
-        return results
+        # Check (or pull) once up front rather than from every worker
+        self._ensure_model_available(model, kwargs.pop('allow_pull', None))
+
+        if concurrency <= 1 or len(message_batches) == 1:
+            return [self.invoke(messages, model=model, **kwargs) for messages in message_batches]
+
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(message_batches))) as pool:
+            return list(pool.map(
+                lambda messages: self.invoke(messages, model=model, **kwargs),
+                message_batches
+            ))
+
+    def _record_response_telemetry(
+        self,
+        model: str,
+        response: Dict[str, Any],
+        start: float,
+        first_token: Optional[float] = None
+    ) -> None:
+        """
+        Record latency and server-side timings from a final Ollama response.
+
+        Args:
+            model: Model name
+            response: Final (done) response or stream chunk
+            start: perf_counter() value when the request was sent
+            first_token: perf_counter() value when the first token arrived
+        """
+        ns_to_ms = 1e-6
+        eval_ns = response.get('eval_duration') or 0
+        completion_tokens = response.get('eval_count') or 0
+
+        self._record_telemetry({
+            'model': model,
+            'latency_ms': (time.perf_counter() - start) * 1000,
+            'ttft_ms': (first_token - start) * 1000 if first_token is not None else None,
+            'prompt_tokens': response.get('prompt_eval_count') or 0,
+            'completion_tokens': completion_tokens,
+            'load_ms': (response.get('load_duration') or 0) * ns_to_ms,
+            'prompt_eval_ms': (response.get('prompt_eval_duration') or 0) * ns_to_ms,
+            'eval_ms': eval_ns * ns_to_ms,
+            'tokens_per_second': completion_tokens / (eval_ns / 1e9) if eval_ns else 0.0,
+        })
 
     def is_available(self) -> bool:
         """
@@ -195,29 +442,34 @@ class OllamaProvider(LLMProvider):
             logger.warning(f"Ollama not available: {e}")
             return False
 
-    def get_model_info(self) -> Dict[str, Any]:
+    def get_model_info(self, model: Optional[str] = None) -> Dict[str, Any]:
         """
-        Get information about the current default model.
+        Get information about a model.
+
+        Args:
+            model: Model name (uses the default model if None)
 
         Returns:
             Dict: Model metadata from Ollama
         """
+        model_name = model or self.default_model
         try:
-            models = self.client.list()
-
-            # Find current model in list
-            for model in models.get('models', []):
-                if model['name'] == self.default_model:
+            # Raw /api/tags entries: newer servers and clients name the model 'model', older ones 'name'
+            wanted = normalize_model_name(model_name)
+            for entry in self.list_tags().get('models', []):
+                name = entry.get('model') or entry.get('name')
+                if name and normalize_model_name(name) == wanted:
                     return {
-                        'name': model['name'],
-                        'size': model.get('size'),
-                        'modified_at': model.get('modified_at'),
-                        'details': model.get('details', {}),
+                        'name': name,
+                        'size': entry.get('size'),
+                        'digest': entry.get('digest'),
+                        'modified_at': entry.get('modified_at'),
+                        'details': entry.get('details') or {},
                     }
 
             # Model not found in list
             return {
-                'name': self.default_model,
+                'name': model_name,
                 'available': False,
                 'message': 'Model not pulled yet'
             }
@@ -226,24 +478,50 @@ class OllamaProvider(LLMProvider):
             logger.error(f"Failed to get model info: {e}")
             return {'error': str(e)}
 
-    def _ensure_model_available(self, model: str) -> None:
+    def list_tags(self, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """
+        Fetch the local model list, bounded by a deadline.
+
+        Args:
+            deadline: Bounds the request (with settings.request_timeout)
+
+        Returns:
+            Dict: {'models': [...]} as returned by /api/tags
+
+        Raises:
+            DeadlineExceeded: If the deadline passes first
+            ResponseError: If Ollama returns an error
+        """
+        return self._send('GET', '/api/tags', deadline=deadline, what='Ollama model list').json()
+
+    def _ensure_model_available(
+        self,
+        model: str,
+        allow_pull: Optional[bool] = None,
+        deadline: Optional[Deadline] = None
+    ) -> None:
         """
         Ensure model is pulled and available locally.
 
         Args:
             model: Model name to check
+            allow_pull: Pull and wait if missing (default:
+                settings.model_store.allow_inline_pull)
+            deadline: Bounds the model list request
 
         Raises:
+            ModelNotAvailable: If the model is missing and pulling is not allowed
             ResponseError: If model pull fails
+
+        Note:
+            The local model list is cached by the model store, so this
+            usually costs no request to the server.
         """
         try:
-            models = self.client.list()
-            available_models = [m['name'] for m in models.get('models', [])]
-
-            if model not in available_models:
-                logger.info(f"Model {model} not found locally. Pulling...")
-                self.client.pull(model)
-                logger.info(f"Successfully pulled model {model}")
+            with tracing.span('llm.model_check', **{'gen_ai.request.model': model}) as span:
+                pulled = self.store.ensure(model, allow_pull, deadline)
+                if span is not None:
+                    span.set_attribute('llm.model_pulled', pulled)
 
         except ResponseError as e:
             logger.error(f"Failed to ensure model availability: {e}")
@@ -257,8 +535,8 @@ class OllamaProvider(LLMProvider):
             List[str]: List of model names
         """
         try:
-            models = self.client.list()
-            return [m['name'] for m in models.get('models', [])]
+            models = self.list_tags().get('models', [])
+            return [m.get('model') or m.get('name') for m in models if m.get('model') or m.get('name')]
         except Exception as e:
             logger.error(f"Failed to list models: {e}")
             return []
@@ -272,10 +550,12 @@ class OllamaProvider(LLMProvider):
 
         Raises:
             ResponseError: If pull fails
+
+        Note:
+            Progress is logged and tracked in store.progress; models over
+            the disk budget are evicted afterwards.
         """
-        logger.info(f"Pulling model {model}...")
-        self.client.pull(model)
-        logger.info(f"Successfully pulled {model}")
+        self.store.pull(model)
 
     def delete_model(self, model: str) -> None:
         """
@@ -289,4 +569,5 @@ class OllamaProvider(LLMProvider):
         """
         logger.info(f"Deleting model {model}...")
         self.client.delete(model)
+        self.store.forget(model)
         logger.info(f"Successfully deleted {model}")
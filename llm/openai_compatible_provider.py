@@ -0,0 +1,539 @@
+"""
+OpenAI-Compatible Provider Implementation
+
+Talks to any server exposing the OpenAI HTTP API (/v1/chat/completions,
+/v1/completions, /v1/models), such as vLLM or the llama.cpp server. Those
+servers batch concurrent requests continuously on the GPU, so unlike Ollama
+throughput keeps rising with the number of requests in flight:
+
+- Pooled keep-alive connections sized to batch_concurrency
+- batch() keeps up to batch_concurrency requests in flight, and merges
+  identical conversations into one request with n choices
+- complete_batch() sends many raw prompts in one /v1/completions request
+- SSE streaming with deadlines, cancellation and retries (resilience.py)
+- The same telemetry records as the Ollama path, including llama.cpp's
+  server-side timings when present
+
+Point base_url at llm/stub_server.py to test or benchmark offline.
+"""
+
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .provider import LLMProvider
+from .resilience import CancellationToken, Deadline, DeadlineExceeded
+
+logger = logging.getLogger(__name__)
+
+# Returned while the server is loading, saturated or restarting
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class OpenAICompatibleProvider(LLMProvider):
+    """
+    Provider for vLLM, llama.cpp and other OpenAI-compatible servers.
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """
+        Initialize OpenAI-compatible provider.
+
+        Args:
+            config: Provider configuration from llm_config.yaml (base_url,
+                api_key, models, settings)
+        """
+        super().__init__(config)
+
+        self.base_url = config.get('base_url', 'http://localhost:8000/v1').rstrip('/')
+        self.api_key = config.get('api_key')
+
+        models_config = config.get('models', {})
+        self.default_model = models_config.get('default')
+
+        self.settings = config.get('settings', {})
+        self.temperature = self.settings.get('temperature', 0.7)
+        self.max_tokens = self.settings.get('max_tokens', 2048)
+        self.top_p = self.settings.get('top_p', 0.9)
+        self.request_timeout = self.settings.get('request_timeout', 600)
+
+        # Continuous batching servers benefit from many requests in flight
+        self.batch_concurrency = self.settings.get('batch_concurrency', 16)
+        self.supports_n = self.settings.get('supports_n', True)
+        self.max_prompts_per_request = self.settings.get('max_prompts_per_request', 32)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(self.batch_concurrency, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['Content-Type'] = 'application/json'
+        if self.api_key:
+            self.session.headers['Authorization'] = f"Bearer {self.api_key}"
+
+        logger.info(f"Initialized OpenAI-compatible provider at {self.base_url}")
+        logger.info(f"Default model: {self.default_model or '(server default)'}")
+
+    def _model(self, model: Optional[str]) -> str:
+        """Resolve the model name, asking the server if none is configured."""
+        model = model or self.default_model
+        if not model:
+            models = self.list_available_models()
+            if not models:
+                raise ValueError(f"No model configured and none served at {self.base_url}")
+            # Servers like llama.cpp and vLLM usually serve a single model
+            model = self.default_model = models[0]
+        return model
+
+    def _params(self, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Merge per-call sampling parameters with the configured defaults."""
+        params = {
+            'temperature': kwargs.get('temperature', self.temperature),
+            'max_tokens': kwargs.get('max_tokens', self.max_tokens),
+            'top_p': kwargs.get('top_p', self.top_p),
+        }
+        if kwargs.get('stop'):
+            params['stop'] = kwargs['stop']
+        return params
+
+    def _post(
+        self,
+        path: str,
+        body: Dict[str, Any],
+        deadline: Optional[Deadline] = None,
+        stream: bool = False,
+        cancel: Optional[CancellationToken] = None,
+        what: str = 'Request'
+    ) -> requests.Response:
+        """
+        One request attempt over the connection pool.
+
+        Raises:
+            requests.HTTPError: On an error status (with the server's message)
+            DeadlineExceeded: If the deadline passes while waiting for the server
+            RequestCancelled: If the cancel token was triggered before sending
+            requests.RequestException: On connection failures and request_timeout
+        """
+        if cancel is not None:
+            cancel.check()
+        timeout = self.request_timeout
+        if deadline is not None:
+            timeout = max(0.001, min(timeout, deadline.remaining()))
+
+        try:
+            response = self.session.post(f"{self.base_url}{path}", json=body, timeout=timeout, stream=stream)
+        except requests.Timeout:
+            if deadline is not None and timeout < self.request_timeout:
+                raise DeadlineExceeded(f"{what} exceeded its {deadline.timeout:.1f}s deadline") from None
+            raise
+        if response.status_code >= 400:
+            try:
+                message = response.json().get('error', {}).get('message') or response.text
+            except ValueError:
+                message = response.text
+            response.close()
+            raise requests.HTTPError(f"{response.status_code} from {path}: {message}", response=response)
+        return response
+
+    def invoke(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> str:
+        """
+        Synchronous chat completion.
+
+        Args:
+            messages: List of message dictionaries
+            model: Model name override (uses default if None)
+            **kwargs: Additional parameters (temperature, max_tokens, top_p,
+                stop, deadline/timeout, cancel)
+
+        Returns:
+            str: Generated response text
+
+        Raises:
+            requests.RequestException: If the request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes first
+            RequestCancelled: If the cancel token is triggered
+
+        Note:
+            With a cancel token the request is streamed internally, so it
+            can be interrupted mid-generation.
+        """
+        self.validate_messages(messages)
+
+        model = self._model(model)
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel = kwargs.pop('cancel', None)
+
+        if cancel is not None:
+            return ''.join(self.stream(messages, model=model, deadline=deadline, cancel=cancel, **kwargs))
+
+        return self._chat(messages, model, 1, deadline, kwargs)[0]
+
+    def _chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        n: int,
+        deadline: Optional[Deadline],
+        kwargs: Dict[str, Any],
+        cancel: Optional[CancellationToken] = None
+    ) -> List[str]:
+        """Non-streaming chat completion returning n choices."""
+        body = {'model': model, 'messages': messages, **self._params(kwargs)}
+        if n > 1:
+            body['n'] = n
+
+        try:
+            logger.debug(f"Invoking {self.base_url} with model {model} (n={n})")
+            start = time.perf_counter()
+            what = f"Chat completion from {model}"
+            response = self._call_with_retries(
+                lambda: self._post('/chat/completions', body, deadline, cancel=cancel, what=what).json(),
+                deadline,
+                cancel,
+                what=what
+            )
+            self._record_response_telemetry(model, response, start)
+
+            choices = sorted(response['choices'], key=lambda c: c.get('index', 0))
+            return [choice['message']['content'] or '' for choice in choices]
+
+        except requests.RequestException as e:
+            logger.error(f"Chat completion failed: {e}")
+            raise
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> Iterator[str]:
+        """
+        Streaming chat completion over server-sent events.
+
+        Args:
+            messages: List of message dictionaries
+            model: Model name override (uses default if None)
+            **kwargs: Additional parameters (see invoke)
+
+        Yields:
+            str: Chunks of generated response text
+
+        Raises:
+            requests.RequestException: If the request fails after retries
+            DeadlineExceeded: If the deadline/timeout passes mid-stream
+            RequestCancelled: If the cancel token is triggered
+
+        Note:
+            The deadline and cancel token are checked between chunks.
+            Closing the response aborts the generation server-side.
+        """
+        self.validate_messages(messages)
+
+        model = self._model(model)
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel: Optional[CancellationToken] = kwargs.pop('cancel', None)
+        body = {
+            'model': model,
+            'messages': messages,
+            'stream': True,
+            'stream_options': {'include_usage': True},
+            **self._params(kwargs)
+        }
+
+        logger.debug(f"Streaming from {self.base_url} with model {model}")
+        start = time.perf_counter()
+        try:
+            what = f"Chat stream from {model}"
+            response = self._call_with_retries(
+                lambda: self._post('/chat/completions', body, deadline, stream=True, cancel=cancel, what=what),
+                deadline,
+                cancel,
+                what=what
+            )
+        except requests.RequestException as e:
+            logger.error(f"Chat streaming failed: {e}")
+            raise
+
+        first_token = None
+        final: Dict[str, Any] = {}
+        chunks = 0
+        try:
+            for line in response.iter_lines(decode_unicode=True):
+                if cancel is not None:
+                    cancel.check()
+                if deadline is not None:
+                    deadline.check(f"Chat stream from {model}")
+
+                if not line or not line.startswith('data:'):
+                    continue
+                data = line[5:].strip()
+                if data == '[DONE]':
+                    break
+
+                event = json.loads(data)
+                for key in ('usage', 'timings'):
+                    if event.get(key):
+                        final[key] = event[key]
+                for choice in event.get('choices') or []:
+                    text = (choice.get('delta') or {}).get('content')
+                    if text:
+                        if first_token is None:
+                            first_token = time.perf_counter()
+                        chunks += 1
+                        yield text
+
+            # Servers that ignore stream_options send no usage; count chunks instead
+            final.setdefault('usage', {'completion_tokens': chunks})
+            self._record_response_telemetry(model, final, start, first_token)
+
+        except requests.RequestException as e:
+            # Reads are bounded by the remaining deadline (see _post)
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(f"Chat stream from {model} exceeded its {deadline.timeout:.1f}s deadline") from None
+            logger.error(f"Chat streaming failed: {e}")
+            raise
+        finally:
+            # Also runs when the consumer stops iterating early
+            response.close()
+
+    def batch(
+        self,
+        message_batches: List[List[Dict[str, str]]],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        Batch chat completions.
+
+        Note:
+            Up to settings.batch_concurrency requests are kept in flight and
+            the server batches them continuously. Identical conversations
+            are sent once with n set to the number of copies (with
+            temperature 0 the copies reuse one choice), unless
+            settings.supports_n is false.
+
+        Args:
+            message_batches: List of message lists
+            model: Model name override
+            **kwargs: Additional parameters (batch_concurrency overrides the
+                setting; deadline/timeout and cancel apply to the whole batch)
+
+        Returns:
+            List[str]: List of generated responses, in input order
+
+        Raises:
+            DeadlineExceeded: If the deadline/timeout passes first
+            RequestCancelled: If the cancel token is triggered; requests
+                already in flight finish, the rest are not sent
+        """
+        concurrency = kwargs.pop('batch_concurrency', self.batch_concurrency)
+
+        if not message_batches:
+            return []
+
+        for messages in message_batches:
+            self.validate_messages(messages)
+        model = self._model(model)
+
+        # One deadline for the whole batch, shared by every request
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        cancel: Optional[CancellationToken] = kwargs.pop('cancel', None)
+
+        # Group identical conversations: key -> input positions
+        groups: Dict[str, List[int]] = {}
+        for i, messages in enumerate(message_batches):
+            key = json.dumps(messages, sort_keys=True) if self.supports_n else str(i)
+            groups.setdefault(key, []).append(i)
+
+        deterministic = self._params(kwargs)['temperature'] == 0
+
+        def run(positions: List[int]) -> List[str]:
+            n = 1 if deterministic else len(positions)
+            choices = self._chat(message_batches[positions[0]], model, n, deadline, kwargs, cancel)
+            return choices * len(positions) if deterministic else choices
+
+        jobs = list(groups.values())
+        results: List[Optional[str]] = [None] * len(message_batches)
+
+        if concurrency <= 1 or len(jobs) == 1:
+            outputs = [run(positions) for positions in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(jobs))) as pool:
+                outputs = list(pool.map(run, jobs))
+
+        for positions, choices in zip(jobs, outputs):
+            for position, text in zip(positions, choices):
+                results[position] = text
+        return results
+
+    def complete_batch(
+        self,
+        prompts: List[str],
+        model: Optional[str] = None,
+        **kwargs
+    ) -> List[str]:
+        """
+        Raw-prompt completions, many prompts per /v1/completions request.
+
+        Note:
+            No chat template is applied, so prompts must already be in the
+            model's format. Prompts are sent in groups of
+            settings.max_prompts_per_request, the groups concurrently.
+
+        Args:
+            prompts: Prompt strings
+            model: Model name override
+            **kwargs: Sampling parameters, batch_concurrency, deadline/timeout
+
+        Returns:
+            List[str]: Completions, in input order
+        """
+        concurrency = kwargs.pop('batch_concurrency', self.batch_concurrency)
+
+        if not prompts:
+            return []
+
+        model = self._model(model)
+        deadline = Deadline.resolve(kwargs.pop('deadline', None), kwargs.pop('timeout', None))
+        size = max(1, self.max_prompts_per_request)
+        groups = [prompts[i:i + size] for i in range(0, len(prompts), size)]
+
+        def run(group: List[str]) -> List[str]:
+            body = {'model': model, 'prompt': group, **self._params(kwargs)}
+            start = time.perf_counter()
+            what = f"Completion of {len(group)} prompts from {model}"
+            response = self._call_with_retries(
+                lambda: self._post('/completions', body, deadline, what=what).json(),
+                deadline,
+                what=what
+            )
+            self._record_response_telemetry(model, response, start)
+            choices = sorted(response['choices'], key=lambda c: c.get('index', 0))
+            return [choice.get('text') or '' for choice in choices]
+
+        if concurrency <= 1 or len(groups) == 1:
+            outputs = [run(group) for group in groups]
+        else:
+            with ThreadPoolExecutor(max_workers=min(concurrency, len(groups))) as pool:
+                outputs = list(pool.map(run, groups))
+
+        return [text for group in outputs for text in group]
+
+    def _record_response_telemetry(
+        self,
+        model: str,
+        response: Dict[str, Any],
+        start: float,
+        first_token: Optional[float] = None
+    ) -> None:
+        """
+        Record latency, token usage and server timings from a response.
+
+        Args:
+            model: Model name
+            response: Response body, or the usage/timings collected from a stream
+            start: perf_counter() value when the request was sent
+            first_token: perf_counter() value when the first token arrived
+        """
+        latency_ms = (time.perf_counter() - start) * 1000
+        usage = response.get('usage') or {}
+        completion_tokens = usage.get('completion_tokens') or 0
+
+        # llama.cpp reports server-side timings; otherwise derive decode time
+        timings = response.get('timings') or {}
+        eval_ms = timings.get('predicted_ms')
+        if eval_ms is None and first_token is not None:
+            eval_ms = latency_ms - (first_token - start) * 1000
+
+        self._record_telemetry({
+            'model': model,
+            'latency_ms': latency_ms,
+            'ttft_ms': (first_token - start) * 1000 if first_token is not None else None,
+            'prompt_tokens': usage.get('prompt_tokens') or 0,
+            'completion_tokens': completion_tokens,
+            'prompt_eval_ms': timings.get('prompt_ms'),
+            'eval_ms': eval_ms,
+            'tokens_per_second': completion_tokens / (eval_ms / 1000) if eval_ms else 0.0,
+        })
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Whether an HTTP error is transient.
+
+        Args:
+            error: Exception from a request attempt
+
+        Returns:
+            bool: True for 408/429/5xx responses, connection errors and timeouts
+        """
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response.status_code in RETRYABLE_STATUS
+        return (isinstance(error, (requests.ConnectionError, requests.Timeout))
+                or super().is_retryable(error))
+
+    def is_available(self) -> bool:
+        """
+        Check if the server is running and accessible.
+
+        Returns:
+            bool: True if the models endpoint answers
+        """
+        try:
+            self.session.get(f"{self.base_url}/models", timeout=10).raise_for_status()
+            return True
+        except Exception as e:
+            logger.warning(f"OpenAI-compatible server not available: {e}")
+            return False
+
+    def list_available_models(self) -> List[str]:
+        """
+        Get list of models served.
+
+        Returns:
+            List[str]: List of model ids
+        """
+        try:
+            response = self.session.get(f"{self.base_url}/models", timeout=10)
+            response.raise_for_status()
+            return [m['id'] for m in response.json().get('data', [])]
+        except Exception as e:
+            logger.error(f"Failed to list models: {e}")
+            return []
+
+    def get_model_info(self, model: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get information about a model.
+
+        Args:
+            model: Model name (uses the default model if None)
+
+        Returns:
+            Dict: Model metadata from the server
+        """
+        model_name = model or self.default_model
+        try:
+            response = self.session.get(f"{self.base_url}/models", timeout=10)
+            response.raise_for_status()
+
+            for entry in response.json().get('data', []):
+                if model_name is None or entry['id'] == model_name:
+                    return {**entry, 'name': entry['id'], 'base_url': self.base_url}
+
+            return {
+                'name': model_name,
+                'available': False,
+                'message': f"Model not served by {self.base_url}"
+            }
+
+        except Exception as e:
+            logger.error(f"Failed to get model info: {e}")
+            return {'error': str(e)}
@@ -0,0 +1,422 @@
+"""
+Multi-Agent Orchestrator
+
+Runs several sub-agents over a repository as a dependency DAG.
+
+- Agents whose dependencies are done run concurrently, limited per provider
+  by its batch_concurrency setting (Ollama: keep it <= OLLAMA_NUM_PARALLEL)
+- Outputs are shared artifacts: a dependent agent gets its dependencies'
+  outputs as context instead of re-reading the codebase. The built-in
+  'file_summaries' artifact summarizes each file once (cached by content
+  hash across runs) for every agent that asks for it
+- Tokens are streamed as events while agents run
+- The report includes the critical path, so wall time can be compared with
+  the sum of agent times
+
+Usage:
+    orchestrator = Orchestrator()
+    orchestrator.add_file_summaries('.', patterns=['*.py'])
+    orchestrator.add_agent('architecture', 'Review the architecture', template='architecture-reviewer',
+                           depends_on=['file_summaries'], task_name='architecture_review')
+    orchestrator.add_agent('tech_debt', 'Find tech debt', template='tech-debt-finder-fixer',
+                           depends_on=['file_summaries'], task_name='tech_debt_analysis')
+    orchestrator.add_agent('report', 'Write an audit summary', depends_on=['architecture', 'tech_debt'])
+
+    for event in orchestrator.run_iter():
+        if event['type'] == 'chunk':
+            print(event['text'], end='', flush=True)
+    print(orchestrator.report['critical_path'])
+"""
+
+import fnmatch
+import hashlib
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, Any, Iterator, List, Optional
+
+from . import tracing
+from .factory import LLMFactory
+from .config_loader import get_model_for_task
+from .prompt_library import PromptLibrary
+
+logger = logging.getLogger(__name__)
+
+FILE_SUMMARIES = 'file_summaries'
+
+DEFAULT_SUMMARY_PROMPT = (
+    "Summarize this file for other code reviewers in at most 8 bullet points: "
+    "its purpose, public interfaces, notable dependencies and anything suspicious."
+)
+
+
+class AgentNode:
+    """
+    One agent in the DAG.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        prompt: str,
+        template: Optional[str] = None,
+        agent: Optional[str] = None,
+        depends_on: Optional[List[str]] = None,
+        task_name: Optional[str] = None,
+        provider_name: Optional[str] = None,
+        runner: Optional[Callable[..., str]] = None,
+        **kwargs
+    ):
+        """
+        Initialize node.
+
+        Args:
+            name: Unique node name; its output is stored under this artifact name
+            prompt: Request sent to the agent
+            template: Prompt library template (sub-agent command) used as system prefix
+            agent: Agent section of the template to act as
+            depends_on: Nodes whose outputs this agent receives as context
+            task_name: Task used for provider/model routing
+            provider_name: Explicit provider (overrides task routing)
+            runner: Custom executor called with (node, dependency outputs,
+                provider, model) instead of streaming from the provider
+            **kwargs: Extra provider parameters (temperature, max_tokens, ...)
+        """
+        self.name = name
+        self.prompt = prompt
+        self.template = template
+        self.agent = agent
+        self.depends_on = list(depends_on or [])
+        self.task_name = task_name
+        self.provider_name = provider_name
+        self.runner = runner
+        self.kwargs = kwargs
+
+
+class Orchestrator:
+    """
+    Dependency-ordered, concurrent execution of sub-agents over shared context.
+    """
+
+    def __init__(
+        self,
+        library: Optional[PromptLibrary] = None,
+        max_workers: int = 8
+    ):
+        """
+        Initialize orchestrator.
+
+        Args:
+            library: Prompt library for template-based agents (created if None)
+            max_workers: Upper bound on agents running at once across providers
+        """
+        self.library = library or PromptLibrary()
+        self.max_workers = max_workers
+
+        self.nodes: Dict[str, AgentNode] = {}
+        self.artifacts: Dict[str, str] = {}
+        self.report: Dict[str, Any] = {}
+
+        # File summaries by (path, content hash); survives across runs
+        self._summary_cache: Dict[str, str] = {}
+        self._limits: Dict[int, threading.Semaphore] = {}
+
+    def add_agent(self, name: str, prompt: str, **kwargs) -> AgentNode:
+        """
+        Add an agent to the DAG.
+
+        Args:
+            name: Unique node name
+            prompt: Request sent to the agent
+            **kwargs: AgentNode options (template, agent, depends_on, task_name, ...)
+
+        Returns:
+            AgentNode: The added node
+
+        Raises:
+            ValueError: If the name is already used
+        """
+        if name in self.nodes:
+            raise ValueError(f"Duplicate agent name '{name}'")
+        node = AgentNode(name, prompt, **kwargs)
+        self.nodes[name] = node
+        return node
+
+    def add_file_summaries(
+        self,
+        repo: str,
+        patterns: Optional[List[str]] = None,
+        exclude: Optional[List[str]] = None,
+        max_file_bytes: int = 32000,
+        prompt: str = DEFAULT_SUMMARY_PROMPT,
+        task_name: Optional[str] = None,
+        provider_name: Optional[str] = None
+    ) -> AgentNode:
+        """
+        Add the shared 'file_summaries' artifact node.
+
+        Every file is summarized once per content hash, in parallel through
+        provider.batch(); agents that depend on FILE_SUMMARIES get the
+        summaries instead of the raw files.
+
+        Args:
+            repo: Repository root
+            patterns: Glob patterns of files to include (default: all files)
+            exclude: Glob patterns to skip (matched against the relative path)
+            max_file_bytes: Files are truncated to this many bytes
+            prompt: Summary instruction
+            task_name: Task used for provider/model routing
+            provider_name: Explicit provider
+
+        Returns:
+            AgentNode: The summaries node
+        """
+        root = Path(repo)
+        exclude = list(exclude or []) + ['.git/*', '*/.git/*', '*/__pycache__/*', '*/node_modules/*']
+
+        def summarize(node: AgentNode, inputs: Dict[str, str], provider, model: Optional[str]) -> str:
+            files = {}
+            for pattern in patterns or ['*']:
+                for path in sorted(root.rglob(pattern)):
+                    rel = path.relative_to(root).as_posix()
+                    if path.is_file() and not any(fnmatch.fnmatch(rel, ex) for ex in exclude):
+                        files.setdefault(rel, path)
+
+            contents = {}
+            for rel, path in files.items():
+                data = path.read_bytes()[:max_file_bytes]
+                contents[rel] = (data.decode('utf-8', errors='replace'), hashlib.sha256(data).hexdigest())
+
+            missing = [rel for rel, (_, digest) in contents.items() if f"{rel}:{digest}" not in self._summary_cache]
+            if missing:
+                responses = provider.batch(
+                    [[{'role': 'user', 'content': f"{prompt}\n\nFile: {rel}\n```\n{contents[rel][0]}\n```"}] for rel in missing],
+                    model=model,
+                    **node.kwargs
+                )
+                for rel, summary in zip(missing, responses):
+                    self._summary_cache[f"{rel}:{contents[rel][1]}"] = summary.strip()
+
+            logger.info(f"Summarized {len(missing)} of {len(files)} files ({len(files) - len(missing)} cached)")
+            return '\n\n'.join(f"#### {rel}\n{self._summary_cache[f'{rel}:{digest}']}" for rel, (_, digest) in contents.items())
+
+        self.nodes.pop(FILE_SUMMARIES, None)
+        return self.add_agent(FILE_SUMMARIES, prompt, task_name=task_name, provider_name=provider_name, runner=summarize)
+
+    def _validate(self) -> None:
+        """Check that dependencies exist and the graph has no cycles."""
+        for node in self.nodes.values():
+            for dep in node.depends_on:
+                if dep not in self.nodes:
+                    raise ValueError(f"Agent '{node.name}' depends on unknown agent '{dep}'")
+
+        state: Dict[str, int] = {}
+
+        def visit(name: str, path: List[str]) -> None:
+            if state.get(name) == 1:
+                raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+            if state.get(name) == 2:
+                return
+            state[name] = 1
+            for dep in self.nodes[name].depends_on:
+                visit(dep, path + [name])
+            state[name] = 2
+
+        for name in self.nodes:
+            visit(name, [])
+
+    def _resolve(self, node: AgentNode):
+        """Pick the provider and model for a node (called from the scheduler thread only)."""
+        provider = LLMFactory.get_provider_with_fallback(node.provider_name, node.task_name)
+        if node.task_name and node.provider_name is None:
+            routed, model = get_model_for_task(LLMFactory.get_config(), node.task_name)
+            # After a fallback the routed model name means nothing to the other provider
+            if provider is LLMFactory.get_provider(routed):
+                return provider, model
+        return provider, None
+
+    def _limit(self, provider) -> threading.Semaphore:
+        """Per-provider concurrency limit from its batch_concurrency setting."""
+        key = id(provider)
+        if key not in self._limits:
+            limit = getattr(provider, 'batch_concurrency', None) or provider.config.get('settings', {}).get('batch_concurrency', 4)
+            self._limits[key] = threading.Semaphore(max(1, limit))
+        return self._limits[key]
+
+    def _execute(self, node: AgentNode, provider, model: Optional[str], events: 'queue.Queue') -> None:
+        """Run one node in a worker thread, reporting through the event queue."""
+        start = time.perf_counter()
+        # One trace per agent: slot wait, request and its phases nest under it
+        with tracing.span('llm.agent', **{'llm.agent': node.name}):
+            try:
+                inputs = {dep: self.artifacts[dep] for dep in node.depends_on}
+
+                if node.runner is not None:
+                    output = node.runner(node, inputs, provider, model)
+                else:
+                    context = '\n\n'.join(f"### Output of {dep}\n\n{text}" for dep, text in inputs.items()) or None
+                    if node.template:
+                        messages = self.library.build_messages(node.template, node.prompt, agent=node.agent,
+                                                               context=context, model=model or getattr(provider, 'default_model', None))
+                    else:
+                        messages = [{'role': 'user', 'content': f"{context}\n\n{node.prompt}" if context else node.prompt}]
+
+                    chunks = []
+                    limit = self._limit(provider)
+                    with tracing.span('llm.queue_wait', **{'llm.queue': 'orchestrator', 'llm.agent': node.name}):
+                        limit.acquire()
+                    try:
+                        # Time spent waiting for a provider slot is not agent time
+                        start = time.perf_counter()
+                        for chunk in provider.stream(messages, model=model, **node.kwargs):
+                            chunks.append(chunk)
+                            events.put({'type': 'chunk', 'agent': node.name, 'text': chunk})
+                    finally:
+                        limit.release()
+                    output = ''.join(chunks)
+
+                events.put({'type': 'completed', 'agent': node.name, 'output': output,
+                            'start': start, 'end': time.perf_counter()})
+            except Exception as e:
+                logger.error(f"Agent {node.name} failed: {e}")
+                events.put({'type': 'failed', 'agent': node.name, 'error': str(e),
+                            'start': start, 'end': time.perf_counter()})
+
+    def run_iter(self) -> Iterator[Dict[str, Any]]:
+        """
+        Run the DAG, yielding events as they happen.
+
+        Yields:
+            Dict: Events with 'type' and 'agent':
+                started, chunk ('text'), completed ('output', 'duration_ms'),
+                failed ('error'), skipped ('reason' - a dependency failed)
+
+        Raises:
+            ValueError: If the graph references unknown agents or has a cycle
+
+        Note:
+            When the generator finishes, self.report holds the run summary
+            (see run()).
+        """
+        self._validate()
+        self.artifacts = {}
+        self.report = {}
+
+        run_start = time.perf_counter()
+        pending = dict(self.nodes)
+        running: set = set()
+        status: Dict[str, str] = {}
+        timings: Dict[str, Dict[str, float]] = {}
+        errors: Dict[str, str] = {}
+        events: 'queue.Queue' = queue.Queue()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='agent') as pool:
+            while pending or running:
+                # Skip nodes whose dependencies failed, start the ones that are ready
+                for name, node in list(pending.items()):
+                    failed = [dep for dep in node.depends_on if status.get(dep) in ('failed', 'skipped')]
+                    if failed:
+                        del pending[name]
+                        status[name] = 'skipped'
+                        yield {'type': 'skipped', 'agent': name, 'reason': f"dependency failed: {', '.join(failed)}"}
+                    elif all(status.get(dep) == 'completed' for dep in node.depends_on):
+                        del pending[name]
+                        try:
+                            provider, model = self._resolve(node)
+                        except Exception as e:
+                            status[name] = 'failed'
+                            errors[name] = str(e)
+                            yield {'type': 'failed', 'agent': name, 'error': str(e)}
+                            continue
+                        running.add(name)
+                        status[name] = 'running'
+                        yield {'type': 'started', 'agent': name}
+                        pool.submit(self._execute, node, provider, model, events)
+
+                if not running:
+                    continue
+
+                event = events.get()
+                name = event['agent']
+                if event['type'] in ('completed', 'failed'):
+                    running.discard(name)
+                    status[name] = event['type']
+                    timings[name] = {'start': event.pop('start') - run_start, 'end': event.pop('end') - run_start}
+                    event['duration_ms'] = (timings[name]['end'] - timings[name]['start']) * 1000
+                    if event['type'] == 'completed':
+                        self.artifacts[name] = event['output']
+                    else:
+                        errors[name] = event['error']
+                yield event
+
+        self.report = self._build_report(status, timings, errors, time.perf_counter() - run_start)
+        logger.info(
+            f"Orchestrated {len(self.nodes)} agents in {self.report['wall_ms'] / 1000:.1f}s "
+            f"(critical path {self.report['critical_path_ms'] / 1000:.1f}s, "
+            f"serial {self.report['serial_ms'] / 1000:.1f}s)"
+        )
+
+    def run(self, on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """
+        Run the DAG to completion.
+
+        Args:
+            on_event: Called with every event from run_iter() (e.g. to print chunks)
+
+        Returns:
+            Dict: success, outputs, status, errors, wall_ms, serial_ms
+                (sum of agent durations), critical_path, critical_path_ms,
+                speedup (serial_ms / wall_ms) and per-agent timings
+        """
+        for event in self.run_iter():
+            if on_event is not None:
+                on_event(event)
+        return self.report
+
+    def _build_report(
+        self,
+        status: Dict[str, str],
+        timings: Dict[str, Dict[str, float]],
+        errors: Dict[str, str],
+        wall_seconds: float
+    ) -> Dict[str, Any]:
+        """Summarize a run, including the longest dependency chain by measured time."""
+        durations = {name: (t['end'] - t['start']) * 1000 for name, t in timings.items()}
+
+        # Longest path through the DAG weighted by agent duration
+        longest: Dict[str, float] = {}
+        previous: Dict[str, Optional[str]] = {}
+
+        def chain(name: str) -> float:
+            if name not in longest:
+                best, best_dep = 0.0, None
+                for dep in self.nodes[name].depends_on:
+                    if chain(dep) > best:
+                        best, best_dep = chain(dep), dep
+                longest[name] = best + durations.get(name, 0.0)
+                previous[name] = best_dep
+            return longest[name]
+
+        tail = max(self.nodes, key=chain, default=None)
+        path = []
+        while tail is not None:
+            path.append(tail)
+            tail = previous[tail]
+
+        wall_ms = wall_seconds * 1000
+        serial_ms = sum(durations.values())
+        return {
+            'success': not errors and all(s == 'completed' for s in status.values()),
+            'outputs': dict(self.artifacts),
+            'status': status,
+            'errors': errors,
+            'wall_ms': wall_ms,
+            'serial_ms': serial_ms,
+            'critical_path': list(reversed(path)),
+            'critical_path_ms': max(longest.values(), default=0.0),
+            'speedup': serial_ms / wall_ms if wall_ms else 0.0,
+            'timings': {name: {'start_ms': t['start'] * 1000, 'duration_ms': durations[name]} for name, t in timings.items()},
+        }
@@ -0,0 +1,327 @@
+"""
+Sub-Agent Prompt Library
+
+Loads the sub-agent-*.md command definitions once and serves them as
+system prompts whose bytes never change between requests.
+
+Ollama (and most local servers) reuse the KV cache for the longest prefix a
+new prompt shares with the previous one in the same slot, so a 1,200-line
+template is only evaluated once as long as it is sent first and
+byte-identical every time. Everything that varies per request (agent role,
+file contents, user input) goes after it, in the user message.
+
+Usage:
+    library = PromptLibrary()
+    messages = library.build_messages(
+        'refactor',
+        'Refactor src/utils/',
+        agent='Structure Analyzer',
+        model='codellama:13b'
+    )
+    response = provider.invoke(messages, model='codellama:13b')
+    print(library.prefix_stats()['reuse_rate'])
+"""
+
+import hashlib
+import logging
+import math
+import re
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_PATTERN = 'sub-agent-*.md'
+TEMPLATE_PREFIX = 'sub-agent-'
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the token count of a text without a model tokenizer.
+
+    Args:
+        text: Text to measure
+
+    Returns:
+        int: Approximate token count (about 4 bytes per token for English
+            prose and code with BPE tokenizers)
+    """
+    return math.ceil(len(text.encode('utf-8')) / 4)
+
+
+class PromptTemplate:
+    """
+    A parsed sub-agent definition with its precomputed hash and token count.
+    """
+
+    def __init__(self, name: str, path: Path, text: str, token_count: int):
+        """
+        Initialize template.
+
+        Args:
+            name: Command name (file stem without 'sub-agent-')
+            path: Source markdown file
+            text: Normalized template text, used verbatim as the system prompt
+            token_count: Token count of text
+        """
+        self.name = name
+        self.path = path
+        self.text = text
+        self.token_count = token_count
+        self.sha256 = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        self.sections, self._levels = self._parse_sections(text)
+
+    @staticmethod
+    def _parse_sections(text: str) -> Tuple[Dict[str, str], Dict[str, int]]:
+        """
+        Split the markdown into sections keyed by heading title.
+
+        Headings inside fenced code blocks (shell comments in examples) are
+        ignored. Each section runs until the next heading of the same or a
+        higher level.
+        """
+        headings = []
+        in_fence = False
+        lines = text.split('\n')
+        for i, line in enumerate(lines):
+            if line.lstrip().startswith('```'):
+                in_fence = not in_fence
+                continue
+            match = None if in_fence else _HEADING.match(line)
+            if match:
+                headings.append((i, len(match.group(1)), match.group(2)))
+
+        sections, levels = {}, {}
+        for n, (start, level, title) in enumerate(headings):
+            end = len(lines)
+            for next_start, next_level, _ in headings[n + 1:]:
+                if next_level <= level:
+                    end = next_start
+                    break
+            if title not in sections:
+                sections[title] = '\n'.join(lines[start:end]).strip()
+                levels[title] = level
+        return sections, levels
+
+    @property
+    def agents(self) -> List[str]:
+        """Headings of the agent definitions in this template (below the document title)."""
+        return [title for title in self.sections if self._levels[title] > 1 and 'agent' in title.lower()]
+
+    def agent_section(self, agent: str) -> str:
+        """
+        Find an agent definition by (case-insensitive) heading substring.
+
+        Args:
+            agent: e.g. 'Structure Analyzer' or 'Agent 1'
+
+        Returns:
+            str: The agent's section, heading included
+
+        Raises:
+            KeyError: If no agent heading matches
+        """
+        wanted = agent.lower()
+        for title in self.agents:
+            if wanted == title.lower() or wanted in title.lower():
+                return self.sections[title]
+        raise KeyError(f"No agent matching '{agent}' in template '{self.name}'. Available: {self.agents}")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Template metadata (without the text)."""
+        return {
+            'name': self.name,
+            'path': str(self.path),
+            'sha256': self.sha256,
+            'token_count': self.token_count,
+            'bytes': len(self.text.encode('utf-8')),
+            'agents': self.agents,
+        }
+
+
+class PromptLibrary:
+    """
+    Lazily loaded, cache-friendly library of sub-agent prompt templates.
+
+    Templates are discovered by file name up front but only read and parsed
+    the first time they are used; afterwards the same string object is
+    returned for every request. Thread-safe, so it can be shared by
+    batch/orchestrator worker threads.
+    """
+
+    def __init__(
+        self,
+        search_paths: Optional[List[Path]] = None,
+        tokenizer: Optional[Callable[[str], int]] = None
+    ):
+        """
+        Initialize library.
+
+        Args:
+            search_paths: Directories containing sub-agent-*.md files
+                (default: the repository root)
+            tokenizer: Function returning the token count of a text
+                (default: estimate_tokens)
+        """
+        self.search_paths = [Path(p) for p in (search_paths or [Path(__file__).parent.parent])]
+        self.tokenizer = tokenizer or estimate_tokens
+
+        self._paths: Optional[Dict[str, Path]] = None
+        self._templates: Dict[str, PromptTemplate] = {}
+        self._lock = threading.Lock()
+
+        # Prefix accounting: which prefixes each model has already been sent
+        self._sent: Dict[str, set] = {}
+        self._usage: Dict[str, Dict[str, int]] = {}
+
+    def names(self) -> List[str]:
+        """
+        List available template names without reading any template.
+
+        Returns:
+            List[str]: Names such as 'refactor' or 'code-documenter'
+        """
+        with self._lock:
+            return sorted(self._discover())
+
+    def _discover(self) -> Dict[str, Path]:
+        """Map template names to files (first search path wins). Caller holds the lock."""
+        if self._paths is None:
+            self._paths = {}
+            for directory in self.search_paths:
+                for path in sorted(directory.glob(TEMPLATE_PATTERN)):
+                    self._paths.setdefault(path.stem[len(TEMPLATE_PREFIX):], path)
+        return self._paths
+
+    def get(self, name: str) -> PromptTemplate:
+        """
+        Get a template, parsing it on first use.
+
+        Args:
+            name: Template name, with or without the 'sub-agent-' prefix or '.md'
+
+        Returns:
+            PromptTemplate: Parsed template
+
+        Raises:
+            KeyError: If no such template exists
+        """
+        name = name[:-3] if name.endswith('.md') else name
+        name = name[len(TEMPLATE_PREFIX):] if name.startswith(TEMPLATE_PREFIX) else name
+
+        with self._lock:
+            template = self._templates.get(name)
+            if template is not None:
+                return template
+
+            paths = self._discover()
+            if name not in paths:
+                raise KeyError(f"Unknown prompt template '{name}'. Available: {sorted(paths)}")
+
+            path = paths[name]
+            # Normalize so the prefix is byte-identical across checkouts and editors
+            text = path.read_bytes().decode('utf-8').replace('\r\n', '\n').strip() + '\n'
+            template = PromptTemplate(name, path, text, self.tokenizer(text))
+            self._templates[name] = template
+
+            logger.debug(f"Loaded prompt template {name}: {template.token_count} tokens, sha256 {template.sha256[:12]}")
+            return template
+
+    def build_messages(
+        self,
+        name: str,
+        user_content: str,
+        agent: Optional[str] = None,
+        context: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None
+    ) -> List[Dict[str, str]]:
+        """
+        Build a message list with the template as a stable system prefix.
+
+        Args:
+            name: Template name
+            user_content: The request (target, options, ...)
+            agent: Agent definition to assign (see PromptTemplate.agents)
+            context: Per-request material such as file contents
+            history: Earlier user/assistant turns to place after the prefix
+            model: Model the messages are for; only used for prefix accounting
+
+        Returns:
+            List[Dict]: Messages whose first element is always the unmodified
+                template text, so every request for this template shares it
+
+        Raises:
+            KeyError: If the template or agent does not exist
+        """
+        template = self.get(name)
+
+        parts = []
+        if agent is not None:
+            parts.append(f"You are acting as the following agent from the command above:\n\n{template.agent_section(agent)}")
+        if context:
+            parts.append(f"Context:\n\n{context}")
+        parts.append(user_content)
+
+        self._record_prefix(template, model)
+
+        return [
+            {'role': 'system', 'content': template.text},
+            *(history or []),
+            {'role': 'user', 'content': '\n\n'.join(parts)},
+        ]
+
+    def _record_prefix(self, template: PromptTemplate, model: Optional[str]) -> None:
+        """Count whether this prefix was already sent to the model."""
+        with self._lock:
+            sent = self._sent.setdefault(model or '*', set())
+            usage = self._usage.setdefault(template.name, {'requests': 0, 'prefix_hits': 0, 'reused_tokens': 0})
+            usage['requests'] += 1
+            if template.sha256 in sent:
+                usage['prefix_hits'] += 1
+                usage['reused_tokens'] += template.token_count
+            sent.add(template.sha256)
+
+    def prefix_stats(self) -> Dict[str, Any]:
+        """
+        Report how often requests re-sent a prefix the server has already seen.
+
+        Returns:
+            Dict: Totals (requests, prefix_hits, reuse_rate, reused_tokens) and
+                a per-template breakdown with token counts and hashes
+
+        Note:
+            A hit means the same bytes were sent to the same model before, so
+            the server can reuse its KV cache if the prefix is still resident
+            (the model was not unloaded or evicted by other prompts). Confirm
+            with the prompt_eval_ms drop in provider.get_telemetry().
+        """
+        with self._lock:
+            templates = {}
+            for name, usage in self._usage.items():
+                template = self._templates[name]
+                templates[name] = {
+                    **usage,
+                    'reuse_rate': usage['prefix_hits'] / usage['requests'],
+                    'token_count': template.token_count,
+                    'sha256': template.sha256,
+                }
+
+        requests = sum(t['requests'] for t in templates.values())
+        hits = sum(t['prefix_hits'] for t in templates.values())
+        return {
+            'requests': requests,
+            'prefix_hits': hits,
+            'reuse_rate': hits / requests if requests else 0.0,
+            'reused_tokens': sum(t['reused_tokens'] for t in templates.values()),
+            'templates': templates,
+        }
+
+    def reset_stats(self) -> None:
+        """Forget prefix accounting (e.g. after models were reloaded)."""
+        with self._lock:
+            self._sent.clear()
+            self._usage.clear()
@@ -5,8 +5,18 @@ Defines the abstract interface that all LLM providers must implement.
 This ensures consistent behavior across local (Ollama) and cloud (Anthropic) providers.
 """
 
+import logging
+import threading
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Iterator, Optional
+from collections import deque
+from typing import Callable, List, Dict, Any, Iterator, Optional, TypeVar
+
+from . import tracing
+from .resilience import CancellationToken, Deadline, RetryPolicy, call_with_retries
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
 
 
 class LLMProvider(ABC):
@@ -26,6 +36,19 @@ class LLMProvider(ABC):
         """
         self.config = config
 
+        # Recent per-request performance records (see get_telemetry)
+        history = config.get('settings', {}).get('telemetry_history', 1000)
+        self._telemetry = deque(maxlen=history)
+        self._telemetry_lock = threading.Lock()
+
+        # Transient-failure retries (settings.retry); see resilience.py
+        self.retry_policy = RetryPolicy.from_config(config.get('settings', {}).get('retry'))
+
+    @property
+    def name(self) -> str:
+        """Provider class name, for logs (unchanged by middleware wrapping)."""
+        return type(self).__name__
+
     @abstractmethod
     def invoke(self, messages: List[Dict[str, str]], **kwargs) -> str:
         """
@@ -33,12 +56,16 @@ class LLMProvider(ABC):
 
         Args:
             messages: List of message dictionaries with 'role' and 'content' keys
-            **kwargs: Additional provider-specific parameters
+            **kwargs: Additional provider-specific parameters. All providers
+                accept deadline (Deadline), timeout (seconds) and cancel
+                (CancellationToken)
 
         Returns:
             str: Generated response text
 
         Raises:
+            DeadlineExceeded: If the deadline passes first
+            RequestCancelled: If the cancel token is triggered
             Exception: If the request fails
         """
         pass
@@ -50,13 +77,21 @@ class LLMProvider(ABC):
 
         Args:
             messages: List of message dictionaries with 'role' and 'content' keys
-            **kwargs: Additional provider-specific parameters
+            **kwargs: Additional provider-specific parameters, including
+                deadline, timeout and cancel (see invoke)
 
         Yields:
             str: Chunks of generated response text
 
         Raises:
+            DeadlineExceeded: If the deadline passes mid-stream
+            RequestCancelled: If the cancel token is triggered
             Exception: If the request fails
+
+        Note:
+            Retries only happen before the first chunk is yielded. Stopping
+            iteration early (or cancelling) closes the HTTP response so the
+            server stops generating.
         """
         pass
 
@@ -105,6 +140,132 @@ class LLMProvider(ABC):
         """
         pass
 
+    def stream_structured(
+        self,
+        messages: List[Dict[str, str]],
+        format: str = 'json',
+        max_items: Optional[int] = None,
+        item_key: Optional[str] = None,
+        section_level: Optional[int] = None,
+        **kwargs
+    ) -> Iterator[Any]:
+        """
+        Stream and parse structured output, yielding each item as it completes.
+
+        Args:
+            messages: List of message dictionaries with 'role' and 'content' keys
+            format: 'json' (array elements / JSON Lines objects) or
+                'sections' (markdown sections)
+            max_items: Stop generation once this many items have been yielded
+            item_key: JSON key holding the item array, e.g. 'findings'
+            section_level: Heading level delimiting sections (default: first seen)
+            **kwargs: Passed to stream() (model, deadline, cancel, ...)
+
+        Yields:
+            JSON values, or dicts with 'title', 'level' and 'content' for sections
+
+        Raises:
+            ValueError: If the format is unknown
+
+        Note:
+            Stopping early closes the underlying stream, so the server stops
+            generating the remaining output.
+        """
+        from .structured_output import make_parser
+
+        parser = make_parser(format, item_key=item_key, section_level=section_level)
+        stream = self.stream(messages, **kwargs)
+        count = 0
+        try:
+            for chunk in stream:
+                for item in parser.feed(chunk):
+                    yield item
+                    count += 1
+                    if max_items is not None and count >= max_items:
+                        logger.debug(f"Stopping generation after {count} structured items")
+                        return
+            for item in parser.close():
+                yield item
+                count += 1
+                if max_items is not None and count >= max_items:
+                    return
+        finally:
+            stream.close()
+
+    def get_telemetry(self, clear: bool = False) -> List[Dict[str, Any]]:
+        """
+        Get recent per-request performance records.
+
+        Args:
+            clear: Whether to clear the history after reading it
+
+        Returns:
+            List[Dict]: Records with model, latency_ms, ttft_ms (streams),
+                prompt_tokens, completion_tokens, load_ms, prompt_eval_ms,
+                eval_ms and tokens_per_second where the provider reports them
+        """
+        with self._telemetry_lock:
+            records = list(self._telemetry)
+            if clear:
+                self._telemetry.clear()
+        return records
+
+    def _record_telemetry(self, record: Dict[str, Any]) -> None:
+        """
+        Append a performance record to the telemetry history.
+
+        Args:
+            record: Per-request metrics
+
+        Note:
+            Records are also logged at DEBUG with their metrics as structured
+            fields (latency_ms, ttft_ms, ...), so they reach the JSONL stream
+            when structured_logging.configure() is active. With tracing on,
+            they also become the phases of the active request span.
+        """
+        with self._telemetry_lock:
+            self._telemetry.append(record)
+        tracing.record_request(record)
+
+        logger.debug(
+            f"{type(self).__name__} request to {record.get('model')} took {record.get('latency_ms', 0):.0f} ms",
+            extra={'provider': type(self).__name__, **record}
+        )
+
+    def is_retryable(self, error: Exception) -> bool:
+        """
+        Whether an error is transient and worth retrying.
+
+        Args:
+            error: Exception raised by a request attempt
+
+        Returns:
+            bool: True for connection failures and timeouts; providers
+                extend this with their own transient status codes
+        """
+        return isinstance(error, (ConnectionError, TimeoutError))
+
+    def _call_with_retries(
+        self,
+        fn: Callable[[], T],
+        deadline: Optional[Deadline] = None,
+        cancel: Optional[CancellationToken] = None,
+        what: str = 'Request'
+    ) -> T:
+        """
+        Run one request attempt function under this provider's retry policy.
+
+        Args:
+            fn: Zero-argument callable performing one attempt
+            deadline: Overall deadline
+            cancel: Cancellation token
+            what: Description for logs
+
+        Returns:
+            The result of fn
+        """
+        return call_with_retries(fn, self.is_retryable, self.retry_policy, deadline, cancel, what=what)
+
     def validate_messages(self, messages: List[Dict[str, str]]) -> None:
         """
         Validate message format before sending to LLM.
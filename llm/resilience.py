@@ -0,0 +1,351 @@
+"""
+Deadlines, Cancellation and Retries
+
+Shared by all providers and LLMFactory:
+
+- Deadline: absolute per-call time limit. Passed down unchanged through
+  factory fallback, batch workers and retries, so every stage sees the time
+  that is actually left rather than a fresh timeout.
+- CancellationToken: cooperative cancellation. Streams check it between
+  chunks and close the HTTP response, which makes the server stop generating.
+  Providers can also register a callback that closes an open response from
+  the cancelling thread, so a stalled read is interrupted too.
+- RetryPolicy: exponential backoff with full jitter for transient errors
+  (connection failures, 429/5xx while a model loads). A retry is skipped if
+  its backoff would not fit in the remaining deadline.
+- RetryBudget: process-wide token bucket that caps retries at a fraction of
+  requests, so an overloaded server is not hit by a retry storm.
+"""
+
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class DeadlineExceeded(TimeoutError):
+    """The call's deadline passed before it completed."""
+
+
+class RequestCancelled(Exception):
+    """The call was cancelled through its CancellationToken."""
+
+
+class Deadline:
+    """
+    Absolute deadline on the monotonic clock.
+    """
+
+    def __init__(self, timeout: float):
+        """
+        Initialize deadline.
+
+        Args:
+            timeout: Seconds from now
+        """
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    @classmethod
+    def resolve(cls, deadline: Optional['Deadline'] = None, timeout: Optional[float] = None) -> Optional['Deadline']:
+        """
+        Combine an inherited deadline with a local timeout (the earlier one wins).
+
+        Args:
+            deadline: Deadline passed down by the caller
+            timeout: Timeout in seconds for this call
+
+        Returns:
+            Deadline: Effective deadline, or None if neither was given
+        """
+        if timeout is None:
+            return deadline
+        local = cls(timeout)
+        if deadline is None or local.expires_at < deadline.expires_at:
+            return local
+        return deadline
+
+    def remaining(self) -> float:
+        """Seconds left (negative once expired)."""
+        return self.expires_at - time.monotonic()
+
+    @property
+    def expired(self) -> bool:
+        """Whether the deadline has passed."""
+        return self.remaining() <= 0
+
+    def check(self, what: str = 'Request') -> None:
+        """
+        Raise if the deadline has passed.
+
+        Args:
+            what: Description used in the error message
+
+        Raises:
+            DeadlineExceeded: If expired
+        """
+        if self.expired:
+            raise DeadlineExceeded(f"{what} exceeded its {self.timeout:.1f}s deadline")
+
+
+class CancellationToken:
+    """
+    Thread-safe flag for cooperative cancellation.
+    """
+
+    def __init__(self):
+        """Initialize token (not cancelled)."""
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.reason: Optional[str] = None
+
+    def cancel(self, reason: str = 'cancelled') -> None:
+        """
+        Request cancellation and run registered callbacks.
+
+        Args:
+            reason: Recorded in the RequestCancelled error
+        """
+        with self._lock:
+            self.reason = reason
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug(f"Cancel callback failed: {e}")
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """
+        Run a callback when the token is cancelled (immediately if it already is).
+
+        Args:
+            callback: Called from the cancelling thread, e.g. to close an
+                open HTTP response that another thread is reading
+
+        Returns:
+            Callable: Unregisters the callback
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._unregister(callback)
+        callback()
+        return lambda: None
+
+    def _unregister(self, callback: Callable[[], None]) -> None:
+        """Remove a callback registered with on_cancel()."""
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    @property
+    def cancelled(self) -> bool:
+        """Whether cancel() was called."""
+        return self._event.is_set()
+
+    def check(self) -> None:
+        """
+        Raise if cancelled.
+
+        Raises:
+            RequestCancelled: If cancel() was called
+        """
+        if self._event.is_set():
+            raise RequestCancelled(f"Request {self.reason}")
+
+    def wait(self, seconds: float) -> bool:
+        """
+        Sleep up to `seconds`, waking early on cancellation.
+
+        Returns:
+            bool: True if cancelled
+        """
+        return self._event.wait(seconds)
+
+
+class RetryBudget:
+    """
+    Token bucket limiting retries to a fraction of requests.
+
+    Each request deposits `ratio` tokens and each retry withdraws one; a
+    small time-based refill lets low-traffic processes still retry.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 0.5, max_tokens: float = 10.0):
+        """
+        Initialize budget.
+
+        Args:
+            ratio: Retries allowed per request (0.2 = at most 20% extra load)
+            min_per_second: Tokens refilled per second regardless of traffic
+            max_tokens: Bucket size (maximum burst of retries)
+        """
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max_tokens
+
+        self._tokens = max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.exhausted = 0
+
+    def _refill(self) -> None:
+        """Add time-based tokens. Caller holds the lock."""
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + (now - self._updated) * self.min_per_second)
+        self._updated = now
+
+    def record_request(self) -> None:
+        """Deposit tokens for a first attempt."""
+        with self._lock:
+            self._refill()
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_acquire(self) -> bool:
+        """
+        Withdraw a token for a retry.
+
+        Returns:
+            bool: False if the budget is exhausted (do not retry)
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            self.exhausted += 1
+            return False
+
+
+_budget = RetryBudget()
+
+
+def get_retry_budget() -> RetryBudget:
+    """Return the process-wide retry budget."""
+    return _budget
+
+
+def configure_retry_budget(config: Optional[Dict[str, Any]] = None) -> RetryBudget:
+    """
+    Replace the process-wide retry budget.
+
+    Args:
+        config: llm.retry_budget section (ratio, min_per_second, max_tokens)
+
+    Returns:
+        RetryBudget: The new budget
+    """
+    global _budget
+    _budget = RetryBudget(**(config or {}))
+    return _budget
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+    """
+
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0):
+        """
+        Initialize policy.
+
+        Args:
+            max_attempts: Total attempts including the first (1 disables retries)
+            base_delay: Backoff cap for the first retry, doubled per attempt
+            max_delay: Upper bound on any backoff
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @classmethod
+    def from_config(cls, config: Optional[Dict[str, Any]]) -> 'RetryPolicy':
+        """
+        Build from a provider's settings.retry section.
+
+        Args:
+            config: max_attempts, base_delay, max_delay (all optional)
+
+        Returns:
+            RetryPolicy: Policy
+        """
+        return cls(**(config or {}))
+
+    def backoff(self, retry: int) -> float:
+        """Random delay before retry number `retry` (1-based)."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+def call_with_retries(
+    fn: Callable[[], T],
+    is_retryable: Callable[[Exception], bool],
+    policy: Optional[RetryPolicy] = None,
+    deadline: Optional[Deadline] = None,
+    cancel: Optional[CancellationToken] = None,
+    budget: Optional[RetryBudget] = None,
+    what: str = 'Request'
+) -> T:
+    """
+    Call fn, retrying transient failures within the deadline and retry budget.
+
+    Args:
+        fn: Zero-argument callable performing one attempt
+        is_retryable: Whether an exception is transient
+        policy: Backoff policy (default RetryPolicy())
+        deadline: Overall deadline across all attempts
+        cancel: Cancellation token, checked before each attempt and during backoff
+        budget: Retry budget (default: the process-wide budget)
+        what: Description for log messages and errors
+
+    Returns:
+        The result of fn
+
+    Raises:
+        DeadlineExceeded: If the deadline passed before an attempt
+        RequestCancelled: If cancelled
+        Exception: The last error when it is not retryable, attempts or
+            budget are exhausted, or the backoff would overrun the deadline
+    """
+    policy = policy or RetryPolicy()
+    budget = budget or get_retry_budget()
+    budget.record_request()
+
+    attempt = 1
+    while True:
+        if cancel is not None:
+            cancel.check()
+        if deadline is not None:
+            deadline.check(what)
+
+        try:
+            return fn()
+        except (DeadlineExceeded, RequestCancelled):
+            raise
+        except Exception as e:
+            if not is_retryable(e) or attempt >= policy.max_attempts:
+                raise
+
+            delay = policy.backoff(attempt)
+            if deadline is not None and delay >= deadline.remaining():
+                logger.warning(f"{what} failed ({e}); no time left in the deadline to retry")
+                raise
+            if not budget.try_acquire():
+                logger.warning(f"{what} failed ({e}); retry budget exhausted, not retrying")
+                raise
+
+            logger.warning(f"{what} failed ({e}); retry {attempt}/{policy.max_attempts - 1} in {delay:.2f}s")
+            if cancel is not None:
+                if cancel.wait(delay):
+                    cancel.check()
+            else:
+                time.sleep(delay)
+            attempt += 1
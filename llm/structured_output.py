@@ -0,0 +1,277 @@
+"""
+Incremental Structured Output Parsing
+
+Parses agent output while it streams, so each finding or plan step can be
+acted on as soon as the model finishes writing it:
+
+- JSONStreamParser: yields every element of a JSON array (top-level, or
+  the array under a key such as {"findings": [...]}) once it closes.
+  Top-level objects without such an array are yielded whole, so JSON Lines
+  output works too. Prose and ``` fences around the JSON are ignored.
+- SectionStreamParser: yields markdown sections once the next heading of
+  the same or a higher level starts.
+
+Both expose feed(text) -> completed items and close() -> remaining items.
+LLMProvider.stream_structured() wires them to a provider stream and stops
+generation once enough items have arrived.
+"""
+
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_HEADING = re.compile(r'^(#{1,6})\s+(.+?)\s*#*\s*$')
+
+
+class JSONStreamParser:
+    """
+    Character-level incremental JSON item parser.
+    """
+
+    def __init__(self, item_key: Optional[str] = None):
+        """
+        Initialize parser.
+
+        Args:
+            item_key: Only treat the array under this top-level key as the
+                item list (default: the first array directly inside the
+                top-level object)
+        """
+        self.item_key = item_key
+
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string: List[str] = []
+        self._last_key: Optional[str] = None
+
+        # Stack depth of the array whose elements are items
+        self._item_depth: Optional[int] = None
+        self._found_items = False
+        self._item: Optional[List[str]] = None
+        self._item_kind: Optional[str] = None
+
+        # Whole top-level object, captured until an item array is found
+        self._top: Optional[List[str]] = None
+
+        self.errors = 0
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Consume streamed text.
+
+        Args:
+            text: Next chunk of model output
+
+        Returns:
+            List: Items completed by this chunk
+        """
+        out: List[Any] = []
+        for ch in text:
+            self._step(ch, out)
+        return out
+
+    def close(self) -> List[Any]:
+        """
+        Finish parsing at end of stream.
+
+        Returns:
+            List: A trailing scalar item, if any (unclosed containers are dropped)
+        """
+        out: List[Any] = []
+        if self._item is not None and self._item_kind == 'scalar':
+            self._finish(out)
+        if self._stack:
+            logger.debug(f"Stream ended inside {len(self._stack)} unclosed JSON containers")
+        return out
+
+    def _at_item_level(self) -> bool:
+        """Whether the next value starts a new item."""
+        return self._item_depth is not None and len(self._stack) == self._item_depth and self._item is None
+
+    def _finish(self, out: List[Any], chars: Optional[List[str]] = None) -> None:
+        """Decode a completed item."""
+        text = ''.join(chars if chars is not None else self._item).strip()
+        self._item = None
+        self._item_kind = None
+        try:
+            out.append(json.loads(text))
+        except ValueError as e:
+            self.errors += 1
+            logger.debug(f"Skipping malformed JSON item ({e}): {text[:80]}")
+
+    def _step(self, ch: str, out: List[Any]) -> None:
+        """Advance the state machine by one character."""
+        if self._item is not None and self._item_kind == 'scalar':
+            if ch in ',]}' or ch.isspace():
+                self._finish(out)
+            else:
+                self._item.append(ch)
+                return
+
+        if self._item is not None:
+            self._item.append(ch)
+        if self._top is not None:
+            self._top.append(ch)
+
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif ch == '\\':
+                self._escape = True
+            elif ch == '"':
+                self._in_string = False
+                if len(self._stack) == 1 and self._stack[0] == '{':
+                    self._last_key = ''.join(self._string)
+                if self._item_kind == 'string' and len(self._stack) == self._item_depth:
+                    self._finish(out)
+                return
+            self._string.append(ch)
+            return
+
+        if ch == '"':
+            self._in_string = True
+            self._string = []
+            if self._at_item_level():
+                self._item, self._item_kind = ['"'], 'string'
+            return
+
+        if ch in '{[':
+            if not self._stack:
+                if ch == '[':
+                    self._item_depth = 1
+                else:
+                    self._top = ['{']
+                    self._last_key = None
+                    self._found_items = False
+            elif self._at_item_level():
+                self._item, self._item_kind = [ch], 'container'
+            elif (ch == '[' and self._item_depth is None and self._stack == ['{']
+                  and (self._last_key == self.item_key or (self.item_key is None and not self._found_items))):
+                self._item_depth = 2
+                self._found_items = True
+                self._top = None
+            self._stack.append(ch)
+            return
+
+        if ch in '}]':
+            if not self._stack:
+                return
+            self._stack.pop()
+            if self._item_kind == 'container' and len(self._stack) == self._item_depth:
+                self._finish(out)
+            elif self._item_depth is not None and len(self._stack) < self._item_depth:
+                # The item array closed
+                self._item_depth = None
+            if not self._stack:
+                if self._top is not None:
+                    top, self._top = self._top, None
+                    self._finish(out, top)
+                self._item_depth = None
+            return
+
+        if self._at_item_level() and not ch.isspace() and ch not in ',:':
+            self._item, self._item_kind = [ch], 'scalar'
+
+
+class SectionStreamParser:
+    """
+    Incremental markdown section parser.
+    """
+
+    def __init__(self, level: Optional[int] = None):
+        """
+        Initialize parser.
+
+        Args:
+            level: Heading level that delimits items (e.g. 2 for '##').
+                Default: the level of the first heading seen
+        """
+        self.level = level
+
+        self._line = ''
+        self._in_fence = False
+        self._current: Optional[Dict[str, Any]] = None
+        self._body: List[str] = []
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Consume streamed text.
+
+        Args:
+            text: Next chunk of model output
+
+        Returns:
+            List[Dict]: Sections completed by this chunk ('title', 'level', 'content')
+        """
+        out: List[Dict[str, Any]] = []
+        self._line += text
+        while '\n' in self._line:
+            line, self._line = self._line.split('\n', 1)
+            self._consume(line, out)
+        return out
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        Finish parsing at end of stream.
+
+        Returns:
+            List[Dict]: The last section
+        """
+        out: List[Dict[str, Any]] = []
+        if self._line:
+            self._consume(self._line, out)
+            self._line = ''
+        self._emit(out)
+        return out
+
+    def _emit(self, out: List[Dict[str, Any]]) -> None:
+        """Complete the current section."""
+        if self._current is not None:
+            out.append({**self._current, 'content': '\n'.join(self._body).strip()})
+        self._current = None
+        self._body = []
+
+    def _consume(self, line: str, out: List[Dict[str, Any]]) -> None:
+        """Process one complete line."""
+        if line.lstrip().startswith('```'):
+            self._in_fence = not self._in_fence
+
+        match = None if self._in_fence else _HEADING.match(line)
+        if match:
+            level = len(match.group(1))
+            if self.level is None:
+                self.level = level
+            if level <= self.level:
+                self._emit(out)
+                if level == self.level:
+                    self._current = {'title': match.group(2), 'level': level}
+                return
+
+        if self._current is not None:
+            self._body.append(line)
+
+
+def make_parser(format: str, item_key: Optional[str] = None, section_level: Optional[int] = None):
+    """
+    Create a streaming parser.
+
+    Args:
+        format: 'json' or 'sections'
+        item_key: JSON key holding the item array (json only)
+        section_level: Heading level delimiting sections (sections only)
+
+    Returns:
+        JSONStreamParser or SectionStreamParser
+
+    Raises:
+        ValueError: If the format is unknown
+    """
+    if format == 'json':
+        return JSONStreamParser(item_key)
+    if format == 'sections':
+        return SectionStreamParser(section_level)
+    raise ValueError(f"Unknown structured output format '{format}'. Must be 'json' or 'sections'")
@@ -0,0 +1,394 @@
+"""
+Local LLM API Stub Server
+
+Minimal HTTP server that mimics the Anthropic Messages API and the
+OpenAI-compatible API served by vLLM and llama.cpp, so providers can be
+tested and benchmarked offline:
+
+- POST /v1/messages (JSON and SSE streaming) with usage accounting,
+  including prompt caching: system blocks marked with cache_control are
+  remembered, and repeats are reported as cache_read_input_tokens and
+  skip the simulated prefill time
+- POST /v1/chat/completions (JSON and SSE streaming, n choices) and
+  POST /v1/completions (a prompt or a list of prompts); requests are
+  served concurrently, like a continuous-batching server
+- GET /v1/models (in both formats)
+- Requests-per-minute limiting with 429 + retry-after and the
+  anthropic-ratelimit-* headers
+- Simulated latency: prefill per uncached input token, decode per output token
+
+Usage:
+    python -m llm.stub_server --port 8787 --rpm 120
+
+    with StubServer(rpm=60) as server:
+        provider = AnthropicProvider({'enabled': True, 'api_key': 'test', 'base_url': server.url})
+        vllm = OpenAICompatibleProvider({'enabled': True, 'base_url': f"{server.url}/v1"})
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+
+from .prompt_library import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+class StubServer:
+    """
+    Threaded stub API server with simulated latency, caching and rate limits.
+    """
+
+    def __init__(
+        self,
+        host: str = '127.0.0.1',
+        port: int = 0,
+        rpm: int = 0,
+        prefill_ms_per_token: float = 0.05,
+        decode_ms_per_token: float = 2.0,
+        output_tokens: int = 64
+    ):
+        """
+        Initialize server (not started).
+
+        Args:
+            host: Bind address
+            port: Port (0 picks a free one)
+            rpm: Requests per minute before 429s (0 = unlimited)
+            prefill_ms_per_token: Simulated time per uncached input token
+            decode_ms_per_token: Simulated time per output token
+            output_tokens: Tokens generated per response (capped by max_tokens)
+        """
+        self.rpm = rpm
+        self.prefill_ms_per_token = prefill_ms_per_token
+        self.decode_ms_per_token = decode_ms_per_token
+        self.output_tokens = output_tokens
+
+        self.requests = 0
+        self.rate_limited = 0
+        self._cache: set = set()
+        self._window: deque = deque()
+        self._lock = threading.Lock()
+
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """Base URL of the running server."""
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'StubServer':
+        """Serve in a background thread."""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='llm-stub-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Shut the server down."""
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> 'StubServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _admit(self) -> Tuple[bool, int, float]:
+        """Apply the rate limit: (allowed, remaining, seconds until a slot frees)."""
+        with self._lock:
+            self.requests += 1
+            if not self.rpm:
+                return True, 1_000_000, 0.0
+            now = time.monotonic()
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            reset = 60 - (now - self._window[0]) if self._window else 0.0
+            if len(self._window) >= self.rpm:
+                self.rate_limited += 1
+                return False, 0, reset
+            self._window.append(now)
+            return True, self.rpm - len(self._window), reset
+
+    def _usage(self, body: Dict[str, Any]) -> Dict[str, int]:
+        """Token usage, emulating prompt caching of cache_control system blocks."""
+        system = body.get('system') or []
+        if isinstance(system, str):
+            system = [{'type': 'text', 'text': system}]
+
+        cache_read = cache_write = uncached = 0
+        prefix = hashlib.sha256()
+        for block in system:
+            text = block.get('text', '')
+            prefix.update(text.encode('utf-8'))
+            tokens = estimate_tokens(text)
+            if block.get('cache_control'):
+                key = prefix.hexdigest()
+                with self._lock:
+                    hit = key in self._cache
+                    self._cache.add(key)
+                if hit:
+                    cache_read += tokens
+                else:
+                    cache_write += tokens
+            else:
+                uncached += tokens
+
+        for message in body.get('messages', []):
+            uncached += estimate_tokens(self._text(message.get('content')))
+
+        return {
+            'input_tokens': uncached,
+            'cache_creation_input_tokens': cache_write,
+            'cache_read_input_tokens': cache_read,
+        }
+
+    def _words(self, text: str, max_tokens: Optional[int] = None) -> List[str]:
+        """Deterministic response words for a prompt."""
+        count = min(self.output_tokens, int(max_tokens or self.output_tokens))
+        seed = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return [f"{'stub' if i else 'Stub'}-{seed[i % 64]}" + (' ' if i < count - 1 else '') for i in range(count)]
+
+    @staticmethod
+    def _text(content: Any) -> str:
+        """Flatten message content (string or list of text parts)."""
+        if isinstance(content, list):
+            return ''.join(part.get('text', '') for part in content)
+        return str(content or '')
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format: str, *args) -> None:
+                logger.debug(format % args)
+
+            def _send_json(self, status: int, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_error(self, status: int, kind: str, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+                # Both APIs read error.message; Anthropic also reads error.type
+                self._send_json(status, {'type': 'error', 'error': {'type': kind, 'message': message, 'code': status}}, headers)
+
+            def _start_events(self, headers: Dict[str, str]) -> None:
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Cache-Control', 'no-cache')
+                self.send_header('Connection', 'close')
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.close_connection = True
+
+            def _write_event(self, data: str, name: Optional[str] = None) -> None:
+                prefix = f"event: {name}\n" if name else ''
+                self.wfile.write(f"{prefix}data: {data}\n\n".encode('utf-8'))
+                self.wfile.flush()
+
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] == '/v1/models':
+                    # Fields of both the Anthropic and the OpenAI model list
+                    self._send_json(200, {
+                        'object': 'list',
+                        'data': [{'id': 'stub-model', 'type': 'model', 'object': 'model', 'owned_by': 'stub',
+                                  'display_name': 'Stub Model', 'created_at': '2024-01-01T00:00:00Z'}],
+                        'has_more': False,
+                        'first_id': 'stub-model',
+                        'last_id': 'stub-model',
+                    })
+                else:
+                    self._send_error(404, 'not_found_error', self.path)
+
+            def do_POST(self) -> None:
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    body = json.loads(self.rfile.read(length) or b'{}')
+                except ValueError:
+                    self._send_error(400, 'invalid_request_error', 'Invalid JSON')
+                    return
+
+                path = self.path.split('?')[0]
+                routes = {
+                    '/v1/messages': self._messages,
+                    '/v1/chat/completions': self._chat_completions,
+                    '/v1/completions': self._completions,
+                }
+                if path not in routes:
+                    self._send_error(404, 'not_found_error', self.path)
+                    return
+
+                allowed, remaining, reset = server._admit()
+                reset_at = datetime.fromtimestamp(time.time() + reset, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+                limit_headers = {
+                    'anthropic-ratelimit-requests-limit': str(server.rpm or 1_000_000),
+                    'anthropic-ratelimit-requests-remaining': str(remaining),
+                    'anthropic-ratelimit-requests-reset': reset_at,
+                }
+                if not allowed:
+                    self._send_error(429, 'rate_limit_error', 'Rate limited',
+                                     {**limit_headers, 'retry-after': str(max(1, round(reset)))})
+                    return
+
+                try:
+                    routes[path](body, limit_headers)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client cancelled the stream
+                    logger.debug(f"Client closed the connection during {path}")
+
+            def _messages(self, body: Dict[str, Any], headers: Dict[str, str]) -> None:
+                """Anthropic Messages API."""
+                usage = server._usage(body)
+                last = (body.get('messages') or [{}])[-1].get('content', '')
+                words = server._words(server._text(last), body.get('max_tokens'))
+                usage['output_tokens'] = len(words)
+                model = body.get('model', 'stub-model')
+                message_id = f"msg_stub_{server.requests}"
+
+                # Prefill: only uncached input costs time
+                time.sleep((usage['input_tokens'] + usage['cache_creation_input_tokens']) * server.prefill_ms_per_token / 1000)
+
+                if not body.get('stream'):
+                    time.sleep(len(words) * server.decode_ms_per_token / 1000)
+                    self._send_json(200, {
+                        'id': message_id,
+                        'type': 'message',
+                        'role': 'assistant',
+                        'model': model,
+                        'content': [{'type': 'text', 'text': ''.join(words)}],
+                        'stop_reason': 'end_turn' if len(words) < body.get('max_tokens', 0) else 'max_tokens',
+                        'stop_sequence': None,
+                        'usage': usage,
+                    }, headers)
+                    return
+
+                self._start_events(headers)
+
+                def event(name: str, data: Dict[str, Any]) -> None:
+                    self._write_event(json.dumps({'type': name, **data}), name)
+
+                event('message_start', {'message': {
+                    'id': message_id, 'type': 'message', 'role': 'assistant', 'model': model, 'content': [],
+                    'stop_reason': None, 'stop_sequence': None, 'usage': {**usage, 'output_tokens': 1},
+                }})
+                event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+                for word in words:
+                    time.sleep(server.decode_ms_per_token / 1000)
+                    event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': word}})
+                event('content_block_stop', {'index': 0})
+                event('message_delta', {'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                        'usage': {'output_tokens': len(words)}})
+                event('message_stop', {})
+
+            def _chat_completions(self, body: Dict[str, Any], headers: Dict[str, str]) -> None:
+                """OpenAI chat completions; the n choices decode in parallel."""
+                messages = body.get('messages') or [{}]
+                prompt_tokens = sum(estimate_tokens(server._text(m.get('content'))) for m in messages)
+                n = int(body.get('n') or 1)
+                words = server._words(server._text(messages[-1].get('content')), body.get('max_tokens'))
+                model = body.get('model', 'stub-model')
+                completion_id = f"chatcmpl-stub-{server.requests}"
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': n * len(words),
+                         'total_tokens': prompt_tokens + n * len(words)}
+                finish = 'length' if body.get('max_tokens') and len(words) >= body['max_tokens'] else 'stop'
+
+                time.sleep(prompt_tokens * server.prefill_ms_per_token / 1000)
+
+                if not body.get('stream'):
+                    time.sleep(len(words) * server.decode_ms_per_token / 1000)
+                    self._send_json(200, {
+                        'id': completion_id,
+                        'object': 'chat.completion',
+                        'created': int(time.time()),
+                        'model': model,
+                        'choices': [{'index': i, 'message': {'role': 'assistant', 'content': ''.join(words)},
+                                     'finish_reason': finish} for i in range(n)],
+                        'usage': usage,
+                    }, headers)
+                    return
+
+                self._start_events(headers)
+
+                def chunk(choices: List[Dict[str, Any]], **extra) -> None:
+                    self._write_event(json.dumps({'id': completion_id, 'object': 'chat.completion.chunk',
+                                                  'created': int(time.time()), 'model': model,
+                                                  'choices': choices, **extra}))
+
+                chunk([{'index': i, 'delta': {'role': 'assistant', 'content': ''}, 'finish_reason': None} for i in range(n)])
+                for word in words:
+                    time.sleep(server.decode_ms_per_token / 1000)
+                    chunk([{'index': i, 'delta': {'content': word}, 'finish_reason': None} for i in range(n)])
+                chunk([{'index': i, 'delta': {}, 'finish_reason': finish} for i in range(n)])
+                if (body.get('stream_options') or {}).get('include_usage'):
+                    chunk([], usage=usage)
+                self._write_event('[DONE]')
+
+            def _completions(self, body: Dict[str, Any], headers: Dict[str, str]) -> None:
+                """OpenAI completions; a list of prompts is processed as one batch."""
+                prompts = body.get('prompt') or ''
+                if isinstance(prompts, str):
+                    prompts = [prompts]
+                n = int(body.get('n') or 1)
+                outputs = [server._words(str(prompt), body.get('max_tokens')) for prompt in prompts]
+                prompt_tokens = sum(estimate_tokens(str(prompt)) for prompt in prompts)
+                completion_tokens = n * sum(len(words) for words in outputs)
+
+                time.sleep(prompt_tokens * server.prefill_ms_per_token / 1000)
+                time.sleep(max((len(words) for words in outputs), default=0) * server.decode_ms_per_token / 1000)
+
+                self._send_json(200, {
+                    'id': f"cmpl-stub-{server.requests}",
+                    'object': 'text_completion',
+                    'created': int(time.time()),
+                    'model': body.get('model', 'stub-model'),
+                    'choices': [{'index': p * n + i, 'text': ''.join(words), 'finish_reason': 'stop'}
+                                for p, words in enumerate(outputs) for i in range(n)],
+                    'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                              'total_tokens': prompt_tokens + completion_tokens},
+                }, headers)
+
+        return Handler
+
+
+def main() -> None:
+    """Run the stub server in the foreground."""
+    parser = argparse.ArgumentParser(description='Offline stub of the Anthropic and OpenAI-compatible APIs')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--rpm', type=int, default=0, help='Requests per minute before 429s (0 = unlimited)')
+    parser.add_argument('--prefill-ms-per-token', type=float, default=0.05)
+    parser.add_argument('--decode-ms-per-token', type=float, default=2.0)
+    parser.add_argument('--output-tokens', type=int, default=64)
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, args.rpm, args.prefill_ms_per_token,
+                        args.decode_ms_per_token, args.output_tokens)
+    print(f"Stub server listening on {server.url}")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
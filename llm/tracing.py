@@ -0,0 +1,426 @@
+"""
+Local Request Tracing
+
+Minimal OpenTelemetry-compatible tracer for the LLM layer. Spans are
+written as OTLP/JSON lines (one resourceSpans envelope per line, the format
+of the OpenTelemetry Collector's file exporter), so a trace file can be
+loaded into Jaeger/Tempo via the collector's otlpjsonfile receiver without
+adding the OpenTelemetry SDK as a dependency.
+
+Spans emitted by the LLM layer:
+
+- llm.factory.*: provider lookup, availability probes, provider creation
+- llm.invoke / llm.stream / llm.batch: one span per request (TracingMiddleware)
+- llm.model_check: Ollama checking (and possibly pulling) the model
+- llm.queue_wait: waiting for an orchestrator slot or a rate-limit window
+- llm.model_load, llm.server_queue, llm.prompt_eval, llm.generation:
+  request phases reconstructed from the provider's telemetry record
+
+Everything is a no-op until configure_tracing() installs a tracer.
+"""
+
+import atexit
+import json
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# OTLP span kinds and status codes
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current: ContextVar[Optional['Span']] = ContextVar('llm_current_span', default=None)
+
+_tracer: Optional['Tracer'] = None
+
+
+def default_trace_path() -> Path:
+    """Trace file under the structured log directory (CLAUDE_LOG_DIR)."""
+    from structured_logging.backend import default_log_dir
+
+    return default_log_dir() / 'traces' / 'llm-spans.jsonl'
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP AnyValue."""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    if isinstance(value, (list, tuple)):
+        return {'arrayValue': {'values': [_otlp_value(v) for v in value]}}
+    return {'stringValue': str(value)}
+
+
+class Span:
+    """
+    One timed operation in a trace.
+    """
+
+    def __init__(
+        self,
+        tracer: 'Tracer',
+        name: str,
+        parent: Optional['Span'] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        start_ns: Optional[int] = None
+    ):
+        """
+        Start a span.
+
+        Args:
+            tracer: Owning tracer
+            name: Operation name
+            parent: Parent span (None starts a new trace)
+            attributes: Initial attributes
+            kind: OTLP span kind
+            start_ns: Start time in epoch nanoseconds (default: now)
+        """
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else f"{random.getrandbits(128):032x}"
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.sampled = parent.sampled if parent else random.random() < tracer.sample_rate
+        self.start_ns = start_ns if start_ns is not None else time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes: Dict[str, Any] = {}
+        self.status_code = 0
+        self.status_message = ''
+        self.set_attributes(attributes or {})
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set one attribute (None values are skipped)."""
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, attributes: Dict[str, Any]) -> None:
+        """Set several attributes."""
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException) -> None:
+        """Mark the span as failed."""
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(error).__name__}: {error}"
+        self.set_attribute('error.type', type(error).__name__)
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        """Finish the span and hand it to the exporter (once)."""
+        if self.end_ns is not None:
+            return
+        self.end_ns = end_ns if end_ns is not None else time.time_ns()
+        if self.sampled:
+            self.tracer.exporter.export(self)
+
+    @property
+    def duration_ms(self) -> float:
+        """Duration so far (or total once ended)."""
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """OTLP/JSON representation."""
+        span = {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in self.attributes.items()],
+            'status': {'code': self.status_code, 'message': self.status_message} if self.status_code else {},
+        }
+        if self.parent is not None:
+            span['parentSpanId'] = self.parent.span_id
+        return span
+
+
+class FileSpanExporter:
+    """
+    Appends finished spans to a file as OTLP/JSON lines.
+
+    Spans are buffered and written when a trace's root span ends, when the
+    buffer is full, and at interpreter exit.
+    """
+
+    def __init__(self, path: Union[str, Path], service_name: str = 'llm', batch_size: int = 256):
+        """
+        Initialize exporter.
+
+        Args:
+            path: Output file (parent directories are created)
+            service_name: service.name resource attribute
+            batch_size: Maximum spans buffered before a write
+        """
+        self.path = Path(path).expanduser()
+        self.service_name = service_name
+        self.batch_size = batch_size
+        self.exported = 0
+
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def export(self, span: Span) -> None:
+        """Buffer a finished span."""
+        with self._lock:
+            self._buffer.append(span)
+            full = len(self._buffer) >= self.batch_size
+        if full or span.parent is None:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write buffered spans as one resourceSpans line."""
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+            if not spans:
+                return
+            envelope = {'resourceSpans': [{
+                'resource': {'attributes': [
+                    {'key': 'service.name', 'value': {'stringValue': self.service_name}},
+                    {'key': 'process.pid', 'value': {'intValue': str(os.getpid())}},
+                ]},
+                'scopeSpans': [{
+                    'scope': {'name': 'llm.tracing'},
+                    'spans': [span.to_otlp() for span in spans],
+                }],
+            }]}
+            try:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(envelope, separators=(',', ':')) + '\n')
+                self.exported += len(spans)
+            except OSError as e:
+                logger.warning(f"Failed to write {len(spans)} spans to {self.path}: {e}")
+
+
+class Tracer:
+    """
+    Creates spans and tracks the active span per thread/context.
+    """
+
+    def __init__(self, exporter: FileSpanExporter, sample_rate: float = 1.0):
+        """
+        Initialize tracer.
+
+        Args:
+            exporter: Destination for finished spans
+            sample_rate: Fraction of traces recorded (decided at the root span)
+        """
+        self.exporter = exporter
+        self.sample_rate = sample_rate
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[Dict[str, Any]] = None,
+        parent: Optional[Span] = None,
+        kind: int = SPAN_KIND_INTERNAL,
+        start_ns: Optional[int] = None
+    ) -> Span:
+        """
+        Start a span (child of the active span unless a parent is given).
+
+        Returns:
+            Span: Started span; call end() when done
+        """
+        return Span(self, name, parent or _current.get(), attributes, kind, start_ns)
+
+    @contextmanager
+    def activate(self, span: Span) -> Iterator[Span]:
+        """Make span the parent of spans started inside the block."""
+        token = _current.set(span)
+        try:
+            yield span
+        finally:
+            _current.reset(token)
+
+
+def configure_tracing(
+    path: Optional[Union[str, Path]] = None,
+    sample_rate: float = 1.0,
+    service_name: str = 'llm'
+) -> Tracer:
+    """
+    Install the process-wide tracer.
+
+    Args:
+        path: Trace file (default: <log dir>/traces/llm-spans.jsonl)
+        sample_rate: Fraction of traces recorded
+        service_name: service.name resource attribute
+
+    Returns:
+        Tracer: The installed tracer
+    """
+    global _tracer
+    if _tracer is not None:
+        _tracer.exporter.flush()
+    _tracer = Tracer(FileSpanExporter(path or default_trace_path(), service_name), sample_rate)
+    logger.info(f"Tracing LLM requests to {_tracer.exporter.path} (sample rate {sample_rate})")
+    return _tracer
+
+
+def get_tracer() -> Optional[Tracer]:
+    """Return the process-wide tracer, or None if tracing is off."""
+    return _tracer
+
+
+def disable_tracing() -> None:
+    """Flush and remove the process-wide tracer."""
+    global _tracer
+    if _tracer is not None:
+        _tracer.exporter.flush()
+    _tracer = None
+
+
+def current_span() -> Optional[Span]:
+    """Return the active span, if any."""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str, kind: int = SPAN_KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Trace a block as a child of the active span.
+
+    Args:
+        name: Operation name
+        kind: OTLP span kind
+        **attributes: Span attributes
+
+    Yields:
+        Span: The active span, or None when tracing is off
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield None
+        return
+
+    current = tracer.start_span(name, attributes, kind=kind)
+    try:
+        with tracer.activate(current):
+            yield current
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        current.end()
+
+
+def traced_iter(
+    name: str,
+    iterable: Iterable[Any],
+    kind: int = SPAN_KIND_INTERNAL,
+    **attributes: Any
+) -> Iterator[Any]:
+    """
+    Trace the consumption of an iterator (typically a stream).
+
+    The span starts on the first next() and is active only while the
+    iterator itself runs, so it never leaks into the consumer's code
+    between chunks. It ends when the iterator is exhausted, fails or is
+    closed early.
+
+    Args:
+        name: Operation name
+        iterable: Iterator to wrap
+        kind: OTLP span kind
+        **attributes: Span attributes
+
+    Yields:
+        The wrapped iterator's items
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield from iterable
+        return
+
+    current = tracer.start_span(name, attributes, kind=kind)
+    iterator = iter(iterable)
+    items = 0
+    try:
+        while True:
+            with tracer.activate(current):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    break
+            items += 1
+            yield item
+    except GeneratorExit:
+        current.set_attribute('llm.stream.closed_early', True)
+        raise
+    except BaseException as e:
+        current.record_error(e)
+        raise
+    finally:
+        if hasattr(iterator, 'close'):
+            with tracer.activate(current):
+                iterator.close()
+        current.set_attribute('llm.stream.chunks', items)
+        current.end()
+
+
+def record_request(record: Dict[str, Any]) -> None:
+    """
+    Attach a provider telemetry record to the active request span.
+
+    Adds token counts as attributes and reconstructs the request phases
+    as child spans laid out backwards from now:
+    [server_queue][model_load][prompt_eval][generation]. Phases the
+    provider does not report are omitted; for streams without server
+    timings, time to first token stands in for prompt evaluation.
+
+    Args:
+        record: Record passed to LLMProvider._record_telemetry()
+    """
+    tracer = _tracer
+    parent = _current.get()
+    if tracer is None or parent is None:
+        return
+
+    parent.set_attributes({
+        'gen_ai.request.model': record.get('model'),
+        'gen_ai.usage.input_tokens': record.get('prompt_tokens'),
+        'gen_ai.usage.output_tokens': record.get('completion_tokens'),
+        'llm.latency_ms': record.get('latency_ms'),
+        'llm.ttft_ms': record.get('ttft_ms'),
+        'llm.tokens_per_second': record.get('tokens_per_second'),
+        'llm.cache_read_tokens': record.get('cache_read_tokens'),
+    })
+
+    latency_ms = record.get('latency_ms') or 0.0
+    ttft_ms = record.get('ttft_ms')
+    generation_ms = record.get('eval_ms')
+    if generation_ms is None and ttft_ms is not None:
+        generation_ms = latency_ms - ttft_ms
+    prompt_eval_ms = record.get('prompt_eval_ms')
+    if prompt_eval_ms is None and generation_ms is not None and record.get('load_ms') is None:
+        prompt_eval_ms = latency_ms - generation_ms
+    load_ms = record.get('load_ms')
+    known = sum(ms or 0 for ms in (generation_ms, prompt_eval_ms, load_ms))
+    queue_ms = latency_ms - known if load_ms is not None and latency_ms > known else None
+
+    end_ns = time.time_ns()
+    for name, ms in (('llm.generation', generation_ms), ('llm.prompt_eval', prompt_eval_ms),
+                     ('llm.model_load', load_ms), ('llm.server_queue', queue_ms)):
+        if not ms or ms <= 0:
+            continue
+        start_ns = end_ns - int(ms * 1e6)
+        phase = tracer.start_span(name, {'llm.duration_ms': ms}, parent=parent, start_ns=start_ns)
+        phase.end(end_ns)
+        end_ns = start_ns
@@ -4,7 +4,9 @@
 # Provides various ways to view and analyze subagent command logs
 
 LOG_DIR="$HOME/.claude/logs"
-LOG_FILE="$LOG_DIR/subagent-commands.log"
+LOG_FILE="$LOG_DIR/subagent-commands.jsonl"
+SCRIPT_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+LOG_PYTHON="${LOG_PYTHON:-python3}"
 
 # Colors
 RED='\033[0;31m'
@@ -32,10 +34,11 @@ show_help() {
     echo "  -f, --follow            Follow log file (like tail -f)"
     echo "  -g, --grep PATTERN      Search logs for pattern"
     echo "  -d, --date DATE         Show logs for specific date (YYYY-MM-DD)"
-    echo "  -l, --list-sessions     List all session log files"
-    echo "  -v, --session FILE      View specific session log"
+    echo "  -R, --range FROM TO     Show logs between two dates/times (inclusive)"
+    echo "  -l, --list-sessions     List recent sessions"
+    echo "  -v, --session ID        View a specific session"
     echo "  --clean [DAYS]          Clean logs older than N days (default: 7)"
-    echo "  --export [FILE]         Export logs to file"
+    echo "  --export [FILE [FROM [TO]]]  Export logs (optionally a date range) to file"
     echo "  -h, --help              Show this help message"
     echo ""
     echo "Examples:"
@@ -45,12 +48,20 @@ show_help() {
     echo "  $0 -t                        # Show today's logs"
     echo "  $0 -g 'Command started'      # Search for pattern"
     echo "  $0 -d 2024-01-15            # Show logs for specific date"
+    echo "  $0 -R 2024-01-10 2024-01-15 # Show logs for a date range"
     echo "  $0 --clean 30               # Clean logs older than 30 days"
 }
 
+# Run the structured logging CLI (structured_logging/cli.py)
+log_cli() {
+    PYTHONPATH="$SCRIPT_DIR${PYTHONPATH:+:$PYTHONPATH}" \
+        "$LOG_PYTHON" -m structured_logging.cli --log-dir "$LOG_DIR" "$@"
+}
+
 # Function to check if log file exists
 check_log_file() {
-    if [[ ! -f "$LOG_FILE" ]]; then
+    # Right after a rotation only the compressed segments exist
+    if [[ ! -f "$LOG_FILE" && ! -f "$LOG_DIR/segments/index.json" ]]; then
         echo -e "${YELLOW}[WARN]${NC} No log file found at $LOG_FILE"
         echo "Run a subagent command first to generate logs."
         return 1
@@ -66,7 +77,7 @@ show_recent() {
     echo -e "${BLUE}[INFO]${NC} Recent $count log entries:"
     echo "========================================"
     
-    tail -n "$count" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --tail "$count" | while IFS= read -r line; do
         # Color code by log level
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
@@ -90,7 +101,7 @@ show_command_logs() {
     echo -e "${BLUE}[INFO]${NC} Logs for command: $command"
     echo "========================================"
     
-    grep "\[$command\]" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --command "$command" | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -108,7 +119,7 @@ show_errors() {
     echo -e "${RED}[ERROR]${NC} Error logs:"
     echo "================================"
     
-    grep "\[ERROR\]" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --level ERROR | while IFS= read -r line; do
         echo -e "${RED}$line${NC}"
     done
 }
@@ -120,7 +131,7 @@ show_warnings() {
     echo -e "${YELLOW}[WARN]${NC} Warning logs:"
     echo "==================================="
     
-    grep "\[WARN\]" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --level WARN | while IFS= read -r line; do
         echo -e "${YELLOW}$line${NC}"
     done
 }
@@ -133,7 +144,7 @@ show_today() {
     echo -e "${BLUE}[INFO]${NC} Today's logs ($today):"
     echo "========================================"
     
-    grep "^\\[$today" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --date "$today" | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -151,19 +162,7 @@ show_stats() {
     echo -e "${PURPLE}[STATS]${NC} Command Usage Statistics:"
     echo "=========================================="
     
-    # Commands executed
-    echo "Commands executed:"
-    grep "Command started" "$LOG_FILE" | \
-    sed 's/.*\[\(.*\)\] Command started.*/\1/' | \
-    sort | uniq -c | sort -nr | head -10
-    
-    echo ""
-    echo "Summary:"
-    echo "--------"
-    echo "Total commands: $(grep -c "Command started" "$LOG_FILE")"
-    echo "Total errors: $(grep -c "\[ERROR\]" "$LOG_FILE")"
-    echo "Total warnings: $(grep -c "\[WARN\]" "$LOG_FILE")"
-    echo "Most active day: $(grep "Command started" "$LOG_FILE" | sed 's/^\[\([0-9-]*\).*/\1/' | sort | uniq -c | sort -nr | head -1)"
+    log_cli stats --top 10
 }
 
 # Function to follow logs
@@ -173,7 +172,8 @@ follow_logs() {
     echo -e "${BLUE}[INFO]${NC} Following log file (Ctrl+C to stop):"
     echo "=========================================="
     
-    tail -f "$LOG_FILE" | while IFS= read -r line; do
+    # -F reopens the file by name after rotation renames it away
+    tail -n 0 -F "$LOG_FILE" | log_cli render | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -192,7 +192,7 @@ search_logs() {
     echo -e "${BLUE}[INFO]${NC} Searching for pattern: $pattern"
     echo "=========================================="
     
-    grep -i "$pattern" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --grep "$pattern" | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -211,7 +211,27 @@ show_date() {
     echo -e "${BLUE}[INFO]${NC} Logs for date: $date"
     echo "========================================"
     
-    grep "^\\[$date" "$LOG_FILE" | while IFS= read -r line; do
+    log_cli cat --date "$date" | while IFS= read -r line; do
+        if [[ "$line" =~ \[ERROR\] ]]; then
+            echo -e "${RED}$line${NC}"
+        elif [[ "$line" =~ \[WARN\] ]]; then
+            echo -e "${YELLOW}$line${NC}"
+        else
+            echo -e "${GREEN}$line${NC}"
+        fi
+    done
+}
+
+# Function to show logs for a date range
+show_range() {
+    local from="$1"
+    local to="${2:-$1}"
+    check_log_file || return 1
+    
+    echo -e "${BLUE}[INFO]${NC} Logs from $from to $to"
+    echo "========================================"
+    
+    log_cli cat --from "$from" --to "$to" | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -224,11 +244,12 @@ show_date() {
 
 # Function to list session files
 list_sessions() {
-    echo -e "${BLUE}[INFO]${NC} Session log files:"
+    echo -e "${BLUE}[INFO]${NC} Sessions:"
     echo "================================="
     
-    if [[ -d "$LOG_DIR" ]]; then
-        find "$LOG_DIR" -name "session-*.log" -exec basename {} \; | sort -r | head -20
+    # Right after a rotation only the compressed segments exist
+    if [[ -f "$LOG_FILE" || -f "$LOG_DIR/segments/index.json" ]]; then
+        log_cli sessions --limit 20
     else
         echo "No session logs found"
     fi
@@ -236,18 +257,13 @@ list_sessions() {
 
 # Function to view specific session
 view_session() {
-    local session_file="$1"
-    local full_path="$LOG_DIR/$session_file"
-    
-    if [[ ! -f "$full_path" ]]; then
-        echo -e "${RED}[ERROR]${NC} Session file not found: $full_path"
-        return 1
-    fi
+    local session_id="$1"
+    check_log_file || return 1
     
-    echo -e "${BLUE}[INFO]${NC} Session log: $session_file"
+    echo -e "${BLUE}[INFO]${NC} Session: $session_id"
     echo "========================================"
     
-    cat "$full_path" | while IFS= read -r line; do
+    log_cli cat --session "$session_id" | while IFS= read -r line; do
         if [[ "$line" =~ \[ERROR\] ]]; then
             echo -e "${RED}$line${NC}"
         elif [[ "$line" =~ \[WARN\] ]]; then
@@ -265,7 +281,9 @@ clean_logs() {
     echo -e "${BLUE}[INFO]${NC} Cleaning logs older than $days days..."
     
     if [[ -d "$LOG_DIR" ]]; then
-        find "$LOG_DIR" -name "*.log" -mtime +$days -delete
+        # Pre-rotation per-command logs lived directly in $LOG_DIR
+        find "$LOG_DIR" -maxdepth 1 -name "*.log" -mtime +$days -delete
+        log_cli clean --days "$days"
         echo -e "${GREEN}[SUCCESS]${NC} Old logs cleaned"
     else
         echo -e "${YELLOW}[WARN]${NC} Log directory not found"
@@ -275,16 +293,21 @@ clean_logs() {
 # Function to export logs
 export_logs() {
     local output_file="${1:-subagent-logs-$(date +%Y%m%d).txt}"
+    local range=()
+    [[ -n "$2" ]] && range+=(--from "$2")
+    [[ -n "$3" ]] && range+=(--to "$3")
     check_log_file || return 1
     
     echo -e "${BLUE}[INFO]${NC} Exporting logs to: $output_file"
     
+    # Streams straight from the compressed segments; only those overlapping
+    # the range are decompressed
     {
         echo "Claude Subagent Command Logs"
         echo "Generated: $(date)"
         echo "=================================="
         echo ""
-        cat "$LOG_FILE"
+        log_cli export "${range[@]}"
     } > "$output_file"
     
     echo -e "${GREEN}[SUCCESS]${NC} Logs exported to: $output_file"
@@ -320,6 +343,9 @@ main() {
         -d|--date)
             show_date "$2"
             ;;
+        -R|--range)
+            show_range "$2" "$3"
+            ;;
         -l|--list-sessions)
             list_sessions
             ;;
@@ -330,7 +356,7 @@ main() {
             clean_logs "$2"
             ;;
         --export)
-            export_logs "$2"
+            export_logs "$2" "$3" "$4"
             ;;
         -h|--help|"")
             show_help
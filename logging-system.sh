@@ -5,8 +5,16 @@
 
 # Configuration
 LOG_DIR="$HOME/.claude/logs"
-LOG_FILE="$LOG_DIR/subagent-commands.log"
-SESSION_LOG="$LOG_DIR/session-$(date +%Y%m%d-%H%M%S).log"
+LOG_FILE="$LOG_DIR/subagent-commands.jsonl"
+LOGGING_SYSTEM_DIR="$(cd "$(dirname "${BASH_SOURCE[0]}")" && pwd)"
+LOG_PYTHON="${LOG_PYTHON:-python3}"
+
+# Every record from this shell session (and its child processes) shares this ID
+export CLAUDE_SESSION_ID="${CLAUDE_SESSION_ID:-$(date +%Y%m%d-%H%M%S)-$$}"
+export CLAUDE_LOG_DIR="$LOG_DIR"
+
+# File descriptor of the structured logging shim (see start_log_shim)
+LOG_SHIM_FD=19
 
 # Colors for output
 RED='\033[0;31m'
@@ -18,16 +26,74 @@ NC='\033[0m' # No Color
 # Create log directory if it doesn't exist
 mkdir -p "$LOG_DIR"
 
+# Run the structured logging CLI (structured_logging/cli.py)
+_log_cli() {
+    PYTHONPATH="$LOGGING_SYSTEM_DIR${PYTHONPATH:+:$PYTHONPATH}" \
+        "$LOG_PYTHON" -m structured_logging.cli --log-dir "$LOG_DIR" "$@"
+}
+
+# Start one long-lived shim process per shell session. log_message then only
+# printf's a tab-separated line to it; the shim batches records into
+# $LOG_FILE as JSONL. Without Python, log_message falls back to direct appends.
+start_log_shim() {
+    # Child scripts inherit the parent's shim descriptor
+    if _log_shim_available; then
+        return 0
+    fi
+    if ! PYTHONPATH="$LOGGING_SYSTEM_DIR${PYTHONPATH:+:$PYTHONPATH}" \
+        "$LOG_PYTHON" -c 'import structured_logging' >/dev/null 2>&1; then
+        return 1
+    fi
+
+    eval "exec $LOG_SHIM_FD> >(_log_cli ingest 2>/dev/null)"
+    LOG_SHIM_ACTIVE=1
+}
+
+_log_shim_available() {
+    [[ -n "${LOG_SHIM_ACTIVE:-}" ]] && { true >&$LOG_SHIM_FD; } 2>/dev/null
+}
+
+# Append a JSON record directly (used only when the shim is unavailable)
+_log_append_json() {
+    local level="$1"
+    local command="${2//\\/\\\\}"
+    local message="${3//\\/\\\\}"
+    local latency_ms="$4"
+    command="${command//\"/\\\"}"
+    message="${message//\"/\\\"}"
+
+    printf '{"ts": %s, "time": "%s", "level": "%s", "command": "%s", "message": "%s", "session_id": "%s"%s}\n' \
+        "$(date +%s)" "$(date '+%Y-%m-%d %H:%M:%S')" "$level" "$command" "$message" "$CLAUDE_SESSION_ID" \
+        "${latency_ms:+, \"latency_ms\": $latency_ms}" >> "$LOG_FILE"
+}
+
 # Function to log messages
 log_message() {
     local level="$1"
     local command="$2"
     local message="$3"
-    local timestamp=$(date '+%Y-%m-%d %H:%M:%S')
-    
-    # Format: [TIMESTAMP] [LEVEL] [COMMAND] MESSAGE
-    echo "[$timestamp] [$level] [$command] $message" >> "$LOG_FILE"
-    echo "[$timestamp] [$level] [$command] $message" >> "$SESSION_LOG"
+    local latency_ms="${4:-}"
+
+    # Records are one line each; tabs separate shim fields
+    message="${message//$'\t'/ }"
+    message="${message//$'\n'/ }"
+
+    if _log_shim_available; then
+        # EPOCHREALTIME (bash 5+) avoids forking date; the shim stamps the time otherwise
+        printf '%s\t%s\t%s\t%s\t%s\n' "$level" "$command" "$message" "${EPOCHREALTIME:-}" "$latency_ms" >&$LOG_SHIM_FD
+    else
+        _log_append_json "$level" "$command" "$message" "$latency_ms"
+    fi
+}
+
+# Milliseconds since the epoch (no fork on bash 5+)
+log_now_ms() {
+    if [[ -n "${EPOCHREALTIME:-}" ]]; then
+        local now="${EPOCHREALTIME/[.,]/}"
+        echo $((now / 1000))
+    else
+        echo $(($(date +%s) * 1000))
+    fi
 }
 
 # Function to log command start
@@ -38,10 +104,10 @@ log_command_start() {
     
     log_message "INFO" "$command" "Command started with args: $args"
     log_message "INFO" "$command" "Working directory: $pwd"
-    log_message "INFO" "$command" "Session log: $SESSION_LOG"
+    log_message "INFO" "$command" "Session: $CLAUDE_SESSION_ID"
     
     echo -e "${GREEN}[LOG]${NC} Started command: $command"
-    echo -e "${BLUE}[LOG]${NC} Session log: $SESSION_LOG"
+    echo -e "${BLUE}[LOG]${NC} Session: $CLAUDE_SESSION_ID"
 }
 
 # Function to log command completion
@@ -49,8 +115,9 @@ log_command_complete() {
     local command="$1"
     local duration="$2"
     local status="$3"
+    local latency_ms="${4:-$((duration * 1000))}"
     
-    log_message "INFO" "$command" "Command completed in $duration seconds with status: $status"
+    log_message "INFO" "$command" "Command completed in $duration seconds with status: $status" "$latency_ms"
     echo -e "${GREEN}[LOG]${NC} Command completed in $duration seconds"
 }
 
@@ -87,8 +154,9 @@ log_debug() {
 create_command_log() {
     local command="$1"
     local timestamp=$(date '+%Y%m%d-%H%M%S')
-    local command_log="$LOG_DIR/${command}-${timestamp}.log"
+    local command_log="$LOG_DIR/outputs/${command}-${timestamp}.log"
     
+    mkdir -p "$LOG_DIR/outputs"
     echo "$command_log"
 }
 
@@ -106,12 +174,12 @@ log_output() {
 show_recent_logs() {
     local count="${1:-10}"
     echo -e "${BLUE}[LOG]${NC} Recent $count log entries:"
-    tail -n "$count" "$LOG_FILE"
+    _log_cli cat --tail "$count"
 }
 
 # Function to show command statistics
 show_command_stats() {
-    if [[ ! -f "$LOG_FILE" ]]; then
+    if [[ ! -f "$LOG_FILE" && ! -f "$LOG_DIR/segments/index.json" ]]; then
         echo -e "${YELLOW}[LOG]${NC} No log file found"
         return
     fi
@@ -119,16 +187,7 @@ show_command_stats() {
     echo -e "${BLUE}[LOG]${NC} Command usage statistics:"
     echo "=================================="
     
-    # Count by command
-    echo "Commands executed:"
-    grep -o '\[.*\] \[INFO\] \[.*\] Command started' "$LOG_FILE" | \
-    sed 's/.*\[INFO\] \[\(.*\)\] Command started/\1/' | \
-    sort | uniq -c | sort -nr
-    
-    echo ""
-    echo "Total commands executed: $(grep -c 'Command started' "$LOG_FILE")"
-    echo "Total errors: $(grep -c '\[ERROR\]' "$LOG_FILE")"
-    echo "Total warnings: $(grep -c '\[WARN\]' "$LOG_FILE")"
+    _log_cli stats
 }
 
 # Function to clean old logs
@@ -136,12 +195,21 @@ clean_old_logs() {
     local days="${1:-7}"
     echo -e "${BLUE}[LOG]${NC} Cleaning logs older than $days days..."
     
-    find "$LOG_DIR" -name "*.log" -mtime +$days -delete
+    # Pre-rotation per-command logs lived directly in $LOG_DIR
+    find "$LOG_DIR" -maxdepth 1 -name "*.log" -mtime +$days -delete
+    _log_cli clean --days "$days"
     echo -e "${GREEN}[LOG]${NC} Old logs cleaned"
 }
 
+# Start the structured logging shim for this shell session
+start_log_shim
+
 # Export functions for use in other scripts
+export -f _log_cli
+export -f _log_shim_available
+export -f _log_append_json
 export -f log_message
+export -f log_now_ms
 export -f log_command_start
 export -f log_command_complete
 export -f log_error
@@ -153,4 +221,7 @@ export -f log_output
 # Export variables
 export LOG_DIR
 export LOG_FILE
-export SESSION_LOG
\ No newline at end of file
+export LOG_PYTHON
+export LOGGING_SYSTEM_DIR
+export LOG_SHIM_FD
+export LOG_SHIM_ACTIVE
\ No newline at end of file
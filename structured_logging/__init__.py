@@ -0,0 +1,25 @@
+"""
+Structured Logging
+
+One buffered JSONL event stream for the shell wrappers, llm/ and fine_tuning/.
+"""
+
+from .backend import (
+    configure,
+    emit,
+    log_context,
+    new_request_id,
+    timed,
+    read_records,
+    format_text,
+)
+
+__all__ = [
+    'configure',
+    'emit',
+    'log_context',
+    'new_request_id',
+    'timed',
+    'read_records',
+    'format_text',
+]
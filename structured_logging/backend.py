@@ -0,0 +1,401 @@
+"""
+Structured Logging Backend
+
+Single JSONL event stream shared by the shell wrappers (via cli.py), llm/
+and fine_tuning/. Producers only build a dict and put it on a bounded queue;
+a background writer thread drains the queue and appends records in batches,
+one write() per batch, so logging never blocks on disk I/O.
+
+Each record carries:
+- ts / time: wall-clock epoch seconds and a readable local timestamp
+- mono_ns: CLOCK_MONOTONIC nanoseconds (host-wide on Linux), for ordering
+  and latency maths that are immune to clock adjustments
+- level, command, message, logger, pid
+- session_id / request_id: correlation IDs from log_context() or the
+  CLAUDE_SESSION_ID environment variable
+- latency_ms and any other structured fields passed via `extra=`
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+LOG_DIR_ENV = 'CLAUDE_LOG_DIR'
+SESSION_ENV = 'CLAUDE_SESSION_ID'
+
+DEFAULT_LOG_DIR = Path.home() / '.claude' / 'logs'
+LOG_FILE_NAME = 'subagent-commands.jsonl'
+
+# Attributes every LogRecord has; anything else on a record came from `extra=`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_context: ContextVar[Dict[str, Any]] = ContextVar('structured_log_context', default={})
+
+_writer: Optional['BatchingJSONLWriter'] = None
+_writer_lock = threading.Lock()
+
+
+def default_log_dir() -> Path:
+    """Log directory from CLAUDE_LOG_DIR, defaulting to ~/.claude/logs."""
+    return Path(os.environ.get(LOG_DIR_ENV) or DEFAULT_LOG_DIR)
+
+
+def default_session_id() -> str:
+    """Session ID from CLAUDE_SESSION_ID, or a new one for this process."""
+    session_id = os.environ.get(SESSION_ENV)
+    if not session_id:
+        session_id = datetime.now().strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+        os.environ[SESSION_ENV] = session_id
+    return session_id
+
+
+def new_request_id() -> str:
+    """Generate a short random request ID."""
+    return uuid.uuid4().hex[:16]
+
+
+@contextmanager
+def log_context(**fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Attach fields (command, request_id, ...) to every record logged inside the block.
+
+    Contexts nest; inner values override outer ones. Context is tracked with
+    contextvars, so it follows asyncio tasks and does not leak across threads.
+
+    Args:
+        **fields: Fields to add to records
+
+    Yields:
+        Dict: The merged context
+    """
+    merged = {**_context.get(), **fields}
+    token = _context.set(merged)
+    try:
+        yield merged
+    finally:
+        _context.reset(token)
+
+
+def make_record(
+    level: str,
+    message: str,
+    command: Optional[str] = None,
+    ts: Optional[float] = None,
+    **fields: Any
+) -> Dict[str, Any]:
+    """
+    Build a structured record, filling in clocks and context IDs.
+
+    Args:
+        level: Level name (INFO, WARN, ERROR, DEBUG, OUTPUT, ...)
+        message: Log message
+        command: Command or component name
+        ts: Wall-clock epoch seconds (defaults to now)
+        **fields: Extra structured fields (latency_ms, ...)
+
+    Returns:
+        Dict: Record ready for BatchingJSONLWriter.submit()
+    """
+    ts = time.time() if ts is None else ts
+    record = {
+        'ts': ts,
+        'time': datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'),
+        'mono_ns': time.monotonic_ns(),
+        'level': level,
+        'message': message,
+        'pid': os.getpid(),
+        'session_id': default_session_id(),
+    }
+    record.update(_context.get())
+    if command is not None or 'command' not in record:
+        record['command'] = command
+    record.update({k: v for k, v in fields.items() if v is not None})
+    return record
+
+
+class BatchingJSONLWriter:
+    """
+    Background thread that appends queued records to a JSONL file in batches.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        batch_size: int = 256,
+        flush_interval: float = 0.5,
+        max_queue: int = 10000
+    ):
+        """
+        Initialize and start the writer thread.
+
+        Args:
+            path: JSONL file to append to
+            batch_size: Maximum records per write
+            flush_interval: Seconds to wait for more records before writing
+            max_queue: Queue bound; records are dropped (and counted) when full
+        """
+        self.path = Path(path)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self.written = 0
+
+        from .rotation import rotation_settings
+
+        # The writer thread rotates the file once it passes the size limit
+        self.rotation = rotation_settings()
+
+        self._queue: 'queue.Queue[Optional[Dict[str, Any]]]' = queue.Queue(max_queue)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='structured-log-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, record: Dict[str, Any]) -> None:
+        """
+        Queue a record without blocking.
+
+        Args:
+            record: Structured record (see make_record())
+        """
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Flush queued records and stop the writer thread."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        """Drain the queue in batches until close() is called."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        stopping = False
+        while not stopping:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+
+            batch: List[Dict[str, Any]] = []
+            item = first
+            while True:
+                if item is None:
+                    stopping = True
+                else:
+                    batch.append(item)
+                if stopping or len(batch) >= self.batch_size:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+
+            if batch:
+                self._write(batch)
+
+    def _write(self, batch: List[Dict[str, Any]]) -> None:
+        """Append a batch with a single write (O_APPEND keeps processes from interleaving)."""
+        if self.dropped:
+            batch.append(make_record('WARN', f'Dropped {self.dropped} log records (queue full)', 'structured_logging'))
+            self.dropped = 0
+
+        from .rotation import rotate, rotation_lock
+
+        data = ''.join(json.dumps(r, ensure_ascii=False, default=str) + '\n' for r in batch)
+        try:
+            # Shared lock: rotation cannot rename the file mid-append
+            with rotation_lock(self.path.parent):
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(data)
+                    size = f.tell()
+            self.written += len(batch)
+
+            if self.rotation['max_bytes'] > 0 and size >= self.rotation['max_bytes']:
+                rotate(self.path.parent, self.rotation)
+        except (OSError, ValueError) as e:
+            # Never let logging failures reach the application
+            logging.getLogger(__name__).debug(f"Failed to write log batch: {e}")
+
+
+class StructuredHandler(logging.Handler):
+    """
+    stdlib logging handler that forwards records to a BatchingJSONLWriter.
+    """
+
+    def __init__(self, writer: BatchingJSONLWriter, command: Optional[str] = None):
+        """
+        Initialize handler.
+
+        Args:
+            writer: Shared writer
+            command: Default command/component name for records
+        """
+        super().__init__()
+        self.writer = writer
+        self.command = command
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            fields = {k: v for k, v in record.__dict__.items() if k not in _RECORD_ATTRS}
+            if record.exc_info:
+                fields['exc'] = logging.Formatter().formatException(record.exc_info)
+            command = fields.pop('command', None) or self.command
+            # The record's own time and logger name win over extra={'ts'|'logger': ...}
+            fields.pop('ts', None)
+            fields['logger'] = record.name
+
+            entry = make_record(
+                'WARN' if record.levelname == 'WARNING' else record.levelname,
+                record.getMessage(),
+                command,
+                ts=record.created,
+                **fields
+            )
+            self.writer.submit(entry)
+        except Exception:
+            self.handleError(record)
+
+
+def get_writer(log_dir: Optional[Path] = None) -> BatchingJSONLWriter:
+    """
+    Return the process-wide writer, creating it on first use.
+
+    Args:
+        log_dir: Log directory (defaults to default_log_dir())
+
+    Returns:
+        BatchingJSONLWriter: Shared writer, flushed at interpreter exit
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = BatchingJSONLWriter(Path(log_dir or default_log_dir()) / LOG_FILE_NAME)
+            atexit.register(_writer.close)
+        return _writer
+
+
+def configure(
+    command: Optional[str] = None,
+    level: int = logging.INFO,
+    log_dir: Optional[Path] = None,
+    logger: Optional[logging.Logger] = None
+) -> StructuredHandler:
+    """
+    Route stdlib logging into the structured JSONL stream.
+
+    Safe to call more than once; only one structured handler is attached.
+
+    Args:
+        command: Component name recorded on every record (e.g. 'fine_tuning.engine')
+        level: Minimum level forwarded
+        log_dir: Log directory (defaults to default_log_dir())
+        logger: Logger to attach to (defaults to the root logger)
+
+    Returns:
+        StructuredHandler: The attached handler
+    """
+    logger = logger or logging.getLogger()
+    for handler in logger.handlers:
+        if isinstance(handler, StructuredHandler):
+            return handler
+
+    handler = StructuredHandler(get_writer(log_dir), command)
+    handler.setLevel(level)
+    logger.addHandler(handler)
+    if logger.level == logging.NOTSET or logger.level > level:
+        logger.setLevel(level)
+    return handler
+
+
+def emit(level: str, command: Optional[str], message: str, **fields: Any) -> None:
+    """
+    Emit a structured record directly, bypassing stdlib logging.
+
+    Args:
+        level: Level name
+        command: Command or component name
+        message: Log message
+        **fields: Extra structured fields (latency_ms, request_id, ...)
+    """
+    get_writer().submit(make_record(level, message, command, **fields))
+
+
+@contextmanager
+def timed(command: Optional[str], message: str, level: str = 'INFO', **fields: Any) -> Iterator[Dict[str, Any]]:
+    """
+    Emit one record with latency_ms measured on the monotonic clock.
+
+    Args:
+        command: Command or component name
+        message: Log message
+        level: Level name
+        **fields: Extra structured fields
+
+    Yields:
+        Dict: Mutable fields dict; values added inside the block are logged
+            too, except latency_ms and status, which are always the measured ones
+
+    Raises:
+        ValueError: If fields include latency_ms or status
+    """
+    reserved = sorted({'latency_ms', 'status'} & fields.keys())
+    if reserved:
+        raise ValueError(f"timed() records {', '.join(reserved)} itself")
+
+    start = time.monotonic_ns()
+    status = 'ok'
+    try:
+        yield fields
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        emit(level, command, message, **{**fields, 'latency_ms': (time.monotonic_ns() - start) / 1e6, 'status': status})
+
+
+def read_records(path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Stream records from a JSONL log file, skipping partial or corrupt lines.
+
+    Args:
+        path: JSONL file
+
+    Yields:
+        Dict: Log records
+    """
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def format_text(record: Dict[str, Any]) -> str:
+    """
+    Render a record in the legacy '[TIME] [LEVEL] [COMMAND] MESSAGE' format.
+
+    Args:
+        record: Log record
+
+    Returns:
+        str: One text line
+    """
+    line = f"[{record.get('time', '')}] [{record.get('level', '')}] [{record.get('command') or '-'}] {record.get('message', '')}"
+    if record.get('latency_ms') is not None:
+        line += f" ({record['latency_ms']:.1f} ms)"
+    return line
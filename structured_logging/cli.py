@@ -0,0 +1,263 @@
+"""
+Structured Logging CLI
+
+Shim that lets the shell wrappers write into the structured JSONL stream.
+
+logging-system.sh starts one long-lived `ingest` process per shell session
+and writes tab-separated lines to it, so emitting a log line costs a
+printf instead of forking `date` and appending to two files:
+
+    LEVEL<TAB>COMMAND<TAB>MESSAGE[<TAB>EPOCH_SECONDS[<TAB>LATENCY_MS]]
+
+Queries (cat, stats, sessions) are answered from the incremental SQLite
+index in index.py.
+
+Usage:
+    python -m structured_logging.cli ingest < lines.tsv
+    python -m structured_logging.cli emit INFO my-command "Command started" --latency-ms 12.5
+    python -m structured_logging.cli cat --level ERROR --tail 20
+    python -m structured_logging.cli cat --from 2024-01-01 --to 2024-01-31 --grep timeout
+    python -m structured_logging.cli stats
+    tail -f ~/.claude/logs/subagent-commands.jsonl | python -m structured_logging.cli render
+    python -m structured_logging.cli sessions
+    python -m structured_logging.cli export --from 2024-01-01 --to 2024-01-07 > week.txt
+    python -m structured_logging.cli rotate
+    python -m structured_logging.cli clean --days 30
+"""
+
+import argparse
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from .backend import (
+    LOG_DIR_ENV,
+    default_log_dir,
+    emit,
+    format_text,
+    get_writer,
+    make_record,
+)
+
+
+def _parse_line(line: str) -> Optional[Dict[str, Any]]:
+    """Parse one ingest line into a record (None for blank lines)."""
+    line = line.rstrip('\n')
+    if not line.strip():
+        return None
+
+    parts = line.split('\t', 4)
+    if len(parts) < 3:
+        return make_record('INFO', line)
+
+    level, command, message = parts[:3]
+    ts = latency_ms = None
+    try:
+        if len(parts) > 3 and parts[3]:
+            ts = float(parts[3])
+        if len(parts) > 4 and parts[4]:
+            latency_ms = float(parts[4])
+    except ValueError:
+        pass
+
+    return make_record(level or 'INFO', message, command or None, ts=ts, latency_ms=latency_ms)
+
+
+def ingest(stream) -> int:
+    """Forward tab-separated lines from a stream until EOF."""
+    writer = get_writer()
+    for line in stream:
+        record = _parse_line(line)
+        if record is not None:
+            writer.submit(record)
+    writer.close()
+    return 0
+
+
+def _open_index(args: argparse.Namespace):
+    """Open the log index and ingest anything appended since the last query."""
+    from .index import LogIndex
+
+    index = LogIndex(args.log_dir)
+    index.refresh()
+    return index
+
+
+def cat(args: argparse.Namespace) -> int:
+    """Print matching records, answered from the SQLite index."""
+    with _open_index(args) as index:
+        records = index.query(
+            level=args.level,
+            command=args.command,
+            session_id=args.session,
+            date_from=args.date_from or args.date,
+            date_to=args.date_to or args.date,
+            text=args.grep,
+            limit=args.tail,
+            tail=bool(args.tail)
+        )
+        for record in records:
+            print(json.dumps(record, ensure_ascii=False) if args.json else format_text(record))
+    return 0
+
+
+def stats(args: argparse.Namespace) -> int:
+    """Print usage statistics."""
+    with _open_index(args) as index:
+        result = index.stats(top=args.top)
+
+    if args.json:
+        print(json.dumps(result, indent=2))
+        return 0
+
+    print('Commands executed:')
+    for row in result['commands']:
+        latency = f"  avg {row['avg_latency_ms'] / 1000:.1f}s" if row['avg_latency_ms'] is not None else ''
+        print(f"{row['runs']:7d} {row['command']}{latency}")
+    print('')
+    print('Summary:')
+    print('--------')
+    print(f"Total commands: {result['total_commands']}")
+    print(f"Total errors: {result['total_errors']}")
+    print(f"Total warnings: {result['total_warnings']}")
+    day = result['most_active_day']
+    print(f"Most active day: {day['day']} ({day['runs']} commands)" if day else 'Most active day: -')
+    return 0
+
+
+def export(args: argparse.Namespace) -> int:
+    """Stream records in a time range straight from the segments and active log."""
+    from .index import _day_bounds
+    from .rotation import iter_records
+
+    start, end = _day_bounds(args.date_from, args.date_to)
+    for record in iter_records(args.log_dir or default_log_dir(), start, end):
+        print(json.dumps(record, ensure_ascii=False) if args.json else format_text(record))
+    return 0
+
+
+def rotate(args: argparse.Namespace) -> int:
+    """Rotate the active log now and apply retention."""
+    from .rotation import enforce_retention, rotate as rotate_log
+
+    log_dir = args.log_dir or default_log_dir()
+    segment = rotate_log(log_dir, force=True)
+    removed = enforce_retention(log_dir, max_age_days=args.days)
+    print(json.dumps({'rotated': segment, **removed}, indent=2))
+    return 0
+
+
+def clean(args: argparse.Namespace) -> int:
+    """Apply retention without rotating."""
+    from .rotation import enforce_retention
+
+    removed = enforce_retention(args.log_dir or default_log_dir(), max_age_days=args.days)
+    print(f"Removed {removed['segments_removed']} segments and {removed['outputs_removed']} output logs")
+    return 0
+
+
+def render(stream) -> int:
+    """Render JSONL records from a stream as text lines."""
+    for line in stream:
+        try:
+            print(format_text(json.loads(line)), flush=True)
+        except ValueError:
+            continue
+    return 0
+
+
+def sessions(args: argparse.Namespace) -> int:
+    """List sessions, most recent first."""
+    with _open_index(args) as index:
+        rows = index.sessions(args.limit)
+
+    for row in rows:
+        first = datetime.fromtimestamp(row['first_ts']).strftime('%Y-%m-%d %H:%M:%S')
+        last = datetime.fromtimestamp(row['last_ts']).strftime('%Y-%m-%d %H:%M:%S')
+        print(f"{row['session_id']}  {first} -> {last}  ({row['records']} records)")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Command-line entry point."""
+    parser = argparse.ArgumentParser(description='Structured logging shim for the shell wrappers')
+    parser.add_argument('--log-dir', help='Log directory (default: $CLAUDE_LOG_DIR or ~/.claude/logs)')
+    subparsers = parser.add_subparsers(dest='action', required=True)
+
+    subparsers.add_parser('ingest', help='Read tab-separated log lines from stdin')
+
+    emit_parser = subparsers.add_parser('emit', help='Emit a single record')
+    emit_parser.add_argument('level')
+    emit_parser.add_argument('log_command')
+    emit_parser.add_argument('message')
+    emit_parser.add_argument('--latency-ms', type=float)
+    emit_parser.add_argument('--request-id')
+
+    cat_parser = subparsers.add_parser('cat', help='Print records as text')
+    cat_parser.add_argument('--session')
+    cat_parser.add_argument('--level')
+    cat_parser.add_argument('--command')
+    cat_parser.add_argument('--date', help='Single day (YYYY-MM-DD)')
+    cat_parser.add_argument('--from', dest='date_from', help="Start (YYYY-MM-DD or 'YYYY-MM-DD HH:MM[:SS]')")
+    cat_parser.add_argument('--to', dest='date_to', help='End, inclusive (same formats)')
+    cat_parser.add_argument('--grep', help='Case-insensitive substring')
+    cat_parser.add_argument('--tail', type=int, help='Only the last N matches')
+    cat_parser.add_argument('--json', action='store_true', help='Print raw JSONL')
+
+    export_parser = subparsers.add_parser('export', help='Stream records from compressed segments')
+    export_parser.add_argument('--from', dest='date_from')
+    export_parser.add_argument('--to', dest='date_to')
+    export_parser.add_argument('--json', action='store_true')
+
+    rotate_parser = subparsers.add_parser('rotate', help='Rotate the active log and apply retention')
+    rotate_parser.add_argument('--days', type=float, help='Also delete segments/outputs older than N days')
+
+    clean_parser = subparsers.add_parser('clean', help='Delete segments/outputs beyond the retention limits')
+    clean_parser.add_argument('--days', type=float, help='Also delete anything older than N days')
+
+    stats_parser = subparsers.add_parser('stats', help='Usage statistics')
+    stats_parser.add_argument('--top', type=int, default=10)
+    stats_parser.add_argument('--json', action='store_true')
+
+    subparsers.add_parser('render', help='Render JSONL from stdin as text')
+
+    sessions_parser = subparsers.add_parser('sessions', help='List sessions')
+    sessions_parser.add_argument('--limit', type=int, default=20)
+
+    args = parser.parse_args(argv)
+    if args.log_dir:
+        os.environ[LOG_DIR_ENV] = args.log_dir
+
+    try:
+        if args.action == 'ingest':
+            return ingest(sys.stdin)
+        if args.action == 'emit':
+            emit(args.level, args.log_command, args.message,
+                 latency_ms=args.latency_ms, request_id=args.request_id)
+            get_writer().close()
+            return 0
+        if args.action == 'cat':
+            return cat(args)
+        if args.action == 'export':
+            return export(args)
+        if args.action == 'rotate':
+            return rotate(args)
+        if args.action == 'clean':
+            return clean(args)
+        if args.action == 'stats':
+            return stats(args)
+        if args.action == 'render':
+            return render(sys.stdin)
+        return sessions(args)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # Output piped into head/less that exited early
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,537 @@
+"""
+Structured Log Index
+
+Incrementally ingests subagent-commands.jsonl into a SQLite database so the
+log viewer can answer stats, error listings, date ranges and full-text
+searches without rescanning the whole log:
+- records table keyed by timestamp, level, command and session (B-tree
+  indexes for each filter)
+- FTS5 table over message and command (trigram tokenizer where available,
+  so searches are case-insensitive substring matches like `grep -i`)
+- per-file byte offsets, so each refresh only reads bytes appended since
+  the last one; rotated segments (see rotation.py) keep the rows already
+  indexed from them, and rows from segments deleted by retention are dropped
+
+Rows hold the filter columns plus the source file, byte offset and length
+of each record, not the record itself, so the index stays small next to the
+compressed segments. query() reads the matching records back from the log
+and segments.
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
+from .backend import LOG_FILE_NAME, default_log_dir
+
+INDEX_NAME = 'index.sqlite'
+
+# Bump when the schema changes; older indexes are rebuilt from the log
+SCHEMA_VERSION = 2
+
+# Rows buffered per executemany insert while ingesting
+INGEST_BATCH = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    ts REAL,
+    day TEXT,
+    level TEXT,
+    command TEXT,
+    session_id TEXT,
+    request_id TEXT,
+    kind TEXT,
+    latency_ms REAL,
+    message TEXT,
+    line_offset INTEGER,
+    line_length INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS records_ts ON records (ts);
+CREATE INDEX IF NOT EXISTS records_level ON records (level, ts);
+CREATE INDEX IF NOT EXISTS records_command ON records (command, ts);
+CREATE INDEX IF NOT EXISTS records_session ON records (session_id, ts);
+CREATE INDEX IF NOT EXISTS records_kind ON records (kind, command);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    inode INTEGER,
+    offset INTEGER
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def _record_kind(message: str) -> Optional[str]:
+    """Classify lifecycle records used by the statistics queries."""
+    if message.startswith('Command started'):
+        return 'start'
+    if message.startswith('Command completed'):
+        return 'complete'
+    return None
+
+
+def _day_bounds(date_from: Optional[str], date_to: Optional[str]) -> Tuple[Optional[float], Optional[float]]:
+    """Convert inclusive YYYY-MM-DD[ HH:MM:SS] bounds to epoch seconds."""
+    def parse(value: str, end: bool) -> float:
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+            try:
+                parsed = datetime.strptime(value, fmt)
+            except ValueError:
+                continue
+            seconds = parsed.timestamp()
+            if end:
+                seconds += 86400 if fmt == '%Y-%m-%d' else (60 if fmt == '%Y-%m-%d %H:%M' else 1)
+            return seconds
+        raise ValueError(f"Invalid date '{value}'. Use YYYY-MM-DD or 'YYYY-MM-DD HH:MM[:SS]'")
+
+    return (
+        parse(date_from, False) if date_from else None,
+        parse(date_to, True) if date_to else None,
+    )
+
+
+class LogIndex:
+    """
+    SQLite index over the structured JSONL log.
+    """
+
+    def __init__(self, log_dir: Optional[Path] = None, db_path: Optional[Path] = None):
+        """
+        Open (creating if needed) the index.
+
+        Args:
+            log_dir: Log directory (defaults to default_log_dir())
+            db_path: Index database (defaults to <log_dir>/index.sqlite)
+        """
+        self.log_dir = Path(log_dir or default_log_dir())
+        self.log_path = self.log_dir / LOG_FILE_NAME
+        self.db_path = Path(db_path or self.log_dir / INDEX_NAME)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self._init_schema()
+
+    def close(self) -> None:
+        """Close the database connection."""
+        self.conn.close()
+
+    def __enter__(self) -> 'LogIndex':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    def _init_schema(self) -> None:
+        """Create tables, rebuilding the index if the schema version changed."""
+        self.conn.executescript(_SCHEMA)
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is not None and int(row['value']) != SCHEMA_VERSION:
+            self.conn.executescript(
+                'DROP TABLE IF EXISTS records; DROP TABLE IF EXISTS records_fts; '
+                'DROP TABLE IF EXISTS sources; DROP TABLE IF EXISTS meta;'
+            )
+            self.conn.executescript(_SCHEMA)
+
+        self.fts = self._init_fts()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (str(SCHEMA_VERSION),)
+        )
+
+    def _init_fts(self) -> Optional[str]:
+        """Create the FTS table; returns its tokenizer, or None without FTS5."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'fts_tokenizer'").fetchone()
+        if row is not None:
+            return row['value'] or None
+
+        tokenizer = None
+        for candidate in ('trigram', 'unicode61'):
+            try:
+                self.conn.execute(
+                    'CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5('
+                    f"message, command, content='records', content_rowid='id', tokenize='{candidate}')"
+                )
+                tokenizer = candidate
+                break
+            except sqlite3.OperationalError:
+                continue
+
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('fts_tokenizer', ?)",
+            (tokenizer or '',)
+        )
+        return tokenizer
+
+    def refresh(self) -> int:
+        """
+        Ingest log data added since the last refresh.
+
+        Newly rotated segments are adopted: rows already indexed from the
+        active file they used to be are relabelled to the segment and only
+        the remainder is read (stream-decompressed). Rows from segments that
+        retention has deleted are dropped.
+
+        Returns:
+            int: Number of records added
+        """
+        from .rotation import load_segments, segment_path, iter_segment_lines
+
+        added = 0
+        active = str(self.log_path)
+
+        # IMMEDIATE takes the write lock up front so concurrent viewers never ingest the same bytes twice
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            known = {row['path']: row for row in self.conn.execute('SELECT path, inode, offset FROM sources')}
+            live = {active}
+
+            for segment in load_segments(self.log_dir):
+                path = str(segment_path(self.log_dir, segment))
+                live.add(path)
+                if path in known or not os.path.exists(path):
+                    continue
+
+                offset = 0
+                previous = known.get(active)
+                if previous is not None and previous['inode'] == segment.get('inode'):
+                    # This segment is the file we were indexing as the active log
+                    self.conn.execute('UPDATE records SET source = ? WHERE source = ?', (path, active))
+                    self.conn.execute('DELETE FROM sources WHERE path = ?', (active,))
+                    del known[active]
+                    offset = previous['offset']
+
+                count, end = self._ingest_lines(path, iter_segment_lines(path), offset, partial_ok=False)
+                added += count
+                self._set_source(path, 0, end)
+
+            for path in set(known) - live:
+                self._delete_source_records(path)
+                self.conn.execute('DELETE FROM sources WHERE path = ?', (path,))
+
+            if self.log_path.exists():
+                stat = self.log_path.stat()
+                row = known.get(active)
+                offset = 0
+                if row is not None and row['inode'] == stat.st_ino and row['offset'] <= stat.st_size:
+                    offset = row['offset']
+                elif row is not None:
+                    # Truncated or replaced without rotation: drop what was indexed from the old file
+                    self._delete_source_records(active)
+
+                with open(self.log_path, 'rb') as f:
+                    f.seek(offset)
+                    count, end = self._ingest_lines(active, f, 0, base_offset=offset)
+                added += count
+                self._set_source(active, stat.st_ino, offset + end)
+
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+
+        return added
+
+    def _ingest_lines(
+        self,
+        source: str,
+        lines: Iterable[bytes],
+        skip_bytes: int,
+        partial_ok: bool = True,
+        base_offset: int = 0
+    ) -> Tuple[int, int]:
+        """
+        Insert records from a line stream.
+
+        Args:
+            source: Source path recorded on each row
+            lines: Byte lines
+            skip_bytes: Leading bytes already indexed
+            partial_ok: Stop at an unterminated last line (it is still being written)
+            base_offset: File offset of the first line (when the stream was seeked)
+
+        Returns:
+            Tuple[int, int]: Records added and bytes consumed (including skipped)
+        """
+        added = 0
+        position = 0
+        batch = []
+        for line in lines:
+            if position < skip_bytes:
+                position += len(line)
+                continue
+            if partial_ok and not line.endswith(b'\n'):
+                break
+            values = self._row_values(line, source, base_offset + position)
+            position += len(line)
+            if values is not None:
+                batch.append(values)
+            if len(batch) >= INGEST_BATCH:
+                added += self._insert(batch)
+                batch = []
+        added += self._insert(batch)
+        return added, position
+
+    def _set_source(self, path: str, inode: int, offset: int) -> None:
+        """Record how far a source has been ingested."""
+        self.conn.execute(
+            'INSERT OR REPLACE INTO sources (path, inode, offset) VALUES (?, ?, ?)',
+            (path, inode, offset)
+        )
+
+    def _delete_source_records(self, source: str) -> None:
+        """Remove records that came from a source file (and their FTS rows)."""
+        if self.fts:
+            self.conn.execute(
+                "INSERT INTO records_fts (records_fts, rowid, message, command) "
+                "SELECT 'delete', id, message, command FROM records WHERE source = ?",
+                (source,)
+            )
+        self.conn.execute('DELETE FROM records WHERE source = ?', (source,))
+
+    @staticmethod
+    def _row_values(line: bytes, source: str, offset: int) -> Optional[tuple]:
+        """Column values for one JSONL line at a file offset (None if it is not a valid record)."""
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+
+        ts = record.get('ts')
+        if not isinstance(ts, (int, float)):
+            try:
+                ts = datetime.strptime(str(record.get('time')), '%Y-%m-%d %H:%M:%S').timestamp()
+            except ValueError:
+                ts = 0.0
+
+        message = str(record.get('message', ''))
+        latency = record.get('latency_ms')
+        return (
+            ts,
+            str(record.get('time', ''))[:10],
+            record.get('level'),
+            record.get('command'),
+            record.get('session_id'),
+            record.get('request_id'),
+            _record_kind(message),
+            latency if isinstance(latency, (int, float)) else None,
+            message,
+            offset,
+            len(line.rstrip(b'\n')),
+            source,
+        )
+
+    def _insert(self, batch: List[tuple]) -> int:
+        """Insert rows with one executemany, then their FTS entries with one INSERT ... SELECT."""
+        if not batch:
+            return 0
+        # New ids are always above the current maximum (id is INTEGER PRIMARY KEY)
+        last_id = self.conn.execute('SELECT COALESCE(MAX(id), 0) FROM records').fetchone()[0]
+        self.conn.executemany(
+            'INSERT INTO records (ts, day, level, command, session_id, request_id, kind, '
+            'latency_ms, message, line_offset, line_length, source) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            batch
+        )
+        if self.fts:
+            self.conn.execute(
+                'INSERT INTO records_fts (rowid, message, command) '
+                'SELECT id, message, command FROM records WHERE id > ?',
+                (last_id,)
+            )
+        return len(batch)
+
+    def query(
+        self,
+        level: Optional[str] = None,
+        command: Optional[str] = None,
+        session_id: Optional[str] = None,
+        date_from: Optional[str] = None,
+        date_to: Optional[str] = None,
+        text: Optional[str] = None,
+        limit: Optional[int] = None,
+        tail: bool = False
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Find records matching all given filters, in time order.
+
+        Args:
+            level: Exact level (e.g. 'ERROR')
+            command: Exact command name
+            session_id: Exact session ID
+            date_from: Inclusive start (YYYY-MM-DD or 'YYYY-MM-DD HH:MM[:SS]')
+            date_to: Inclusive end (same formats)
+            text: Case-insensitive substring of message or command
+            limit: Maximum number of records
+            tail: With limit, return the last matches instead of the first
+
+        Yields:
+            Dict: Original log records
+        """
+        clauses = []
+        params: List[Any] = []
+
+        for column, value in (('level', level), ('command', command), ('session_id', session_id)):
+            if value is not None:
+                clauses.append(f'r.{column} = ?')
+                params.append(value)
+
+        start, end = _day_bounds(date_from, date_to)
+        if start is not None:
+            clauses.append('r.ts >= ?')
+            params.append(start)
+        if end is not None:
+            clauses.append('r.ts < ?')
+            params.append(end)
+
+        join = ''
+        if text:
+            if (self.fts == 'trigram' and len(text) >= 3) or (self.fts == 'unicode61' and text.strip()):
+                join = 'JOIN records_fts f ON f.rowid = r.id'
+                clauses.append('records_fts MATCH ?')
+                params.append('"' + text.replace('"', '""') + '"')
+            else:
+                clauses.append("(r.message LIKE ? ESCAPE '\\' OR r.command LIKE ? ESCAPE '\\')")
+                pattern = '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+                params.extend([pattern, pattern])
+
+        where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+        order = 'DESC' if tail else 'ASC'
+        sql = (f'SELECT r.source, r.line_offset, r.line_length, r.message FROM records r {join} {where} '
+               f'ORDER BY r.ts {order}, r.id {order}')
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        for attempt in range(2):
+            rows = self.conn.execute(sql, params).fetchall()
+            if tail:
+                rows.reverse()
+            records = self._read_records(rows)
+            if attempt == 0 and None in records:
+                # The active log was rotated since it was indexed; adopt the segment and retry
+                self.refresh()
+                continue
+            break
+
+        for record in records:
+            if record is not None:
+                yield record
+
+    @staticmethod
+    def _read_records(rows: List[sqlite3.Row]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Read indexed records back from their source files.
+
+        Each source is opened once and read in offset order; compressed
+        segments are decompressed forward only as far as the last match.
+
+        Args:
+            rows: Rows with source, line_offset, line_length and message
+
+        Returns:
+            List: Records in row order; None where the bytes at the offset
+                are gone or no longer hold the indexed record
+        """
+        from .rotation import open_segment
+
+        records: List[Optional[Dict[str, Any]]] = [None] * len(rows)
+        by_source: Dict[str, List[int]] = {}
+        for i, row in enumerate(rows):
+            by_source.setdefault(row['source'], []).append(i)
+
+        for source, positions in by_source.items():
+            positions.sort(key=lambda i: rows[i]['line_offset'])
+            try:
+                handle = open_segment(source)
+            except OSError:
+                continue
+
+            compressed = source.endswith(('.gz', '.zst'))
+            with handle:
+                position = 0
+                for i in positions:
+                    offset, length = rows[i]['line_offset'], rows[i]['line_length']
+                    if compressed:
+                        while position < offset:
+                            skipped = handle.read(min(offset - position, 1 << 20))
+                            if not skipped:
+                                break
+                            position += len(skipped)
+                    else:
+                        handle.seek(offset)
+                    data = handle.read(length)
+                    position = offset + len(data)
+
+                    try:
+                        record = json.loads(data)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and str(record.get('message', '')) == rows[i]['message']:
+                        records[i] = record
+
+        return records
+
+    def stats(self, top: int = 10) -> Dict[str, Any]:
+        """
+        Usage statistics.
+
+        Args:
+            top: Number of commands to list
+
+        Returns:
+            Dict: commands (name, runs, avg/max latency), totals, most_active_day
+        """
+        commands = [
+            dict(row) for row in self.conn.execute(
+                "SELECT s.command, s.runs, c.avg_latency_ms, c.max_latency_ms FROM "
+                "(SELECT command, COUNT(*) AS runs FROM records WHERE kind = 'start' GROUP BY command) s "
+                "LEFT JOIN (SELECT command, AVG(latency_ms) AS avg_latency_ms, MAX(latency_ms) AS max_latency_ms "
+                "FROM records WHERE kind = 'complete' GROUP BY command) c ON c.command = s.command "
+                "ORDER BY s.runs DESC LIMIT ?",
+                (top,)
+            )
+        ]
+        count = lambda sql, *params: self.conn.execute(sql, params).fetchone()[0]
+        day = self.conn.execute(
+            "SELECT day, COUNT(*) AS runs FROM records WHERE kind = 'start' "
+            "GROUP BY day ORDER BY runs DESC LIMIT 1"
+        ).fetchone()
+
+        return {
+            'commands': commands,
+            'total_commands': count("SELECT COUNT(*) FROM records WHERE kind = 'start'"),
+            'total_errors': count('SELECT COUNT(*) FROM records WHERE level = ?', 'ERROR'),
+            'total_warnings': count('SELECT COUNT(*) FROM records WHERE level = ?', 'WARN'),
+            'total_records': count('SELECT COUNT(*) FROM records'),
+            'most_active_day': dict(day) if day else None,
+        }
+
+    def sessions(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """
+        Most recent sessions.
+
+        Args:
+            limit: Maximum number of sessions
+
+        Returns:
+            List[Dict]: session_id, first/last timestamps and record count
+        """
+        return [
+            dict(row) for row in self.conn.execute(
+                'SELECT session_id, MIN(ts) AS first_ts, MAX(ts) AS last_ts, COUNT(*) AS records '
+                'FROM records WHERE session_id IS NOT NULL GROUP BY session_id '
+                'ORDER BY last_ts DESC LIMIT ?',
+                (limit,)
+            )
+        ]
@@ -0,0 +1,433 @@
+"""
+Log Rotation and Retention
+
+The active subagent-commands.jsonl is rotated once it reaches a size limit:
+it is renamed aside (under an exclusive lock, so no writer is mid-append)
+and stream-compressed into segments/subagent-commands-<seq>.jsonl.gz|.zst.
+segments/index.json records each segment's time range, record count and
+sizes, so readers can open only the segments overlapping a time range.
+
+Retention keeps at most max_segments segments and max_output_files
+per-command output logs, and can additionally drop anything older than a
+number of days (log-viewer.sh --clean).
+
+Settings come from the environment:
+- CLAUDE_LOG_MAX_BYTES: rotate the active log past this size (default 16 MiB)
+- CLAUDE_LOG_MAX_SEGMENTS: compressed segments to keep (default 50)
+- CLAUDE_LOG_COMPRESSION: 'gzip' (default) or 'zstd'
+- CLAUDE_LOG_MAX_OUTPUTS: per-command output logs to keep (default 200)
+"""
+
+import gzip
+import io
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None
+
+from .backend import LOG_FILE_NAME
+
+SEGMENT_DIR = 'segments'
+SEGMENT_INDEX = 'index.json'
+OUTPUT_DIR = 'outputs'
+LOCK_NAME = '.rotate.lock'
+
+SEGMENT_PREFIX = LOG_FILE_NAME.rsplit('.', 1)[0]
+COMPRESSION_SUFFIXES = {
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+
+_STAGING_PREFIX = '.staging-'
+
+
+def rotation_settings() -> Dict[str, Any]:
+    """
+    Read rotation settings from the environment.
+
+    Returns:
+        Dict: max_bytes, max_segments, compression and max_output_files
+    """
+    compression = os.environ.get('CLAUDE_LOG_COMPRESSION', 'gzip')
+    if compression not in COMPRESSION_SUFFIXES:
+        raise ValueError(f"Unknown log compression '{compression}'. Must be one of {sorted(COMPRESSION_SUFFIXES)}")
+
+    return {
+        'max_bytes': int(os.environ.get('CLAUDE_LOG_MAX_BYTES', 16 * 1024 * 1024)),
+        'max_segments': int(os.environ.get('CLAUDE_LOG_MAX_SEGMENTS', 50)),
+        'compression': compression,
+        'max_output_files': int(os.environ.get('CLAUDE_LOG_MAX_OUTPUTS', 200)),
+    }
+
+
+@contextmanager
+def rotation_lock(log_dir: Path, exclusive: bool = False) -> Iterator[None]:
+    """
+    Hold the log directory's rotation lock.
+
+    Writers take it shared around each append; rotation takes it exclusive
+    around the rename, so a rotated file never receives a late write.
+
+    Args:
+        log_dir: Log directory
+        exclusive: Exclusive (rotation) rather than shared (append) lock
+    """
+    if fcntl is None:
+        yield
+        return
+
+    log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    with open(log_dir / LOCK_NAME, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def load_segments(log_dir: Path) -> List[Dict[str, Any]]:
+    """
+    Load the segment index, oldest segment first.
+
+    Args:
+        log_dir: Log directory
+
+    Returns:
+        List[Dict]: Segment entries (seq, file, first_ts, last_ts, records,
+            bytes, compressed_bytes, inode)
+    """
+    return sorted(_read_index(log_dir)['segments'], key=lambda s: s['seq'])
+
+
+def _read_index(log_dir: Path) -> Dict[str, Any]:
+    """Read segments/index.json, tolerating a missing or corrupt file."""
+    path = Path(log_dir) / SEGMENT_DIR / SEGMENT_INDEX
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        data = {}
+    data.setdefault('segments', [])
+    data.setdefault('last_seq', max((s['seq'] for s in data['segments']), default=0))
+    return data
+
+
+def _save_segments(log_dir: Path, segments: List[Dict[str, Any]]) -> None:
+    """Atomically write the segment index."""
+    segment_dir = Path(log_dir) / SEGMENT_DIR
+    segment_dir.mkdir(parents=True, exist_ok=True)
+
+    # Sequence numbers are never reused, even after every segment is pruned
+    last_seq = max([_read_index(log_dir)['last_seq']] + [s['seq'] for s in segments])
+
+    tmp_path = segment_dir / f'{SEGMENT_INDEX}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'last_seq': last_seq, 'segments': segments}, f, indent=2)
+    os.replace(tmp_path, segment_dir / SEGMENT_INDEX)
+
+
+def segment_path(log_dir: Path, segment: Dict[str, Any]) -> Path:
+    """Path of a segment file."""
+    return Path(log_dir) / SEGMENT_DIR / segment['file']
+
+
+def _open_compressed(path: Path, compression: str):
+    """Open a binary writer for a compressed segment."""
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=6)
+
+    try:
+        import zstandard
+    except ImportError as e:
+        raise ImportError("zstd log compression requires the 'zstandard' package: pip install zstandard") from e
+    return zstandard.ZstdCompressor(level=6).stream_writer(open(path, 'wb'), closefd=True)
+
+
+def open_segment(path: Path):
+    """
+    Open a segment (or plain JSONL file) for reading its uncompressed bytes.
+
+    A segment decompresses to exactly the bytes of the log file it was
+    rotated from, so offsets recorded against that file stay valid.
+
+    Args:
+        path: Segment path (.gz, .zst or plain)
+
+    Returns:
+        Binary file object
+    """
+    path = Path(path)
+    if path.name.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.name.endswith('.zst'):
+        import zstandard
+
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True))
+    return open(path, 'rb')
+
+
+def iter_segment_lines(path: Path) -> Iterator[bytes]:
+    """
+    Stream-decompress a segment (or read a plain JSONL file) line by line.
+
+    Args:
+        path: Segment path (.gz, .zst or plain)
+
+    Yields:
+        bytes: Lines including their trailing newline
+    """
+    with open_segment(path) as handle:
+        yield from handle
+
+
+def _compress_segment(staging: Path, target: Path, compression: str) -> Dict[str, Any]:
+    """Compress a staged log file, collecting its time range and record count."""
+    first_ts = last_ts = None
+    records = 0
+
+    tmp_target = target.with_name(target.name + '.tmp')
+    with open(staging, 'rb') as source, _open_compressed(tmp_target, compression) as sink:
+        for line in source:
+            sink.write(line)
+            try:
+                ts = json.loads(line).get('ts')
+            except (ValueError, AttributeError):
+                continue
+            if isinstance(ts, (int, float)):
+                first_ts = ts if first_ts is None else min(first_ts, ts)
+                last_ts = ts if last_ts is None else max(last_ts, ts)
+                records += 1
+    os.replace(tmp_target, target)
+
+    return {
+        'first_ts': first_ts,
+        'last_ts': last_ts,
+        'records': records,
+        'bytes': staging.stat().st_size,
+        'compressed_bytes': target.stat().st_size,
+    }
+
+
+def _next_seq(log_dir: Path) -> int:
+    """Next segment number, counting segments that are still being compressed."""
+    segment_dir = Path(log_dir) / SEGMENT_DIR
+    seqs = [_read_index(log_dir)['last_seq']]
+    if segment_dir.is_dir():
+        for path in segment_dir.glob(f'{_STAGING_PREFIX}*'):
+            try:
+                seqs.append(int(path.name[len(_STAGING_PREFIX):].split('-', 1)[0]))
+            except ValueError:
+                continue
+    return max(seqs, default=0) + 1
+
+
+def _finish_staged(log_dir: Path, staging: Path, settings: Dict[str, Any]) -> Dict[str, Any]:
+    """Compress one staged file into a segment and add it to the index."""
+    seq_text, inode_text = staging.name[len(_STAGING_PREFIX):].split('-', 1)
+    seq = int(seq_text)
+    name = f"{SEGMENT_PREFIX}-{seq:06d}{COMPRESSION_SUFFIXES[settings['compression']]}"
+
+    entry = _compress_segment(staging, Path(log_dir) / SEGMENT_DIR / name, settings['compression'])
+    entry.update({'seq': seq, 'file': name, 'inode': int(inode_text.split('.', 1)[0]),
+                  'rotated_at': time.time()})
+
+    with rotation_lock(log_dir, exclusive=True):
+        segments = [s for s in load_segments(log_dir) if s['seq'] != seq]
+        segments.append(entry)
+        _save_segments(log_dir, sorted(segments, key=lambda s: s['seq']))
+    staging.unlink()
+    return entry
+
+
+@contextmanager
+def _claim(staging: Path) -> Iterator[bool]:
+    """Lock a staged file so only one process compresses it (released on crash)."""
+    try:
+        handle = open(staging, 'rb')
+    except FileNotFoundError:
+        yield False
+        return
+
+    with handle:
+        if fcntl is not None:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                yield False
+                return
+        # Another process may have finished it between glob() and open()
+        yield staging.exists()
+
+
+def rotate(log_dir: Path, settings: Optional[Dict[str, Any]] = None, force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Rotate the active log into a compressed segment if it is over the size limit.
+
+    Args:
+        log_dir: Log directory
+        settings: Output of rotation_settings() (read from the environment if None)
+        force: Rotate any non-empty active log regardless of size
+
+    Returns:
+        Optional[Dict]: The new segment entry, or None if nothing was rotated
+    """
+    log_dir = Path(log_dir)
+    settings = settings or rotation_settings()
+    active = log_dir / LOG_FILE_NAME
+    segment_dir = log_dir / SEGMENT_DIR
+
+    with rotation_lock(log_dir, exclusive=True):
+        try:
+            stat = active.stat()
+        except FileNotFoundError:
+            stat = None
+
+        staging = None
+        if stat is not None and stat.st_size > 0 and (force or stat.st_size >= settings['max_bytes']):
+            segment_dir.mkdir(parents=True, exist_ok=True)
+            staging = segment_dir / f'{_STAGING_PREFIX}{_next_seq(log_dir)}-{stat.st_ino}.jsonl'
+            # Writers re-open the active path per batch, so the next batch starts a fresh file
+            os.replace(active, staging)
+
+    # Leftovers from an interrupted rotation are finished too
+    entry = None
+    if segment_dir.is_dir():
+        for pending in sorted(segment_dir.glob(f'{_STAGING_PREFIX}*.jsonl')):
+            with _claim(pending) as claimed:
+                if not claimed:
+                    continue
+                finished = _finish_staged(log_dir, pending, settings)
+            if pending == staging:
+                entry = finished
+
+    if entry is not None:
+        enforce_retention(log_dir, settings)
+    return entry
+
+
+def enforce_retention(
+    log_dir: Path,
+    settings: Optional[Dict[str, Any]] = None,
+    max_age_days: Optional[float] = None
+) -> Dict[str, int]:
+    """
+    Delete segments and per-command output logs beyond the count/age limits.
+
+    Args:
+        log_dir: Log directory
+        settings: Output of rotation_settings() (read from the environment if None)
+        max_age_days: Also delete anything whose newest record is older than this
+
+    Returns:
+        Dict: Number of segments and output files removed
+    """
+    log_dir = Path(log_dir)
+    settings = settings or rotation_settings()
+    cutoff = time.time() - max_age_days * 86400 if max_age_days is not None else None
+
+    with rotation_lock(log_dir, exclusive=True):
+        segments = load_segments(log_dir)
+        keep = segments[-settings['max_segments']:] if settings['max_segments'] > 0 else []
+        if cutoff is not None:
+            keep = [s for s in keep if (s.get('last_ts') or s.get('rotated_at', 0)) >= cutoff]
+
+        removed_segments = 0
+        for segment in segments:
+            if segment not in keep:
+                try:
+                    segment_path(log_dir, segment).unlink()
+                except FileNotFoundError:
+                    pass
+                removed_segments += 1
+        if removed_segments:
+            _save_segments(log_dir, keep)
+
+    outputs = sorted(
+        (path for path in (log_dir / OUTPUT_DIR).glob('*.log')),
+        key=lambda path: path.stat().st_mtime
+    ) if (log_dir / OUTPUT_DIR).is_dir() else []
+
+    stale = outputs[:max(0, len(outputs) - settings['max_output_files'])]
+    if cutoff is not None:
+        stale += [path for path in outputs if path not in stale and path.stat().st_mtime < cutoff]
+    for path in stale:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+    return {'segments_removed': removed_segments, 'outputs_removed': len(stale)}
+
+
+def iter_log_lines(
+    log_dir: Path,
+    start_ts: Optional[float] = None,
+    end_ts: Optional[float] = None
+) -> Iterator[bytes]:
+    """
+    Stream raw JSONL lines from the segments overlapping a time range, then the active log.
+
+    Segments whose [first_ts, last_ts] range lies outside [start_ts, end_ts)
+    are never opened. Lines are not filtered individually; callers that need
+    exact bounds check each record's ts.
+
+    Args:
+        log_dir: Log directory
+        start_ts: Inclusive lower bound (epoch seconds)
+        end_ts: Exclusive upper bound (epoch seconds)
+
+    Yields:
+        bytes: JSONL lines
+    """
+    log_dir = Path(log_dir)
+    for segment in load_segments(log_dir):
+        if start_ts is not None and segment.get('last_ts') is not None and segment['last_ts'] < start_ts:
+            continue
+        if end_ts is not None and segment.get('first_ts') is not None and segment['first_ts'] >= end_ts:
+            continue
+        path = segment_path(log_dir, segment)
+        if path.exists():
+            yield from iter_segment_lines(path)
+
+    active = log_dir / LOG_FILE_NAME
+    if active.exists():
+        yield from iter_segment_lines(active)
+
+
+def iter_records(
+    log_dir: Path,
+    start_ts: Optional[float] = None,
+    end_ts: Optional[float] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream parsed records within a time range across segments and the active log.
+
+    Args:
+        log_dir: Log directory
+        start_ts: Inclusive lower bound (epoch seconds)
+        end_ts: Exclusive upper bound (epoch seconds)
+
+    Yields:
+        Dict: Log records
+    """
+    for line in iter_log_lines(log_dir, start_ts, end_ts):
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        ts = record.get('ts')
+        if not isinstance(ts, (int, float)):
+            continue
+        if start_ts is not None and ts < start_ts:
+            continue
+        if end_ts is not None and ts >= end_ts:
+            continue
+        yield record